@@ -1,30 +1,71 @@
 # app.py
 
 import os
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response, stream_with_context
 import uuid
 import json
 import time
+import base64
+import queue
 import asyncio
-import concurrent.futures
+import threading
 import re
-import difflib
 import logging
+import functools
 
-from modules.pydantic_models import PYDANTIC_MODELS
+from modules.pydantic_models import PYDANTIC_MODELS, schema_prompt_fragment, get_type_adapter
 from pydantic import ValidationError
 
 from modules.storage import (
     save_project,
     load_project,
-    ensure_storage_dir
+    ensure_storage_dir,
+    delete_project,
+    project_exists,
+    list_project_summaries,
+    load_project_meta,
+    save_project_meta,
+    list_workflows,
+    load_workflow,
+    save_workflow,
+    delete_workflow,
+    load_evaluation,
+    save_evaluation,
+    list_evaluations as list_project_evaluations,
+    delete_evaluation as delete_project_evaluation,
+    append_run,
+    update_run,
+    load_results,
+    query_runs,
+    variable_set_positions,
+    run_sort_key,
+    RESULTS_PAGE_SIZE,
+    RESULTS_MAX_PAGE_SIZE,
+    migrate_embedded_results,
+    project_cache_stats,
+    get_project_version,
+    project_transaction,
+    VersionConflict
 )
 from modules.workflow_manager import WorkflowManager, WorkflowStep, StepCall, FunctionCall
-from modules.llm_interface import generate_llm_response
-from modules.evaluation import evaluate_outputs
+from modules.llm_interface import agenerate_llm_response, provider_for_model, preload_models, model_status
+from modules.llm_providers import ProviderError
+from modules.rate_limiter import (
+    PRIORITY_INTERACTIVE, PRIORITY_BULK, LLM_RETRY_BACKOFF_BASE, with_priority, backoff_delay, rate_limiter_stats
+)
+from modules.function_executor import FunctionExecutionError
+from modules.function_sandbox import run_function
+from modules.response_cache import acached_llm_response, ainvalidate_cached_response, get_response_cache
+from modules.scoring import score_output, compute_diff, preview_text
+from modules.results_export import EXPORT_FORMATS, ExportError, export_evaluation
+from modules.call_metrics import measure_call, summarize_calls, summarize_run
+from modules.evaluation_scheduler import EvaluationScheduler, plan_pending_runs, validate_scheduler_options
 from modules.project_manager import ProjectManager
+from modules.job_queue import JobQueue, FINISHED_STATUSES
 from modules.graph_generator import generate_mermaid
-from modules.evaluation import evaluate_outputs
+from modules.workflow_dag import build_workflow_dag, run_workflow_dag
+from modules.execution_runtime import get_runtime
+from modules.prompt_templates import render_prompt, template_variables
 
 from markupsafe import Markup
 
@@ -43,54 +84,21 @@ PROJECTS_DIR = "projects_data"  # New directory for projects
 def replace_double_braces(template, variables):
     """
     Replaces double curly braces {{ }} with the corresponding values from variables.
-    Now supports bracket/dict-based lookup, e.g. {{my_var['subfield']}}.
+    Supports bracket/dict-based lookup, e.g. {{my_var['subfield']}}. Templates are
+    compiled once and cached (see modules/prompt_templates.py).
     """
-
-    pattern = re.compile(r'{{\s*(.*?)\s*}}')
-
-    def replacer(match):
-        expr = match.group(1)
-        if re.match(r'^[A-Za-z0-9_]+$', expr):
-            # Simple variable
-            if expr in variables:
-                return str(variables[expr])
-            else:
-                raise KeyError(f"Variable '{expr}' not found.")
-        else:
-            # Attempt bracket/dict-based lookups
-            try:
-                import ast
-                base_var_name = expr.split("[", 1)[0].strip()
-                if base_var_name not in variables:
-                    raise KeyError(f"Base variable '{base_var_name}' not found.")
-
-                custom_var = variables[base_var_name]
-                bracket_expr = expr[len(base_var_name):].strip()
-
-                while bracket_expr.startswith("["):
-                    end_index = bracket_expr.find("]")
-                    if end_index == -1:
-                        raise ValueError("Mismatched brackets in expression: " + expr)
-                    key_str = bracket_expr[1:end_index].strip()
-                    bracket_expr = bracket_expr[end_index+1:].strip()
-                    key_str = key_str.strip("'\"")
-                    if isinstance(custom_var, dict):
-                        if key_str in custom_var:
-                            custom_var = custom_var[key_str]
-                        else:
-                            raise KeyError(f"{key_str} not found in variable '{base_var_name}'")
-                    else:
-                        raise TypeError(f"Variable '{base_var_name}' is not a dictionary; cannot index '{key_str}'")
-                return str(custom_var)
-
-            except Exception as e:
-                raise KeyError(f"Error accessing expression '{expr}': {str(e)}")
-
-    return pattern.sub(replacer, template)
+    return render_prompt(template, variables)
 
 
 ensure_storage_dir()
 
+# Background jobs for evaluations and workflow runs; handlers are registered further down.
+# Interactive workflow runs get workers of their own so they never queue behind evaluations.
+job_queue = JobQueue(
+    num_workers=int(os.getenv("JOB_WORKERS", "2")),
+    lanes={"interactive": int(os.getenv("INTERACTIVE_JOB_WORKERS", "2"))}
+)
+
 
 @app.template_filter('tojson_no_escape')
 def tojson_no_escape(value):
@@ -100,21 +108,54 @@ def tojson_no_escape(value):
     return Markup(json.dumps(value, ensure_ascii=False, indent=2))
 
 
+def expected_project_version():
+    """
+    The project version the client last saw, from an If-Match header or an
+    "expected_version" field in the JSON body. None means no check.
+    """
+    value = request.headers.get("If-Match")
+    if value is None:
+        body = request.get_json(silent=True)
+        value = body.get("expected_version") if isinstance(body, dict) else None
+    if value is None or value == "*":
+        return None
+    try:
+        return int(str(value).strip('"'))
+    except ValueError:
+        return None
+
+
+def project_write(route):
+    """
+    Runs a mutating project route under the project's write lock, so concurrent
+    requests (threads or worker processes) cannot interleave their read-modify-write.
+    Requests that send the version they last saw get a 409 if the project has
+    changed since. The new version is returned in the X-Project-Version header.
+    """
+    @functools.wraps(route)
+    def wrapper(*args, **kwargs):
+        project_id = kwargs["project_id"]
+        try:
+            with project_transaction(project_id, expected_project_version()):
+                response = app.make_response(route(*args, **kwargs))
+        except VersionConflict as e:
+            app.logger.warning(str(e))
+            return jsonify({"error": str(e), "current_version": e.current_version}), 409
+        version = get_project_version(project_id)
+        if version is not None:
+            response.headers["X-Project-Version"] = str(version)
+        return response
+    return wrapper
+
+
 # =====================================
 # PROJECT ROUTES
 # =====================================
 
 @app.route("/projects", methods=["GET"])
 def list_projects():
-    # List all project files from projects_data
-    project_files = os.listdir(PROJECTS_DIR)
-    projects_data = {}
-    for file in project_files:
-        if file.endswith(".json"):
-            project_id = file.replace(".json", "")
-            project = load_project(project_id)
-            if project:
-                projects_data[project_id] = project
+    # Only the summary index is read; project files are not parsed here
+    projects_data = {summary["project_id"]: summary for summary in list_project_summaries()}
     return render_template("projects_index.html", projects=projects_data)
 
 @app.route("/projects/create", methods=["POST"])
@@ -136,47 +177,44 @@ def create_project_route():
 
 @app.route("/projects/<project_id>", methods=["GET"])
 def get_project_route(project_id):
-    project_data = load_project(project_id)
-    if not project_data:
+    project_meta = load_project_meta(project_id)
+    if not project_meta:
         app.logger.error(f"Project not found: {project_id}")
         return "Project not found", 404
 
-    pm = ProjectManager.from_dict(project_data)
     workflows_data = {}
-    for wf in pm.workflows:
+    for wf in list_workflows(project_id):
         workflows_data[wf['workflow_id']] = wf
 
-    return render_template("project_detail.html", project=project_data, workflows=workflows_data)
+    return render_template("project_detail.html", project=project_meta, workflows=workflows_data)
 
 @app.route("/projects/<project_id>/edit", methods=["POST"])
+@project_write
 def edit_project(project_id):
     data = request.json
-    project_data = load_project(project_id)
-    if not project_data:
+    project_meta = load_project_meta(project_id)
+    if not project_meta:
         app.logger.error(f"Project not found: {project_id}")
         return jsonify({"error": "Project not found"}), 404
 
-    pm = ProjectManager.from_dict(project_data)
-    pm.name = data.get("name", pm.name)
-    pm.description = data.get("description", pm.description)
-    updated_dict = pm.to_dict()
-    save_project(project_id, updated_dict)
+    project_meta["name"] = data.get("name", project_meta["name"])
+    project_meta["description"] = data.get("description", project_meta["description"])
+    save_project_meta(project_id, project_meta)
+    updated_dict = load_project(project_id)
 
     app.logger.info(f"Edited project: {project_id}")
     return jsonify({"status": "project_edited", "project": updated_dict})
 
 @app.route("/projects/<project_id>/remove", methods=["POST"])
+@project_write
 def remove_project(project_id):
-    project_data = load_project(project_id)
-    if not project_data:
+    if not delete_project(project_id):
         app.logger.error(f"Project not found: {project_id}")
         return jsonify({"error": "Project not found"}), 404
+    # Job rows hold the project's prompts and outputs
+    job_queue.delete_project_jobs(project_id)
 
-    # Remove the project JSON
-    p_path = os.path.join(PROJECTS_DIR, f"{project_id}.json")
-    if os.path.exists(p_path):
-        os.remove(p_path)
-        app.logger.info(f"Deleted project file: {p_path}")
+    app.logger.info(f"Deleted project: {project_id}")
 
     return jsonify({"status": "project_removed"})
 
@@ -185,18 +223,16 @@ def remove_project(project_id):
 # =====================================
 
 @app.route("/projects/<project_id>/add_workflow", methods=["POST"])
+@project_write
 def add_workflow_to_project(project_id):
     data = request.json
     workflow_name = data.get("workflow_name", "Untitled Workflow")
     workflow_description = data.get("workflow_description", "")
 
-    project_data = load_project(project_id)
-    if not project_data:
+    if not project_exists(project_id):
         app.logger.error(f"Project not found: {project_id}")
         return jsonify({"error": "Project not found"}), 404
 
-    pm = ProjectManager.from_dict(project_data)
-
     new_wf_id = str(uuid.uuid4())
     new_workflow = {
         "workflow_id": new_wf_id,
@@ -205,63 +241,49 @@ def add_workflow_to_project(project_id):
         "steps": [],
         "variables": {}
     }
-    pm.add_workflow(new_workflow)
-
-    # Preserve other fields like 'evaluations'
-    project_data['workflows'] = pm.to_dict()['workflows']
-    save_project(project_id, project_data)
+    save_workflow(project_id, new_workflow)
 
     app.logger.info(f"Added new workflow '{workflow_name}' with ID: {new_wf_id} to project {project_id}.")
     return jsonify({"status": "workflow_added", "workflow_id": new_wf_id})
 
 
 @app.route("/projects/<project_id>/delete_workflow", methods=["POST"])
+@project_write
 def delete_workflow_under_project(project_id):
     data = request.json
     workflow_id = data.get("workflow_id")
 
-    project_data = load_project(project_id)
-    if not project_data:
+    if not project_exists(project_id):
         app.logger.error(f"Project not found: {project_id}")
         return jsonify({"error": "Project not found"}), 404
 
-    pm = ProjectManager.from_dict(project_data)
-    workflow_exists = any(wf['workflow_id'] == workflow_id for wf in pm.workflows)
-    if not workflow_exists:
+    if not delete_workflow(project_id, workflow_id):
         app.logger.error(f"Workflow '{workflow_id}' not found in project {project_id}.")
         return jsonify({"error": "Workflow not found in project"}), 404
 
-    pm.remove_workflow(workflow_id)
-
-    # Preserve other fields like 'evaluations'
-    project_data['workflows'] = pm.to_dict()['workflows']
-    save_project(project_id, project_data)
-
     app.logger.info(f"Removed workflow '{workflow_id}' from project {project_id}.")
     return jsonify({"status": "workflow_deleted"})
 
 
 @app.route("/projects/<project_id>/copy_workflow", methods=["POST"])
+@project_write
 def copy_workflow_under_project(project_id):
     data = request.json
     source_workflow_id = data.get("workflow_id")
 
-    project_data = load_project(project_id)
-    if not project_data:
+    if not project_exists(project_id):
         app.logger.error(f"Project not found: {project_id}")
         return jsonify({"error": "Project not found"}), 404
 
-    pm = ProjectManager.from_dict(project_data)
-    workflow_exists = any(wf['workflow_id'] == source_workflow_id for wf in pm.workflows)
-    if not workflow_exists:
+    source_workflow = load_workflow(project_id, source_workflow_id)
+    if not source_workflow:
         app.logger.error(f"Workflow '{source_workflow_id}' not found in project {project_id}.")
         return jsonify({"error": "Workflow not found in project"}), 404
 
+    pm = ProjectManager(project_id=project_id, workflows=[source_workflow])
     new_wf_id = pm.copy_workflow(source_workflow_id)
     if new_wf_id:
-        # Preserve other fields like 'evaluations'
-        project_data['workflows'] = pm.to_dict()['workflows']
-        save_project(project_id, project_data)
+        save_workflow(project_id, pm.workflows[-1])
 
         app.logger.info(f"Copied workflow '{source_workflow_id}' to new workflow '{new_wf_id}' in project {project_id}.")
         return jsonify({"status": "workflow_copied", "new_workflow_id": new_wf_id})
@@ -284,34 +306,31 @@ def home():
 
 @app.route("/projects/<project_id>/workflow/<workflow_id>", methods=["GET"])
 def get_workflow(project_id, workflow_id):
-    project_data = load_project(project_id)
-    if not project_data:
+    project_meta = load_project_meta(project_id)
+    if not project_meta:
         app.logger.error(f"Project not found: {project_id}")
         return "Project not found", 404
 
-    pm = ProjectManager.from_dict(project_data)
-    workflow = next((wf for wf in pm.workflows if wf['workflow_id'] == workflow_id), None)
+    workflow = load_workflow(project_id, workflow_id)
     if not workflow:
         app.logger.error(f"Workflow not found: {workflow_id} in project {project_id}")
         return "Workflow not found", 404
 
     # **Corrected Line: Pass the 'project' object to the template**
-    return render_template("workflow_detail.html", workflow=workflow, project_id=project_id, project=project_data)
+    return render_template("workflow_detail.html", workflow=workflow, project_id=project_id, project=project_meta)
 
 @app.route("/projects/<project_id>/workflow/create", methods=["POST"])
+@project_write
 def create_workflow_route(project_id):
     # Legacy route: Associate with a specific project
     data = request.json
     workflow_name = data.get("workflow_name", "Untitled Workflow")
     workflow_description = data.get("workflow_description", "")
     # Assuming the project exists; else, return error
-    project_data = load_project(project_id)
-    if not project_data:
+    if not project_exists(project_id):
         app.logger.error(f"Project not found: {project_id}")
         return jsonify({"error": "Project not found"}), 404
 
-    pm = ProjectManager.from_dict(project_data)
-
     new_wf_id = str(uuid.uuid4())
     new_workflow = {
         "workflow_id": new_wf_id,
@@ -320,17 +339,14 @@ def create_workflow_route(project_id):
         "steps": [],
         "variables": {}
     }
-    pm.add_workflow(new_workflow)
-
-    # Preserve other fields like 'evaluations'
-    project_data['workflows'] = pm.to_dict()['workflows']
-    save_project(project_id, project_data)
+    save_workflow(project_id, new_workflow)
 
     app.logger.info(f"Created new workflow: {workflow_name} with ID: {new_wf_id} under project {project_id}.")
     return jsonify({"status": "success", "workflow_id": new_wf_id})
 
 
 @app.route("/projects/<project_id>/workflow/<workflow_id>/add_step", methods=["POST"])
+@project_write
 def add_step_route(project_id, workflow_id):
     data = request.json
     if not data:
@@ -345,13 +361,11 @@ def add_step_route(project_id, workflow_id):
     if not isinstance(calls_data, list):
         return jsonify({"error": "'calls' must be a list of subcalls."}), 400
 
-    project_data = load_project(project_id)
-    if project_data is None:
+    if not project_exists(project_id):
         app.logger.error(f"Project not found: {project_id}")
         return jsonify({"error": "Project not found"}), 404
 
-    pm = ProjectManager.from_dict(project_data)
-    workflow = next((wf for wf in pm.workflows if wf['workflow_id'] == workflow_id), None)
+    workflow = load_workflow(project_id, workflow_id)
     if not workflow:
         app.logger.error(f"Workflow not found: {workflow_id} in project {project_id}")
         return jsonify({"error": "Workflow not found"}), 404
@@ -386,15 +400,7 @@ def add_step_route(project_id, workflow_id):
     manager.add_step(new_step)
     updated_workflow = manager.to_dict()
 
-    # Update the workflow in the project
-    for idx, wf in enumerate(pm.workflows):
-        if wf['workflow_id'] == workflow_id:
-            pm.workflows[idx] = updated_workflow
-            break
-
-    # Preserve other fields like 'evaluations'
-    project_data['workflows'] = pm.to_dict()['workflows']
-    save_project(project_id, project_data)
+    save_workflow(project_id, updated_workflow)
     workflows[workflow_id] = updated_workflow
 
     app.logger.info(f"Added step {new_step.step_id} to workflow {workflow_id} in project {project_id}")
@@ -402,6 +408,7 @@ def add_step_route(project_id, workflow_id):
 
 
 @app.route("/projects/<project_id>/workflow/<workflow_id>/edit_step", methods=["POST"])
+@project_write
 def edit_step_route(project_id, workflow_id):
     data = request.json
     step_id = data.get("step_id")
@@ -410,12 +417,10 @@ def edit_step_route(project_id, workflow_id):
     inputs = data.get("inputs")
     calls = data.get("calls")
 
-    project_data = load_project(project_id)
-    if not project_data:
+    if not project_exists(project_id):
         return jsonify({"status": "error", "error": "Project not found."}), 404
 
-    pm = ProjectManager.from_dict(project_data)
-    workflow = next((wf for wf in pm.workflows if wf['workflow_id'] == workflow_id), None)
+    workflow = load_workflow(project_id, workflow_id)
     if not workflow:
         return jsonify({"status": "error", "error": "Workflow not found."}), 404
 
@@ -436,15 +441,7 @@ def edit_step_route(project_id, workflow_id):
 
     updated_workflow = manager.to_dict()
 
-    # Update the workflow in the project
-    for idx, wf in enumerate(pm.workflows):
-        if wf['workflow_id'] == workflow_id:
-            pm.workflows[idx] = updated_workflow
-            break
-
-    # Preserve other fields like 'evaluations'
-    project_data['workflows'] = pm.to_dict()['workflows']
-    save_project(project_id, project_data)
+    save_workflow(project_id, updated_workflow)
     workflows[workflow_id] = updated_workflow
 
     app.logger.info(f"Edited step {step_id} in workflow {workflow_id} of project {project_id}")
@@ -452,6 +449,7 @@ def edit_step_route(project_id, workflow_id):
 
 
 @app.route("/projects/<project_id>/workflow/<workflow_id>/remove_step", methods=["POST"])
+@project_write
 def remove_step_route(project_id, workflow_id):
     data = request.json
     step_id = data.get("step_id")
@@ -461,13 +459,11 @@ def remove_step_route(project_id, workflow_id):
         return jsonify({"error": "No step_id provided"}), 400
     
     # Load project data
-    project_data = load_project(project_id)
-    if not project_data:
+    if not project_exists(project_id):
         logging.error(f"Project with ID {project_id} not found.")
         return jsonify({"error": "Project not found"}), 404
-    
-    pm = ProjectManager.from_dict(project_data)
-    workflow_data = next((wf for wf in pm.workflows if wf['workflow_id'] == workflow_id), None)
+
+    workflow_data = load_workflow(project_id, workflow_id)
     if not workflow_data:
         logging.error(f"Workflow with ID {workflow_id} not found in project {project_id}.")
         return jsonify({"error": "Workflow not found"}), 404
@@ -489,16 +485,8 @@ def remove_step_route(project_id, workflow_id):
         logging.error(f"Failed to remove step with ID {step_id}.")
         return jsonify({"error": "Failed to remove step"}), 500
     
-    # Serialize and save back
     updated_workflow = manager.to_dict()
-    for idx, wf in enumerate(pm.workflows):
-        if wf['workflow_id'] == workflow_id:
-            pm.workflows[idx] = updated_workflow
-            break
-    
-    # Preserve other fields like 'evaluations'
-    project_data['workflows'] = pm.to_dict()['workflows']
-    save_project(project_id, project_data)
+    save_workflow(project_id, updated_workflow)
     workflows[workflow_id] = updated_workflow
 
     logging.info(f"Step {step_id} removed from workflow {workflow_id} in project {project_id}.")
@@ -507,6 +495,7 @@ def remove_step_route(project_id, workflow_id):
 
 
 @app.route("/projects/<project_id>/workflow/<workflow_id>/reorder_steps", methods=["POST"])
+@project_write
 def reorder_steps_route(project_id, workflow_id):
     data = request.json
     new_order = data.get("new_order")
@@ -514,13 +503,11 @@ def reorder_steps_route(project_id, workflow_id):
         app.logger.error("Invalid new_order provided in reorder_steps.")
         return jsonify({"error": "Invalid new_order"}), 400
 
-    project_data = load_project(project_id)
-    if project_data is None:
+    if not project_exists(project_id):
         app.logger.error(f"Project not found: {project_id}")
         return jsonify({"error": "Project not found"}), 404
 
-    pm = ProjectManager.from_dict(project_data)
-    workflow = next((wf for wf in pm.workflows if wf['workflow_id'] == workflow_id), None)
+    workflow = load_workflow(project_id, workflow_id)
     if not workflow:
         app.logger.error(f"Workflow not found: {workflow_id} in project {project_id}")
         return jsonify({"error": "Workflow not found"}), 404
@@ -529,15 +516,7 @@ def reorder_steps_route(project_id, workflow_id):
     manager.reorder_steps(new_order)
     updated_workflow = manager.to_dict()
 
-    # Update the workflow in the project
-    for idx, wf in enumerate(pm.workflows):
-        if wf['workflow_id'] == workflow_id:
-            pm.workflows[idx] = updated_workflow
-            break
-
-    # Preserve other fields like 'evaluations'
-    project_data['workflows'] = pm.to_dict()['workflows']
-    save_project(project_id, project_data)
+    save_workflow(project_id, updated_workflow)
     workflows[workflow_id] = updated_workflow
 
     app.logger.info(f"Reordered steps in workflow {workflow_id} of project {project_id} to: {new_order}")
@@ -545,6 +524,7 @@ def reorder_steps_route(project_id, workflow_id):
 
 
 @app.route("/projects/<project_id>/workflow/<workflow_id>/add_variable", methods=["POST"])
+@project_write
 def add_variable_route(project_id, workflow_id):
     data = request.json
     var_name = data.get("var_name", "").strip()
@@ -554,13 +534,11 @@ def add_variable_route(project_id, workflow_id):
         app.logger.error("No var_name provided in add_variable.")
         return jsonify({"error": "Variable name is required."}), 400
 
-    project_data = load_project(project_id)
-    if project_data is None:
+    if not project_exists(project_id):
         app.logger.error(f"Project not found: {project_id}")
         return jsonify({"error": "Project not found"}), 404
 
-    pm = ProjectManager.from_dict(project_data)
-    workflow = next((wf for wf in pm.workflows if wf['workflow_id'] == workflow_id), None)
+    workflow = load_workflow(project_id, workflow_id)
     if not workflow:
         app.logger.error(f"Workflow not found: {workflow_id} in project {project_id}")
         return jsonify({"error": "Workflow not found"}), 404
@@ -571,15 +549,7 @@ def add_variable_route(project_id, workflow_id):
 
     workflow['variables'][var_name] = var_content
 
-    # Update the workflow in the project
-    for idx, wf in enumerate(pm.workflows):
-        if wf['workflow_id'] == workflow_id:
-            pm.workflows[idx] = workflow
-            break
-
-    # Preserve other fields like 'evaluations'
-    project_data['workflows'] = pm.to_dict()['workflows']
-    save_project(project_id, project_data)
+    save_workflow(project_id, workflow)
     workflows[workflow_id] = workflow
 
     app.logger.info(f"Added variable '{var_name}' to workflow {workflow_id} in project {project_id}.")
@@ -587,6 +557,7 @@ def add_variable_route(project_id, workflow_id):
 
 
 @app.route("/projects/<project_id>/workflow/<workflow_id>/edit_variable", methods=["POST"])
+@project_write
 def edit_variable_route(project_id, workflow_id):
     data = request.json
     var_name = data.get("var_name", "").strip()
@@ -596,13 +567,11 @@ def edit_variable_route(project_id, workflow_id):
         app.logger.error("No var_name provided in edit_variable.")
         return jsonify({"error": "Variable name is required."}), 400
 
-    project_data = load_project(project_id)
-    if project_data is None:
+    if not project_exists(project_id):
         app.logger.error(f"Project not found: {project_id}")
         return jsonify({"error": "Project not found"}), 404
 
-    pm = ProjectManager.from_dict(project_data)
-    workflow = next((wf for wf in pm.workflows if wf['workflow_id'] == workflow_id), None)
+    workflow = load_workflow(project_id, workflow_id)
     if not workflow:
         app.logger.error(f"Workflow not found: {workflow_id} in project {project_id}")
         return jsonify({"error": "Workflow not found"}), 404
@@ -613,15 +582,7 @@ def edit_variable_route(project_id, workflow_id):
 
     workflow['variables'][var_name] = var_content
 
-    # Update the workflow in the project
-    for idx, wf in enumerate(pm.workflows):
-        if wf['workflow_id'] == workflow_id:
-            pm.workflows[idx] = workflow
-            break
-
-    # Preserve other fields like 'evaluations'
-    project_data['workflows'] = pm.to_dict()['workflows']
-    save_project(project_id, project_data)
+    save_workflow(project_id, workflow)
     workflows[workflow_id] = workflow
 
     app.logger.info(f"Edited variable '{var_name}' in workflow {workflow_id} of project {project_id}.")
@@ -629,6 +590,7 @@ def edit_variable_route(project_id, workflow_id):
 
 
 @app.route("/projects/<project_id>/workflow/<workflow_id>/remove_variable", methods=["POST"])
+@project_write
 def remove_variable_route(project_id, workflow_id):
     data = request.json
     var_name = data.get("var_name", "").strip()
@@ -637,13 +599,11 @@ def remove_variable_route(project_id, workflow_id):
         app.logger.error("No var_name provided in remove_variable.")
         return jsonify({"error": "Variable name is required."}), 400
 
-    project_data = load_project(project_id)
-    if project_data is None:
+    if not project_exists(project_id):
         app.logger.error(f"Project not found: {project_id}")
         return jsonify({"error": "Project not found"}), 404
 
-    pm = ProjectManager.from_dict(project_data)
-    workflow = next((wf for wf in pm.workflows if wf['workflow_id'] == workflow_id), None)
+    workflow = load_workflow(project_id, workflow_id)
     if not workflow:
         app.logger.error(f"Workflow not found: {workflow_id} in project {project_id}")
         return jsonify({"error": "Workflow not found"}), 404
@@ -654,15 +614,7 @@ def remove_variable_route(project_id, workflow_id):
 
     del workflow['variables'][var_name]
 
-    # Update the workflow in the project
-    for idx, wf in enumerate(pm.workflows):
-        if wf['workflow_id'] == workflow_id:
-            pm.workflows[idx] = workflow
-            break
-
-    # Preserve other fields like 'evaluations'
-    project_data['workflows'] = pm.to_dict()['workflows']
-    save_project(project_id, project_data)
+    save_workflow(project_id, workflow)
     workflows[workflow_id] = workflow
 
     app.logger.info(f"Removed variable '{var_name}' from workflow {workflow_id} in project {project_id}.")
@@ -675,6 +627,7 @@ def remove_variable_route(project_id, workflow_id):
 # =====================================
 
 @app.route("/projects/<project_id>/add_common_variable_name", methods=["POST"])
+@project_write
 def add_common_variable_name(project_id):
     """
     Adds a new common variable name to the project.
@@ -686,12 +639,12 @@ def add_common_variable_name(project_id):
         app.logger.error("No var_name provided in add_common_variable_name.")
         return jsonify({"error": "Variable name is required."}), 400
 
-    project_data = load_project(project_id)
-    if not project_data:
+    project_meta = load_project_meta(project_id)
+    if not project_meta:
         app.logger.error(f"Project not found: {project_id}")
         return jsonify({"error": "Project not found"}), 404
 
-    pm = ProjectManager.from_dict(project_data)
+    pm = ProjectManager.from_dict(project_meta)
 
     if var_name in pm.common_variable_names:
         app.logger.error(f"Variable name '{var_name}' already exists in project {project_id}.")
@@ -699,7 +652,7 @@ def add_common_variable_name(project_id):
 
     try:
         pm.add_common_variable_name(var_name)
-        save_project(project_id, pm.to_dict())
+        save_project_meta(project_id, {"common_variable_names": pm.common_variable_names})
         app.logger.info(f"Added common variable name '{var_name}' to project {project_id}.")
         return jsonify({"status": "common_variable_name_added", "var_name": var_name})
     except Exception as e:
@@ -707,6 +660,7 @@ def add_common_variable_name(project_id):
         return jsonify({"error": str(e)}), 500
 
 @app.route("/projects/<project_id>/remove_common_variable_name", methods=["POST"])
+@project_write
 def remove_common_variable_name(project_id):
     """
     Removes an existing common variable name from the project.
@@ -718,12 +672,12 @@ def remove_common_variable_name(project_id):
         app.logger.error("No var_name provided in remove_common_variable_name.")
         return jsonify({"error": "Variable name is required."}), 400
 
-    project_data = load_project(project_id)
-    if not project_data:
+    project_meta = load_project_meta(project_id)
+    if not project_meta:
         app.logger.error(f"Project not found: {project_id}")
         return jsonify({"error": "Project not found"}), 404
 
-    pm = ProjectManager.from_dict(project_data)
+    pm = ProjectManager.from_dict(project_meta)
 
     if var_name not in pm.common_variable_names:
         app.logger.error(f"Variable name '{var_name}' does not exist in project {project_id}.")
@@ -731,7 +685,7 @@ def remove_common_variable_name(project_id):
 
     try:
         pm.remove_common_variable_name(var_name)
-        save_project(project_id, pm.to_dict())
+        save_project_meta(project_id, {"common_variable_names": pm.common_variable_names})
         app.logger.info(f"Removed common variable name '{var_name}' from project {project_id}.")
         return jsonify({"status": "common_variable_name_removed", "var_name": var_name})
     except Exception as e:
@@ -744,12 +698,10 @@ def remove_common_variable_name(project_id):
 
 @app.route("/report/<project_id>/<workflow_id>")
 def get_report(project_id, workflow_id):
-    project_data = load_project(project_id)
-    if not project_data:
+    if not project_exists(project_id):
         app.logger.error(f"Project not found: {project_id}")
         return "Project not found", 404
-    pm = ProjectManager.from_dict(project_data)
-    workflow = next((wf for wf in pm.workflows if wf['workflow_id'] == workflow_id), None)
+    workflow = load_workflow(project_id, workflow_id)
     if not workflow:
         app.logger.error(f"Workflow not found: {workflow_id} in project {project_id}")
         return "Workflow not found", 404
@@ -757,18 +709,103 @@ def get_report(project_id, workflow_id):
 
 @app.route("/projects/<project_id>/workflow/<workflow_id>/run", methods=["POST"])
 def run_workflow(project_id, workflow_id):
+    """
+    Queues a background job that runs the workflow and returns the job id at once.
+    The step results are available as the job's result once it completes.
+    """
     data = request.get_json()
     if not data:
         return jsonify({"error": "No data provided."}), 400
 
     initial_variables = data.get("variables", {})
 
-    try:
-        step_results = run_workflow_synchronously(project_id, workflow_id, initial_variables)
-        return jsonify({"status": "success", "outputs": step_results}), 200
-    except Exception as e:
-        app.logger.error(f"Error running workflow: {e}")
-        return jsonify({"error": str(e)}), 500
+    job_id = job_queue.submit(
+        "workflow_run",
+        {"project_id": project_id, "workflow_id": workflow_id, "variables": initial_variables},
+        project_id=project_id
+    )
+    return jsonify({
+        "status": "queued",
+        "job_id": job_id,
+        "progress_url": url_for("get_job_status", job_id=job_id)
+    }), 202
+
+
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+
+
+def coalesce_token_events(events):
+    """Merges consecutive token events of the same call attempt into one event."""
+    merged = []
+    for event, payload in events:
+        if (event == "token" and merged and merged[-1][0] == "token"
+                and merged[-1][1]["call_id"] == payload["call_id"]
+                and merged[-1][1]["attempt"] == payload["attempt"]):
+            merged[-1] = (event, {**merged[-1][1], "text": merged[-1][1]["text"] + payload["text"]})
+        else:
+            merged.append((event, payload))
+    return merged
+
+
+@app.route("/projects/<project_id>/workflow/<workflow_id>/run_stream", methods=["POST"])
+def run_workflow_stream(project_id, workflow_id):
+    """
+    Runs the workflow and streams it as Server-Sent Events: run_start (the step
+    layout), step_start/step_done, call_start/call_done for calls and functions,
+    token events carrying LLM output as it is generated, and finally run_done
+    (with the same outputs as a workflow run job) or error.
+
+    Unlike /run, the run is not queued as a background job: it belongs to the
+    request that watches it.
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "No data provided."}), 400
+
+    initial_variables = data.get("variables", {})
+    events = queue.Queue()
+
+    def on_event(event, payload):
+        events.put((event, payload))
+
+    def run():
+        try:
+            outputs = run_workflow_synchronously(project_id, workflow_id, initial_variables, on_event=on_event)
+            if isinstance(outputs, dict) and "error" in outputs:
+                events.put(("error", outputs))
+            else:
+                events.put(("run_done", {"outputs": outputs}))
+        except Exception as e:
+            app.logger.exception(f"Streaming run of workflow {workflow_id} failed")
+            events.put(("error", {"error": str(e)}))
+        events.put(None)
+
+    threading.Thread(target=run, name=f"workflow-stream-{workflow_id}", daemon=True).start()
+
+    def generate():
+        finished = False
+        while not finished:
+            try:
+                batch = [events.get(timeout=STREAM_HEARTBEAT_SECONDS)]
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            # Send whatever else is ready in one write, with adjacent tokens merged
+            while True:
+                try:
+                    batch.append(events.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                finished = True
+                batch = batch[:batch.index(None)]
+            yield "".join(
+                f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+                for event, payload in coalesce_token_events(batch)
+            )
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 
@@ -785,7 +822,8 @@ def format_per_step_outputs(per_step_outputs):
                 "conversation": call.get("conversation", []),
                 "response": call["response"],
                 "model_name": call["model_name"],
-                "variable_name": call["variable_name"]
+                "variable_name": call["variable_name"],
+                "metrics": call.get("metrics")
             })
 
         # Format Function calls
@@ -810,31 +848,6 @@ def format_per_step_outputs(per_step_outputs):
 
 
 
-async def run_subcalls_in_parallel(subcall_prompts, workflow_variables):
-    """
-    Executes multiple LLM calls in parallel with proper variable substitution.
-    
-    Args:
-        subcall_prompts (list): List of StepCall objects representing LLM calls.
-        workflow_variables (dict): Dictionary of workflow-level variables.
-    
-    Returns:
-        list: List of results from each LLM call.
-    """
-    with concurrent.futures.ThreadPoolExecutor() as pool:
-        loop = asyncio.get_event_loop()
-        tasks = [
-            loop.run_in_executor(
-                pool,
-                run_single_call,
-                call_obj,
-                {**workflow_variables, **call_obj.variables}  # Merge workflow and call-specific variables
-            )
-            for call_obj in subcall_prompts
-        ]
-        results = await asyncio.gather(*tasks)
-    return results
-
 def parse_potential_json(raw_text):
     """
     Attempt to parse raw_text as JSON, even if it's wrapped in triple backticks
@@ -878,60 +891,38 @@ def list_pydantic_models():
     return jsonify({"models": list(PYDANTIC_MODELS.keys())})
 
 
-def resolve_ref(schema: dict, ref: str) -> dict:
-    """Resolve a `$ref` in the schema."""
-    if ref.startswith("#/$defs/"):
-        def_name = ref.split("/")[-1]
-        return schema["$defs"][def_name]
-    raise ValueError(f"Unsupported $ref format: {ref}")
-
-
-def generate_json_schema(schema: dict) -> dict:
-    """
-    Generate a JSON-like structure from a Pydantic schema where keys are field names,
-    and values are their descriptions and types in a human-readable format.
-    """
-    json_structure = {}
-    properties = schema.get("properties", {})
-
-    for field, details in properties.items():
-        if "$ref" in details:
-            # Handle references
-            ref_schema = resolve_ref(schema, details["$ref"])
-            if not ref_schema:
-                raise ValueError(f"Reference schema for '{field}' not found.")
-            # Include a nested structure with descriptions and types for subfields
-            json_structure[field] = {
-                subfield: (
-                    f"Description: {subdetails.get('description', 'No description provided.')} "
-                    f"Data Type: {subdetails.get('type', 'unknown')}"
-                )
-                for subfield, subdetails in ref_schema.get("properties", {}).items()
-            }
-        else:
-            # Include the field description and type directly
-            json_structure[field] = (
-                f"Description: {details.get('description', 'No description provided.')}. "
-                f"Type: {details.get('type', 'unknown')}"
-            )
-    return json_structure
-
-
 import json
 from typing import Any, Dict
 from pydantic import ValidationError
 
-def run_call_with_pydantic_validation(call_obj, per_call_vars):
+async def run_call_with_pydantic_validation(call_obj, per_call_vars, on_token=None, limit_key=None):
     """
     Handles the LLM call with Pydantic validation and retries.
+    Runs on the execution runtime's event loop; only the provider request is awaited.
 
     Args:
         call_obj (StepCall): The StepCall object containing call details.
         per_call_vars (dict): Variables to be used for prompt formatting.
+        on_token (callable): Optional; streams the response, calling
+            on_token(text, attempt) with each chunk of generated text.
+        limit_key (str): Optional; runtime concurrency limit (the provider) the
+            call holds a slot of, for all of its attempts.
 
     Returns:
-        dict: A dictionary containing call details and response.
+        dict: A dictionary containing call details and response, plus "metrics"
+        (see CallMetrics.as_dict()): latency, time to first token, queue wait
+        (including the wait for the concurrency limit), tokens, retries and
+        cache hits across all attempts.
     """
+    with measure_call() as metrics:
+        queued = time.monotonic()
+        async with get_runtime().limit(limit_key):
+            metrics.add("queue_wait_seconds", time.monotonic() - queued)
+            result = await _run_call_attempts(call_obj, per_call_vars, on_token, metrics)
+    return {**result, "metrics": metrics.as_dict()}
+
+
+async def _run_call_attempts(call_obj, per_call_vars, on_token, metrics):
     attempts = call_obj.max_retries + 1  # Total attempts
     parsed_output = None
     last_error = None  # To store the last encountered error
@@ -939,7 +930,11 @@ def run_call_with_pydantic_validation(call_obj, per_call_vars):
     print(f"Starting Pydantic validation for call '{call_obj.title}' with variable '{call_obj.variable_name}'.")
 
     for attempt in range(1, attempts + 1):
+        if attempt > 1:
+            # Back off (with jitter) instead of retrying at once
+            await asyncio.sleep(backoff_delay(attempt - 1, base=LLM_RETRY_BACKOFF_BASE))
         print(f"Attempt {attempt} for call '{call_obj.title}'.")
+        metrics.add("attempts")
 
         # Prepare prompts with variable substitution
         try:
@@ -966,19 +961,10 @@ def run_call_with_pydantic_validation(call_obj, per_call_vars):
                 "content": formatted_content
             })
 
-        # Inject Pydantic schema into system prompt if applicable
+        # Inject Pydantic schema into system prompt if applicable (built once per model)
         if call_obj.pydantic_definition and call_obj.pydantic_definition in PYDANTIC_MODELS:
-            pydantic_model = PYDANTIC_MODELS[call_obj.pydantic_definition]
-            schema_dict = pydantic_model.schema()
             try:
-                structured_schema = generate_json_schema(schema_dict)
-                schema_json_str = json.dumps(structured_schema, indent=2)
-                system_prompt_formatted += (
-                    f"\n\nBelow is JSON like object that describes the expected structure of your output. Only respond in JSON.\n"
-                    f"\n{schema_json_str}\n"
-                )
-                #print(f"Injected Pydantic schema into system prompt for model '{call_obj.pydantic_definition}'.")
-                #print(f"System prompt with schema: {system_prompt_formatted}")
+                system_prompt_formatted += schema_prompt_fragment(call_obj.pydantic_definition)
             except Exception as e:
                 error_msg = f"Error generating JSON schema for model '{call_obj.pydantic_definition}': {e}"
                 print(error_msg)
@@ -994,11 +980,23 @@ def run_call_with_pydantic_validation(call_obj, per_call_vars):
         }
         #print(f"LLM parameters: {llm_params}")
 
-        # Make the LLM call
-        response = generate_llm_response(call_obj.model_name, {
-            "system_prompt": system_prompt_formatted,
-            "conversation": conversation_formatted
-        }, llm_params)
+        # Make the LLM call; identical deterministic requests are answered from the response cache.
+        # Retries skip the lookup, since the cached response is the one that just failed.
+        generate = agenerate_llm_response
+        if on_token is not None:
+            generate = functools.partial(agenerate_llm_response, on_token=functools.partial(on_token, attempt=attempt))
+        try:
+            response, cache_key = await acached_llm_response(generate, call_obj.model_name, {
+                "system_prompt": system_prompt_formatted,
+                "conversation": conversation_formatted
+            }, llm_params, use_cache=call_obj.use_cache, refresh=attempt > 1)
+        except ProviderError as e:
+            last_error = f"LLM request failed on attempt {attempt} for call '{call_obj.title}': {e}"
+            print(last_error)
+            app.logger.warning(last_error)
+            continue
+        # Streamed responses marked their first token already; otherwise it arrives with the response
+        metrics.mark_first_token()
         raw_output = response.get("content", "")
         #print(f"Raw LLM response: {raw_output}")
 
@@ -1011,6 +1009,7 @@ def run_call_with_pydantic_validation(call_obj, per_call_vars):
                 #print(f"Parsed output: {parsed_output}")
             except (json.JSONDecodeError, ValueError) as parse_error:
                 last_error = f"JSON parsing failed on attempt {attempt} for call '{call_obj.title}': {parse_error}"
+                await ainvalidate_cached_response(cache_key)
                 print(last_error)
                 app.logger.warning(last_error)
                 if attempt < attempts:
@@ -1040,9 +1039,8 @@ def run_call_with_pydantic_validation(call_obj, per_call_vars):
                 model_name = call_obj.pydantic_definition
                 print(f"Using Pydantic model: {model_name} for validation.")
                 if model_name in PYDANTIC_MODELS:
-                    pydantic_model = PYDANTIC_MODELS[model_name]
                     try:
-                        validated_data = pydantic_model(**parsed_output)
+                        validated_data = get_type_adapter(model_name).validate_python(parsed_output)
                         print(f"Pydantic validation successful for call '{call_obj.title}'.")
                         # If validation succeeds, return the validated data
                         return {
@@ -1051,13 +1049,14 @@ def run_call_with_pydantic_validation(call_obj, per_call_vars):
                             "title": call_obj.title,
                             "system_prompt": call_obj.system_prompt,
                             "conversation": conversation_formatted,
-                            "response": validated_data.dict(),
+                            "response": validated_data.model_dump(),
                             "model_name": call_obj.model_name,
                             "variable_name": call_obj.variable_name,
                             "call_obj": call_obj.to_dict()
                         }
                     except ValidationError as ve:
                         last_error = f"Pydantic validation failed on attempt {attempt} for call '{call_obj.title}': {ve}"
+                        await ainvalidate_cached_response(cache_key)
                         print(last_error)
                         app.logger.warning(last_error)
                         if attempt < attempts:
@@ -1148,19 +1147,34 @@ def run_call_with_pydantic_validation(call_obj, per_call_vars):
 
 
 
-def run_single_call(call_obj, per_call_vars):
+def run_single_function(function_obj, variables):
     """
-    Executes a single call with Pydantic validation and retries.
+    Executes a FunctionCall in the restricted sandbox, in a worker process
+    of the sandbox pool unless FUNCTION_SANDBOX_WORKERS is 0.
 
     Args:
-        call_obj (StepCall): The StepCall object containing call details.
-        per_call_vars (dict): Variables to be used for prompt formatting.
+        function_obj (FunctionCall): The function to run.
+        variables (dict): Context variables; function_obj.input_variables maps
+            each input name of the code to one of them.
 
     Returns:
-        dict: A dictionary containing call details and response.
+        dict: The function details with its "response", or an "error".
     """
-    call_result = run_call_with_pydantic_validation(call_obj, per_call_vars)
-    return call_result
+    result = function_obj.to_dict()
+    try:
+        input_values = {
+            input_key: variables[variable_name]
+            for input_key, variable_name in function_obj.input_variables.items()
+        }
+    except KeyError as e:
+        result["error"] = f"Missing input variable for function '{function_obj.title}': {e}"
+        return result
+
+    try:
+        result["response"] = run_function(function_obj.code, input_values)
+    except FunctionExecutionError as e:
+        result["error"] = str(e)
+    return result
 
 @app.route("/projects/<project_id>/workflow/<workflow_id>/graph")
 def workflow_graph(project_id, workflow_id):
@@ -1174,13 +1188,11 @@ def workflow_graph(project_id, workflow_id):
     Returns:
         Rendered HTML template with the Mermaid diagram.
     """
-    project_data = load_project(project_id)
-    if project_data is None:
+    if not project_exists(project_id):
         app.logger.error(f"Project not found: {project_id}")
         return "Project not found", 404
 
-    pm = ProjectManager.from_dict(project_data)
-    workflow = next((wf for wf in pm.workflows if wf['workflow_id'] == workflow_id), None)
+    workflow = load_workflow(project_id, workflow_id)
     if workflow is None:
         app.logger.error(f"Workflow not found: {workflow_id} in project {project_id}")
         return "Workflow not found", 404
@@ -1195,25 +1207,22 @@ def workflow_graph(project_id, workflow_id):
 
 @app.route("/projects/<project_id>/evaluations", methods=["GET"])
 def list_evaluations(project_id):
-    project_data = load_project(project_id)
-    if not project_data:
+    if not project_exists(project_id):
         return jsonify({"error": "Project not found"}), 404
-    evaluations = project_data.get("evaluations", [])
+    evaluations = list_project_evaluations(project_id)
     return jsonify(evaluations)
 
 
 @app.route("/projects/<project_id>/evaluations/create", methods=["POST"])
+@project_write
 def create_evaluation(project_id):
     data = request.json
     eval_name = data.get("name", "Untitled Evaluation")
     eval_description = data.get("description", "")
     variable_sets_input = data.get("variable_sets", {})  # Now expecting a dict or list
 
-    project_data = load_project(project_id)
-    if not project_data:
+    if not project_exists(project_id):
         return jsonify({"error": "Project not found"}), 404
-    if "evaluations" not in project_data:
-        project_data["evaluations"] = []
 
     variable_sets = {}
 
@@ -1232,15 +1241,15 @@ def create_evaluation(project_id):
     else:
         return jsonify({"error": "Invalid format for variable_sets"}), 400
 
+    new_eval_id = str(uuid.uuid4())
     new_eval = {
-        "evaluation_id": str(uuid.uuid4()),
+        "evaluation_id": new_eval_id,
         "name": eval_name,
         "description": eval_description,
-        "variable_sets": variable_sets,  # Now a dict with unique IDs as keys
-        "results": {}
+        "variable_sets": variable_sets  # Now a dict with unique IDs as keys
     }
-    project_data["evaluations"].append(new_eval)
-    save_project(project_id, project_data)
+    # Runs are stored separately from the evaluation by the storage backend
+    save_evaluation(project_id, new_eval)
     return jsonify({
         "status": "evaluation_created",
         "evaluation_id": new_eval["evaluation_id"]
@@ -1249,148 +1258,182 @@ def create_evaluation(project_id):
     
 @app.route("/projects/<project_id>/evaluations/<evaluation_id>", methods=["GET"])
 def get_evaluation(project_id, evaluation_id):
-    project_data = load_project(project_id)
-    if not project_data:
+    if not project_exists(project_id):
         return jsonify({"error": "Project not found"}), 404
-    evaluations = project_data.get("evaluations", [])
-    evaluation = next((e for e in evaluations if e["evaluation_id"] == evaluation_id), None)
+    evaluation = load_evaluation(project_id, evaluation_id)
     if not evaluation:
         return jsonify({"error": "Evaluation not found"}), 404
-    return jsonify(evaluation)
+    return jsonify({**evaluation, "results": load_results(project_id, evaluation)})
 
 @app.route("/projects/<project_id>/evaluations/<evaluation_id>/delete", methods=["POST"])
+@project_write
 def delete_evaluation(project_id, evaluation_id):
-    project_data = load_project(project_id)
-    if not project_data:
+    if not project_exists(project_id):
         return jsonify({"error": "Project not found"}), 404
-    evaluations = project_data.get("evaluations", [])
-    new_evals = [e for e in evaluations if e["evaluation_id"] != evaluation_id]
-    if len(new_evals) == len(evaluations):
+    # Also deletes the evaluation's recorded runs
+    if not delete_project_evaluation(project_id, evaluation_id):
         return jsonify({"error": "Evaluation not found"}), 404
-    project_data["evaluations"] = new_evals
-    save_project(project_id, project_data)
     return jsonify({"status": "evaluation_deleted"})
 
-@app.route("/projects/<project_id>/evaluations/<evaluation_id>/run", methods=["POST"])
-def run_evaluation(project_id, evaluation_id):
+def find_runnable_evaluation(project_id, evaluation_id):
     """
-    Runs each workflow in the project multiple times using each variable set in the evaluation.
-    Stores results and comparisons.
-    Logs progress for workflows, variable sets, and iterations by printing to the terminal.
-    Saves project data incrementally to prevent data loss in case of errors.
-    Skips variable sets that have already been fully processed.
-    """
-    req_data = request.json
+    Loads the project and evaluation and checks that there is something to run.
 
-    project_data = load_project(project_id)
-    if project_data is None:
+    Returns:
+        tuple: (project_data, evaluation, None) on success, or
+               (None, None, (error_message, status_code)) otherwise.
+               project_data holds the project's fields and workflows, without evaluations.
+    """
+    project_meta = load_project_meta(project_id)
+    if project_meta is None:
         app.logger.error(f"Project not found: {project_id}")
-        return jsonify({"error": "Project not found"}), 404
+        return None, None, ("Project not found", 404)
+    project_data = {**project_meta, "workflows": list_workflows(project_id)}
 
-    evaluation = next((e for e in project_data["evaluations"] if e["evaluation_id"] == evaluation_id), None)
+    evaluation = load_evaluation(project_id, evaluation_id)
     if not evaluation:
         app.logger.error(f"Evaluation not found: {evaluation_id} in project {project_id}")
-        return jsonify({"error": "Evaluation not found"}), 404
+        return None, None, ("Evaluation not found", 404)
 
-    workflows_data = project_data.get("workflows", [])
-    total_workflows = len(workflows_data)
-    if total_workflows == 0:
+    if not project_data.get("workflows", []):
         app.logger.warning(f"No workflows found in project {project_id}.")
         print(f"No workflows found in project {project_id}.")
-        return jsonify({"error": "No workflows to run in this project."}), 400
+        return None, None, ("No workflows to run in this project.", 400)
 
-    variable_sets = evaluation.get("variable_sets", {})
-    total_variable_sets = len(variable_sets)
-    if total_variable_sets == 0:
+    if not evaluation.get("variable_sets", {}):
         app.logger.warning(f"No variable sets found in evaluation {evaluation_id} of project {project_id}.")
         print(f"No variable sets found in evaluation {evaluation_id} of project {project_id}.")
-        return jsonify({"error": "No variable sets to run in this evaluation."}), 400
+        return None, None, ("No variable sets to run in this evaluation.", 400)
+
+    return project_data, evaluation, None
 
-    # Initialize results if not already present to support incremental updates
-    if "results" not in evaluation:
-        evaluation["results"] = {}
-    results = evaluation["results"]
 
+@app.route("/projects/<project_id>/evaluations/<evaluation_id>/run", methods=["POST"])
+def run_evaluation(project_id, evaluation_id):
+    """
+    Queues a background job that runs each workflow in the project multiple times
+    using each variable set in the evaluation, and returns the job id at once.
+    Progress can be followed through /jobs/<job_id> or /jobs/<job_id>/events.
+    Optional "max_workers" and "model_limits" in the request body tune the scheduler.
+    """
+    req_data = request.get_json(silent=True) or {}
     try:
-        # Enumerate workflows for logging
-        for wf_index, wf in enumerate(workflows_data, start=1):
-            wf_id = wf["workflow_id"]
-            wf_name = wf.get("name", f"Workflow {wf_index}")
-            print(f"Workflow {wf_index}/{total_workflows}: {wf_name}")
-            app.logger.info(f"Starting Workflow {wf_index}/{total_workflows}: {wf_name}")
-
-            if wf_id not in results:
-                results[wf_id] = []
-
-            # Enumerate variable sets for logging
-            for var_set_index, (var_set_id, vset) in enumerate(variable_sets.items(), start=1):
-                # Count already completed iterations for this variable set
-                completed_runs = [
-                    r for r in results[wf_id] if r.get("variable_set_id") == var_set_id
-                ]
-                num_completed = len(completed_runs)
-
-                num_runs = vset.get("num_runs", 1)
-
-                if num_completed >= num_runs:
-                    print(f"Skipping Variable Set {var_set_index}/{total_variable_sets} (ID: {var_set_id}) for Workflow {wf_id}: already completed {num_completed}/{num_runs} iterations")
-                    app.logger.info(f"Skipping Variable Set {var_set_index}/{total_variable_sets} (ID: {var_set_id}) for Workflow {wf_id}: already completed")
-                    continue  # Skip this variable set as it is already complete
-
-                print(f"Workflow {wf_index}/{total_workflows}: {wf_name}")
-                print(f"  Variable Set {var_set_index}/{total_variable_sets} (ID: {var_set_id})")
-                app.logger.info(f"  Processing Variable Set {var_set_index}/{total_variable_sets} (ID: {var_set_id}) for Workflow {wf_id}")
-
-                # Setup the variables for this run by merging common variables with the specific variable set.
-                variables_for_run = {}
-                common_vars = project_data.get("common_variable_names", [])
-                input_vars = vset.get("variables", {})
-                for var_name in common_vars:
-                    variables_for_run[var_name] = input_vars.get(var_name, "")
-
-                ideal_output = vset.get("ideal_output", "")
-
-                # Determine from which iteration to resume (1-based index for printing, 0-based in result)
-                start_iteration = num_completed + 1
-
-                # Enumerate iterations for logging and execution
-                for run_i in range(start_iteration, num_runs + 1):
-                    print(f"    Iteration {run_i}/{num_runs} (variable set {var_set_id} for workflow {wf_id})")
-                    app.logger.info(f"    Starting Iteration {run_i}/{num_runs} for variable set {var_set_id} in workflow {wf_id}")
-
-                    run_output = run_workflow_synchronously(project_id, wf_id, variables_for_run)
-                    comparison = compare_outputs(run_output, ideal_output)
-
-                    run_result = {
-                        "variable_set_id": var_set_id,    # Store the unique ID
-                        "run_index": run_i - 1,           # 0-based index as per original code
-                        "output": run_output,
-                        "comparison": comparison
-                    }
+        max_workers, model_limits = validate_scheduler_options(req_data.get("max_workers"), req_data.get("model_limits"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    _, _, error = find_runnable_evaluation(project_id, evaluation_id)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+
+    job_id = job_queue.submit(
+        "evaluation",
+        {
+            "project_id": project_id,
+            "evaluation_id": evaluation_id,
+            "max_workers": max_workers,
+            "model_limits": model_limits
+        },
+        project_id=project_id,
+        target_id=evaluation_id
+    )
+    app.logger.info(f"Queued evaluation {evaluation_id} of project {project_id} as job {job_id}")
+    return jsonify({
+        "status": "evaluation_queued",
+        "job_id": job_id,
+        "progress_url": url_for("get_job_status", job_id=job_id)
+    }), 202
 
-                    results[wf_id].append(run_result)
 
-                    # Incrementally save the project after each run
-                    save_project(project_id, project_data)
-                    app.logger.debug(f"Saved project data after run {run_i} of variable set {var_set_id} in workflow {wf_id}")
+def execute_evaluation(project_id, evaluation_id, max_workers=None, model_limits=None, progress=None):
+    """
+    Runs each workflow in the project multiple times using each variable set in the evaluation.
+    Stores results and comparisons.
+    Independent runs are spread over a bounded worker pool with per-model concurrency limits.
+    Each run is appended to the evaluation's results log as soon as it finishes,
+    so nothing is lost in case of errors. Skips runs that have already been recorded,
+    so calling this again after a crash or restart resumes the evaluation.
+
+    Args:
+        project_id (str): The ID of the project.
+        evaluation_id (str): The ID of the evaluation.
+        max_workers (int): Optional size of the run worker pool.
+        model_limits (dict): Optional per-model concurrency limits.
+        progress (JobProgress): Optional progress reporter.
+
+    Returns:
+        dict: Summary with the number of runs executed and recorded.
+    """
+    project_data, evaluation, error = find_runnable_evaluation(project_id, evaluation_id)
+    if error:
+        raise ValueError(error[0])
+
+    workflows_data = project_data.get("workflows", [])
+    variable_sets = evaluation.get("variable_sets", {})
 
-        print(f"Completed Evaluation {evaluation_id} for Project {project_id}")
-        app.logger.info(f"Completed Evaluation {evaluation_id} for Project {project_id}")
+    # Older projects embed results in the project file; move them to the evaluation's log once
+    if migrate_embedded_results(project_id, evaluation):
+        save_evaluation(project_id, evaluation)
+
+    # Runs already recorded in the results log are skipped, so interrupted evaluations resume
+    results = load_results(project_id, evaluation)
+    pending_runs = plan_pending_runs(project_data, evaluation, results=results)
+    total_runs = len(pending_runs)
+    planned_runs = len(workflows_data) * sum(vset.get("num_runs", 1) for vset in variable_sets.values())
+    already_done = max(planned_runs - total_runs, 0)
+    if progress is not None:
+        progress.set_total(already_done + total_runs, completed=already_done)
+    print(f"Evaluation {evaluation_id}: {total_runs} pending runs across {len(workflows_data)} workflows and {len(variable_sets)} variable sets")
+    app.logger.info(f"Evaluation {evaluation_id}: {total_runs} pending runs")
+
+    def execute_run(run):
+        print(f"    Iteration {run['run_index'] + 1}/{run['num_runs']} (variable set {run['variable_set_id']} for workflow {run['workflow_id']})")
+        started = time.monotonic()
+        run_output = run_workflow_synchronously(
+            project_id, run["workflow_id"], run["variables"], workflow_data=run["workflow"], priority=PRIORITY_BULK
+        )
+        wall_seconds = time.monotonic() - started
+        comparison = compare_outputs(
+            run_output, run["ideal_output"],
+            scorers=evaluation.get("scorers"), variables=evaluation.get("score_variables")
+        )
+        return {
+            "variable_set_id": run["variable_set_id"],    # Store the unique ID
+            "run_index": run["run_index"],                # 0-based index as per original code
+            "output": run_output,
+            "comparison": comparison,
+            "metrics": summarize_run(run_output, wall_seconds)
+        }
+
+    completed = {"count": 0}
+
+    def record_run(run, run_result):
+        # Called one run at a time by the scheduler; only the new run record is written
+        append_run(project_id, evaluation_id, run["workflow_id"], run_result)
+        completed["count"] += 1
+        app.logger.debug(f"Saved run {run['run_index'] + 1} of variable set {run['variable_set_id']} in workflow {run['workflow_id']} ({completed['count']}/{total_runs})")
+        if progress is not None:
+            progress.advance()
 
-        return jsonify({"status": "evaluation_run_complete", "results": results})
+    scheduler = EvaluationScheduler(execute_run, max_workers=max_workers, model_limits=model_limits)
 
+    try:
+        scheduler.run(pending_runs, on_result=record_run)
     except Exception as e:
         app.logger.error(f"An error occurred during evaluation: {str(e)}")
         print(f"An error occurred: {str(e)}")
-        # Optionally, save the project data even if an error occurs
-        save_project(project_id, project_data)
-        return jsonify({"error": "An error occurred during evaluation.", "details": str(e)}), 500
+        raise
+
+    print(f"Completed Evaluation {evaluation_id} for Project {project_id}")
+    app.logger.info(f"Completed Evaluation {evaluation_id} for Project {project_id}")
+    return {"evaluation_id": evaluation_id, "runs_executed": completed["count"]}
 
 
 
 
 
 @app.route("/projects/<project_id>/evaluations/<evaluation_id>/results/save_notes", methods=["POST"])
+@project_write
 def save_evaluation_notes(project_id, evaluation_id):
     data = request.json
     variable_set_id = data.get("variable_set_id")  # Changed from index
@@ -1398,50 +1441,229 @@ def save_evaluation_notes(project_id, evaluation_id):
     workflow_id = data.get("workflow_id")
     notes = data.get("notes", "")
 
-    # Load the project
-    project_data = load_project(project_id)
-    if not project_data:
+    if not project_exists(project_id):
         return jsonify({"error": "Project not found"}), 404
 
     # Find the evaluation
-    evaluations = project_data.get("evaluations", [])
-    evaluation = next((e for e in evaluations if e["evaluation_id"] == evaluation_id), None)
+    evaluation = load_evaluation(project_id, evaluation_id)
     if not evaluation:
         return jsonify({"error": "Evaluation not found"}), 404
 
-    # Access the results for the specific workflow
-    results = evaluation.get("results", {})
-    workflow_results = results.get(workflow_id, [])
+    # Results still embedded in the project file are moved to the results store first
+    if migrate_embedded_results(project_id, evaluation):
+        save_evaluation(project_id, evaluation)
 
-    # Find the specific run based on variable_set_id and run_index
-    for run in workflow_results:
-        if run.get("variable_set_id") == variable_set_id and run.get("run_index") == run_index:
-            run["notes"] = notes
-            break
-    else:
+    # Find the specific run based on variable_set_id and run_index and record the change
+    if not update_run(project_id, evaluation_id, workflow_id, variable_set_id, run_index, {"notes": notes}):
         return jsonify({"error": "Run not found"}), 404
-
-    # Save the updated project data
-    save_project(project_id, project_data)
     return jsonify({"status": "notes_saved"})
 
 
 
+def find_evaluation_run(project_id, evaluation, workflow_id, variable_set_id, run_index):
+    """Loads a single run of an evaluation, or returns None."""
+    if run_index is None:
+        return None
+    page = query_runs(project_id, evaluation, workflow_id=workflow_id, variable_set_id=variable_set_id,
+                      run_start=run_index, run_end=run_index + 1, limit=1)
+    return page["runs"][0] if page["runs"] else None
+
+
+def encode_results_cursor(sort_key):
+    return base64.urlsafe_b64encode(json.dumps(list(sort_key)).encode("utf-8")).decode("ascii")
+
+
+def decode_results_cursor(cursor):
+    """Returns the run_sort_key() stored in a cursor. Raises ValueError for malformed cursors."""
+    try:
+        sort_key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(sort_key, list) or len(sort_key) != 4:
+        raise ValueError("Invalid cursor")
+    return tuple(sort_key)
+
+
+@app.route("/projects/<project_id>/evaluations/<evaluation_id>/results/runs", methods=["GET"])
+def list_evaluation_runs(project_id, evaluation_id):
+    """
+    One page of an evaluation's runs as short summaries (scores, notes and an
+    output preview; full outputs come from /results/run).
+
+    Query (all optional): workflow_id, variable_set_id, run_start, run_end
+    (run indexes, end exclusive), cursor (next_cursor of the previous page), limit.
+    """
+    evaluation = load_evaluation(project_id, evaluation_id)
+    if not evaluation:
+        return jsonify({"error": "Evaluation not found"}), 404
+
+    after = None
+    if request.args.get("cursor"):
+        try:
+            after = decode_results_cursor(request.args["cursor"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    limit = min(max(request.args.get("limit", RESULTS_PAGE_SIZE, type=int), 1), RESULTS_MAX_PAGE_SIZE)
+
+    page = query_runs(
+        project_id, evaluation,
+        workflow_id=request.args.get("workflow_id") or None,
+        variable_set_id=request.args.get("variable_set_id") or None,
+        run_start=request.args.get("run_start", type=int),
+        run_end=request.args.get("run_end", type=int),
+        after=after,
+        limit=limit
+    )
+
+    variables = evaluation.get("score_variables")
+    summaries = [{
+        "workflow_id": run["workflow_id"],
+        "variable_set_id": run.get("variable_set_id"),
+        "run_index": run.get("run_index"),
+        "scores": (run.get("comparison") or {}).get("scores") or {},
+        "match_score": (run.get("comparison") or {}).get("match_score"),
+        "notes": run.get("notes", ""),
+        "error": isinstance(run.get("output"), dict) and "error" in run["output"],
+        "preview": preview_text(run.get("output"), variables),
+        "metrics": {
+            field: (run.get("metrics") or {}).get(field)
+            for field in ("wall_seconds", "total_tokens", "retries", "cache_hits")
+        }
+    } for run in page["runs"]]
+
+    variable_set_order = variable_set_positions(evaluation)
+    next_cursor = None
+    if page["has_more"] and page["runs"]:
+        last = page["runs"][-1]
+        next_cursor = encode_results_cursor(run_sort_key(
+            variable_set_order, last["workflow_id"], last.get("variable_set_id"), last.get("run_index")
+        ))
+    return jsonify({"runs": summaries, "total": page["total"], "next_cursor": next_cursor})
+
+
+@app.route("/projects/<project_id>/evaluations/<evaluation_id>/results/run", methods=["GET"])
+def get_evaluation_run(project_id, evaluation_id):
+    """
+    One run in full: its output, the variable set's variables and ideal
+    output, the diff against the ideal output and fresh scores.
+    Query: workflow_id, variable_set_id, run_index.
+    """
+    evaluation = load_evaluation(project_id, evaluation_id)
+    if not evaluation:
+        return jsonify({"error": "Evaluation not found"}), 404
+
+    workflow_id = request.args.get("workflow_id")
+    variable_set_id = request.args.get("variable_set_id")
+    variable_set = evaluation.get("variable_sets", {}).get(variable_set_id)
+    if variable_set is None:
+        return jsonify({"error": "Variable set not found"}), 404
+    run = find_evaluation_run(project_id, evaluation, workflow_id, variable_set_id,
+                              request.args.get("run_index", type=int))
+    if run is None:
+        return jsonify({"error": "Run not found"}), 404
+
+    ideal_output = variable_set.get("ideal_output", "")
+    variables = evaluation.get("score_variables")
+    return jsonify({
+        "run": run,
+        "variables": variable_set.get("variables", {}),
+        "ideal_output": ideal_output,
+        "diff": compute_diff(run.get("output"), ideal_output, variables=variables),
+        "comparison": score_output(run.get("output"), ideal_output, scorers=evaluation.get("scorers"), variables=variables)
+    })
+
+
+@app.route("/projects/<project_id>/evaluations/<evaluation_id>/export", methods=["GET"])
+def export_evaluation_results(project_id, evaluation_id):
+    """
+    Streams the evaluation's runs as flat rows for pandas/DuckDB.
+    Query: format ("csv", "parquet" or "arrow"; default csv), workflow_id (optional).
+    """
+    evaluation = load_evaluation(project_id, evaluation_id)
+    if not evaluation:
+        return jsonify({"error": "Evaluation not found"}), 404
+
+    export_format = request.args.get("format", "csv").lower()
+    try:
+        chunks = export_evaluation(project_id, evaluation, export_format,
+                                   workflow_id=request.args.get("workflow_id") or None)
+    except ExportError as e:
+        return jsonify({"error": str(e)}), 400
+
+    filename = f"{evaluation.get('name') or evaluation_id}.{EXPORT_FORMATS[export_format]['extension']}"
+    filename = re.sub(r"[^\w.-]+", "_", filename)
+    return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[export_format]["mimetype"],
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@app.route("/projects/<project_id>/evaluations/<evaluation_id>/metrics", methods=["GET"])
+def evaluation_call_metrics(project_id, evaluation_id):
+    """
+    Latency, time to first token, queue wait, token, retry and cache-hit
+    figures of the evaluation's calls, per evaluation, workflow and step.
+    """
+    from modules.evaluation import call_metrics_summary
+
+    evaluation = load_evaluation(project_id, evaluation_id)
+    if not evaluation:
+        return jsonify({"error": "Evaluation not found"}), 404
+    return jsonify(call_metrics_summary(load_results(project_id, evaluation)))
+
+
+@app.route("/projects/<project_id>/evaluations/<evaluation_id>/stats", methods=["GET"])
+def evaluation_stats(project_id, evaluation_id):
+    """
+    Per-workflow means, bootstrap confidence intervals, paired permutation
+    tests between workflows and per-field agreement for an evaluation's runs.
+    Query (optional): confidence, bootstrap_samples, permutations, seed.
+    """
+    # NumPy is only needed here, so it is not imported at startup
+    from modules.evaluation import (
+        evaluation_statistics, EVALUATION_CONFIDENCE, EVALUATION_BOOTSTRAP_SAMPLES, EVALUATION_PERMUTATIONS
+    )
+
+    evaluation = load_evaluation(project_id, evaluation_id)
+    if not evaluation:
+        return jsonify({"error": "Evaluation not found"}), 404
+
+    confidence = request.args.get("confidence", EVALUATION_CONFIDENCE, type=float)
+    if not 0 < confidence < 1:
+        return jsonify({"error": "confidence must be between 0 and 1"}), 400
+    started = time.monotonic()
+    stats = evaluation_statistics(
+        load_results(project_id, evaluation),
+        confidence=confidence,
+        bootstrap_samples=min(request.args.get("bootstrap_samples", EVALUATION_BOOTSTRAP_SAMPLES, type=int), 100000),
+        permutations=min(request.args.get("permutations", EVALUATION_PERMUTATIONS, type=int), 100000),
+        seed=request.args.get("seed", type=int)
+    )
+    stats["seconds"] = round(time.monotonic() - started, 3)
+    return jsonify(stats)
+
+
 @app.route("/projects/<project_id>/evaluations/<evaluation_id>/results", methods=["GET"])
 def view_evaluation_results(project_id, evaluation_id):
-    project_data = load_project(project_id)
-    if not project_data:
+    project_meta = load_project_meta(project_id)
+    if not project_meta:
         return "Project not found", 404
-    evaluations = project_data.get("evaluations", [])
-    evaluation = next((e for e in evaluations if e["evaluation_id"] == evaluation_id), None)
+    evaluation = load_evaluation(project_id, evaluation_id)
     if not evaluation:
         return "Evaluation not found", 404
     
-    # Pass the necessary data to the template
-    return render_template("evaluation_results.html", project=project_data, evaluation=evaluation)
+    # Runs are not embedded: the page pages through /results/runs as it is scrolled
+    workflows = [
+        {"workflow_id": wf.get("workflow_id"), "name": wf.get("name") or wf.get("workflow_id")}
+        for wf in list_workflows(project_id)
+    ]
+    return render_template(
+        "evaluation_results.html", project=project_meta, evaluation=evaluation,
+        workflows=workflows, variable_set_ids=list(evaluation.get("variable_sets", {})),
+        page_size=RESULTS_PAGE_SIZE
+    )
 
 
-def run_workflow_synchronously(project_id, workflow_id, variables):
+def run_workflow_synchronously(project_id, workflow_id, variables, workflow_data=None, progress=None,
+                               priority=PRIORITY_INTERACTIVE, on_event=None):
     """
     Runs the specified workflow synchronously with Pydantic validation and retries.
     
@@ -1449,18 +1671,24 @@ def run_workflow_synchronously(project_id, workflow_id, variables):
         project_id (str): The ID of the project.
         workflow_id (str): The ID of the workflow.
         variables (dict): Initial variables for the workflow.
+        workflow_data (dict): Optional already-loaded workflow; skips reloading the project.
+        progress (JobProgress): Optional progress reporter, advanced once per step.
+        priority (int): Rate-limiter priority of the run's LLM requests; evaluations
+            use PRIORITY_BULK so interactive runs are served first.
+        on_event (callable): Optional on_event(event, payload) hook, called from the
+            runtime loop as steps and calls start and finish and as LLM tokens
+            arrive; LLM responses are streamed when it is given.
     
     Returns:
         list: A list of dictionaries, each representing a step with its calls and results.
     """
-    # Load project and workflow
-    project_data = load_project(project_id)
-    if not project_data:
-        app.logger.error(f"Project not found: {project_id}")
-        return {"error": "Project not found"}
+    if workflow_data is None:
+        # Load project and workflow
+        if not project_exists(project_id):
+            app.logger.error(f"Project not found: {project_id}")
+            return {"error": "Project not found"}
 
-    pm = ProjectManager.from_dict(project_data)
-    workflow_data = next((wf for wf in pm.workflows if wf['workflow_id'] == workflow_id), None)
+        workflow_data = load_workflow(project_id, workflow_id)
     if workflow_data is None:
         app.logger.error(f"Workflow not found: {workflow_id}")
         return {"error": "Workflow not found"}
@@ -1468,43 +1696,83 @@ def run_workflow_synchronously(project_id, workflow_id, variables):
     manager = WorkflowManager.from_dict(workflow_data)
     context_variables = {**manager.variables, **variables}
 
-    all_outputs = []
+    # Each call or function starts as soon as the nodes producing the variables it
+    # references have finished, instead of waiting for the whole previous step
+    nodes = build_workflow_dag(manager.steps)
+    remaining_per_step = [0] * len(manager.steps)
+    for node in nodes:
+        remaining_per_step[node.step_index] += 1
+
+    if progress is not None:
+        progress.set_total(len(manager.steps))
+        for step, remaining in zip(manager.steps, remaining_per_step):
+            if remaining == 0:
+                progress.advance(message=step.title)
+
+    runtime = get_runtime()
+
+    def emit(event, **payload):
+        if on_event is not None:
+            on_event(event, payload)
+
+    emit("run_start", steps=[
+        {
+            "step_id": step.step_id,
+            "step_title": step.title,
+            "calls": [{"call_id": c.call_id, "title": c.title, "model_name": c.model_name} for c in step.calls],
+            "functions": [{"call_id": f.call_id, "title": f.title} for f in step.functions]
+        }
+        for step in manager.steps
+    ])
+    started_steps = set()
+    for step_index, remaining in enumerate(remaining_per_step):
+        if remaining == 0:
+            started_steps.add(step_index)
+            emit("step_start", step_index=step_index, step_id=manager.steps[step_index].step_id)
+            emit("step_done", step_index=step_index, step_id=manager.steps[step_index].step_id)
+
+    async def run_node(node, node_variables):
+        if node.step_index not in started_steps:
+            started_steps.add(node.step_index)
+            emit("step_start", step_index=node.step_index, step_id=manager.steps[node.step_index].step_id)
+        emit("call_start", step_index=node.step_index, call_id=node.obj.call_id, kind=node.kind, title=node.obj.title)
+
+        if node.kind == "function":
+            return await runtime.run_blocking(run_single_function, node.obj, node_variables, limit_key="function")
+
+        on_token = None
+        if on_event is not None:
+            def on_token(text, attempt):
+                emit("token", step_index=node.step_index, call_id=node.obj.call_id, attempt=attempt, text=text)
+
+        # Merge workflow and call-specific variables; the call awaits its provider on the runtime loop
+        return await run_call_with_pydantic_validation(
+            node.obj, {**node_variables, **node.obj.variables}, on_token=on_token,
+            limit_key=provider_for_model(node.obj.model_name)
+        )
 
-    # Initialize asyncio loop
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        for step in manager.steps:
-            step_result = {
-                "step_id": step.step_id,
-                "step_title": step.title,
-                "calls": []
-            }
-            
-            # Collect call objects for the current step
-            subcall_prompts = step.calls
-            
-            # Run all calls in the current step in parallel
-            step_call_results = loop.run_until_complete(run_subcalls_in_parallel(subcall_prompts, context_variables))
-            
-            # Process each call's result
-            for result in step_call_results:
-                if "error" in result:
-                    # Handle error accordingly
-                    app.logger.error(f"Error in call '{result.get('title', 'Unnamed Call')}': {result['error']}")
-                    step_result["calls"].append(result)
-                    continue  # Or decide to halt the workflow
-
-                step_result["calls"].append(result)
-
-                # Store the response in context_variables if variable_name is set
-                if result.get("call_obj") and result["call_obj"].get("variable_name") and "response" in result:
-                    context_variables[result["call_obj"]["variable_name"]] = result["response"]
-
-            all_outputs.append(step_result)
-
-    finally:
-        loop.close()
+    def on_node_done(node, result):
+        if "error" in result:
+            app.logger.error(f"Error in {node.kind} '{result.get('title', node.obj.title)}': {result['error']}")
+        emit("call_done", step_index=node.step_index, call_id=node.obj.call_id, kind=node.kind, result=result)
+        remaining_per_step[node.step_index] -= 1
+        if remaining_per_step[node.step_index] == 0:
+            emit("step_done", step_index=node.step_index, step_id=manager.steps[node.step_index].step_id)
+            if progress is not None:
+                progress.advance(message=manager.steps[node.step_index].title)
+
+    # All runs share the runtime's event loop and call pool
+    node_results = runtime.run(with_priority(run_workflow_dag(nodes, context_variables, run_node, on_node_done), priority))
+
+    # Results stay grouped per step, in the order the calls are defined
+    all_outputs = [
+        {"step_id": step.step_id, "step_title": step.title, "calls": [], "functions": []}
+        for step in manager.steps
+    ]
+    for node, result in zip(nodes, node_results):
+        all_outputs[node.step_index]["calls" if node.kind == "call" else "functions"].append(result)
+    for step_output in all_outputs:
+        step_output["metrics"] = summarize_calls(step_output["calls"])
 
     return all_outputs
 
@@ -1523,29 +1791,19 @@ def format_prompts(call_obj, variables):
         })
     return system_prompt_formatted, conversation_formatted
 
-def compare_outputs(run_output, ideal_output):
+def compare_outputs(run_output, ideal_output, scorers=None, variables=None):
     """
-    A simple comparison method. You can enhance this:
-    - If both are strings, measure similarity (e.g., Levenshtein distance, etc.)
-    - If JSON, compare keys and values.
+    Scores a run's final response variables against the ideal output with the
+    configured scorers (see modules/scoring.py). The evaluation may choose the
+    scorers ("scorers") and the compared variables ("score_variables").
+    Diffs are not stored; /results/run computes them when a run is opened.
     """
-    run_str = json.dumps(run_output, indent=2) if isinstance(run_output, (dict, list)) else str(run_output)
-    ideal_str = json.dumps(ideal_output, indent=2) if isinstance(ideal_output, (dict, list)) else str(ideal_output)
-
-    diff = difflib.unified_diff(ideal_str.splitlines(), run_str.splitlines())
-    diff_text = "\n".join(diff)
-    # Simple similarity ratio:
-    seq = difflib.SequenceMatcher(None, ideal_str, run_str)
-    similarity = seq.ratio()
-
-    return {
-        "match_score": round(similarity, 4),
-        "differences": diff_text
-    }
+    return score_output(run_output, ideal_output, scorers=scorers, variables=variables)
 
 
 ## FUnction Routes ##
 @app.route("/projects/<project_id>/workflow/<workflow_id>/add_function", methods=["POST"])
+@project_write
 def add_function_to_step(project_id, workflow_id):
     data = request.json
     step_id = data.get("step_id")
@@ -1554,11 +1812,10 @@ def add_function_to_step(project_id, workflow_id):
     input_variables = data.get("input_variables", {})
     output_variable = data.get("output_variable", "")
 
-    project_data = load_project(project_id)
-    if not project_data:
+    if not project_exists(project_id):
         return jsonify({"error": "Project not found"}), 404
-    pm = ProjectManager.from_dict(project_data)
-    workflow = next((wf for wf in pm.workflows if wf["workflow_id"] == workflow_id), None)
+
+    workflow = load_workflow(project_id, workflow_id)
     if not workflow:
         return jsonify({"error": "Workflow not found"}), 404
 
@@ -1571,19 +1828,13 @@ def add_function_to_step(project_id, workflow_id):
     step.functions.append(new_call)
 
     updated_workflow = manager.to_dict()
-    for idx, wf in enumerate(pm.workflows):
-        if wf['workflow_id'] == workflow_id:
-            pm.workflows[idx] = updated_workflow
-            break
-
-    # Preserve other fields like 'evaluations'
-    project_data['workflows'] = pm.to_dict()['workflows']
-    save_project(project_id, project_data)
+    save_workflow(project_id, updated_workflow)
 
     return jsonify({"status": "function_added", "function_id": new_call.call_id})
 
 
 @app.route("/projects/<project_id>/workflow/<workflow_id>/edit_function", methods=["POST"])
+@project_write
 def edit_function_in_step(project_id, workflow_id):
     data = request.json
     step_id = data.get("step_id")
@@ -1593,11 +1844,10 @@ def edit_function_in_step(project_id, workflow_id):
     input_variables = data.get("input_variables", {})
     output_variable = data.get("output_variable", "")
 
-    project_data = load_project(project_id)
-    if not project_data:
+    if not project_exists(project_id):
         return jsonify({"error": "Project not found"}), 404
-    pm = ProjectManager.from_dict(project_data)
-    workflow = next((wf for wf in pm.workflows if wf["workflow_id"] == workflow_id), None)
+
+    workflow = load_workflow(project_id, workflow_id)
     if not workflow:
         return jsonify({"error": "Workflow not found"}), 404
 
@@ -1616,29 +1866,22 @@ def edit_function_in_step(project_id, workflow_id):
     func.output_variable = output_variable
 
     updated_workflow = manager.to_dict()
-    for idx, wf in enumerate(pm.workflows):
-        if wf['workflow_id'] == workflow_id:
-            pm.workflows[idx] = updated_workflow
-            break
-
-    # Preserve other fields like 'evaluations'
-    project_data['workflows'] = pm.to_dict()['workflows']
-    save_project(project_id, project_data)
+    save_workflow(project_id, updated_workflow)
 
     return jsonify({"status": "function_edited"})
 
 
 @app.route("/projects/<project_id>/workflow/<workflow_id>/remove_function", methods=["POST"])
+@project_write
 def remove_function_from_step(project_id, workflow_id):
     data = request.json
     step_id = data.get("step_id")
     call_id = data.get("call_id")
 
-    project_data = load_project(project_id)
-    if not project_data:
+    if not project_exists(project_id):
         return jsonify({"error": "Project not found"}), 404
-    pm = ProjectManager.from_dict(project_data)
-    workflow = next((wf for wf in pm.workflows if wf["workflow_id"] == workflow_id), None)
+
+    workflow = load_workflow(project_id, workflow_id)
     if not workflow:
         return jsonify({"error": "Workflow not found"}), 404
 
@@ -1650,14 +1893,7 @@ def remove_function_from_step(project_id, workflow_id):
     step.functions = [f for f in step.functions if f.call_id != call_id]
 
     updated_workflow = manager.to_dict()
-    for idx, wf in enumerate(pm.workflows):
-        if wf['workflow_id'] == workflow_id:
-            pm.workflows[idx] = updated_workflow
-            break
-
-    # Preserve other fields like 'evaluations'
-    project_data['workflows'] = pm.to_dict()['workflows']
-    save_project(project_id, project_data)
+    save_workflow(project_id, updated_workflow)
 
     return jsonify({"status": "function_removed"})
 
@@ -1675,11 +1911,10 @@ def generate_code(project_id, workflow_id):
     Generates a Python script representing the workflow.
     """
     try:
-        project_data = load_project(project_id)
+        project_data = load_project_meta(project_id)
         if not project_data:
             return jsonify({"error": "Project not found"}), 404
-        pm = ProjectManager.from_dict(project_data)
-        workflow = next((wf for wf in pm.workflows if wf['workflow_id'] == workflow_id), None)
+        workflow = load_workflow(project_id, workflow_id)
         if not workflow:
             return jsonify({"error": "Workflow not found"}), 404
 
@@ -1697,6 +1932,7 @@ def workflow_to_python_code(workflow, project_data):
     """
     code = """# === Imports ===
 import os
+import re
 import json
 import requests
 from groq import Groq
@@ -1744,7 +1980,7 @@ def replace_double_braces(template, variables):
                         raise ValueError("Mismatched brackets in expression: " + expr)
                     key_str = bracket_expr[1:end_index].strip()
                     bracket_expr = bracket_expr[end_index+1:].strip()
-                    key_str = key_str.strip("'\"")
+                    key_str = key_str.strip("'\\"")
                     if isinstance(custom_var, dict):
                         if key_str in custom_var:
                             custom_var = custom_var[key_str]
@@ -1793,6 +2029,8 @@ def parse_potential_json(raw_text):
     # Keep track of call and function counts for sequential IDs
     call_count = 0
     function_count = 0
+    # Parameters of each step function, which run_workflow() passes in the same order
+    step_parameters = []
 
     # === Step functions ===
     for step_index, step in enumerate(workflow['steps']):
@@ -1801,19 +2039,17 @@ def parse_potential_json(raw_text):
         input_vars = set()
         for call in step['calls']:
             for message in call['conversation']:
-                content = message['content']
-                matches = re.findall(r'\{\{(.*?)\}\}', content)
-                for match in matches:
-                    var_name = match.strip()
-                    if var_name in workflow['variables'] or any(c.get('variable_name') == var_name for s in workflow['steps'][:step_index+1] for c in s['calls']) or any(f.get('output_variable') == var_name for s in workflow['steps'][:step_index+1] for f in s['functions']):
+                for var_name in template_variables(message['content']):
+                    if var_name in workflow['variables'] or any(c.get('variable_name') == var_name for s in workflow['steps'][:step_index] for c in s['calls']) or any(f.get('output_variable') == var_name for s in workflow['steps'][:step_index] for f in s['functions']):
                          input_vars.add(var_name)
         for func in step.get('functions', []):
             for input_var_name in func['input_variables'].values():
-                if input_var_name in workflow['variables'] or any(c.get('variable_name') == input_var_name for s in workflow['steps'][:step_index+1] for c in s['calls']) or any(f.get('output_variable') == input_var_name for s in workflow['steps'][:step_index+1] for f in s['functions']):
+                if input_var_name in workflow['variables'] or any(c.get('variable_name') == input_var_name for s in workflow['steps'][:step_index] for c in s['calls']) or any(f.get('output_variable') == input_var_name for s in workflow['steps'][:step_index] for f in s['functions']):
                     input_vars.add(input_var_name)
 
         # Function parameters based on collected input variables
-        code += ', '.join(input_vars)
+        step_parameters.append(sorted(input_vars))
+        code += ', '.join(step_parameters[-1])
         code += '):\n'
         code += f'    """\n    Step: {step["title"]}\n'
         code += f'    Description: {step["description"]}\n    """\n'
@@ -1909,21 +2145,8 @@ def parse_potential_json(raw_text):
             if func['output_variable']:
                 current_step_outputs.append(func['output_variable'])
 
-        # Determine the input variables needed for the current step based on previous steps' outputs
-        needed_inputs = set()
-        for subsequent_step in workflow['steps'][step_index + 1:]:
-            for call in subsequent_step['calls']:
-                for message in call['conversation']:
-                    content = message['content']
-                    matches = re.findall(r'\{\{(.*?)\}\}', content)
-                    for match in matches:
-                        var_name = match.strip()
-                        if var_name in current_step_outputs:
-                            needed_inputs.add(var_name)
-            for func in subsequent_step.get('functions', []):
-                for input_var_name in func['input_variables'].values():
-                    if input_var_name in current_step_outputs:
-                        needed_inputs.add(input_var_name)
+        # The step's inputs (template variables and function inputs), as in its signature
+        needed_inputs = step_parameters[step_index]
 
         # Call the step function with the necessary inputs
         if needed_inputs or current_step_outputs:
@@ -1945,6 +2168,151 @@ def parse_potential_json(raw_text):
     code += '    run_workflow()\n'
 
     return code
+# =====================================
+# BACKGROUND JOB ROUTES
+# =====================================
+
+def evaluation_job_handler(payload, progress):
+    return execute_evaluation(
+        payload["project_id"],
+        payload["evaluation_id"],
+        max_workers=payload.get("max_workers"),
+        model_limits=payload.get("model_limits"),
+        progress=progress
+    )
+
+
+def workflow_run_job_handler(payload, progress):
+    outputs = run_workflow_synchronously(
+        payload["project_id"], payload["workflow_id"], payload.get("variables", {}), progress=progress
+    )
+    if isinstance(outputs, dict) and "error" in outputs:
+        raise ValueError(outputs["error"])
+    return {"outputs": outputs}
+
+
+job_queue.register_handler("evaluation", evaluation_job_handler)
+job_queue.register_handler("workflow_run", workflow_run_job_handler, lane="interactive")
+
+
+@app.before_request
+def start_job_queue():
+    # Started lazily so only the process that serves requests resumes unfinished jobs
+    job_queue.start()
+
+
+_models_preloaded = False
+
+
+@app.before_request
+def start_model_preload():
+    # Same reasoning as the job queue: the reloader's parent process must not load models
+    global _models_preloaded
+    if not _models_preloaded:
+        _models_preloaded = True
+        preload_models()
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+@app.route("/projects/<project_id>/jobs", methods=["GET"])
+def list_project_jobs(project_id):
+    return jsonify(job_queue.list_jobs(project_id=project_id))
+
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def stream_job_events(job_id):
+    """
+    Streams job progress as Server-Sent Events until the job finishes.
+    """
+    if job_queue.get(job_id, include_result=False) is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    # Polls SQLite every `interval` seconds, so keep it within sane bounds
+    interval = max(0.25, min(request.args.get("interval", 1.0, type=float), 30.0))
+
+    def generate():
+        last_payload = None
+        while True:
+            job = job_queue.get(job_id, include_result=False)
+            payload = json.dumps(job, ensure_ascii=False)
+            if payload != last_payload:
+                yield f"data: {payload}\n\n"
+                last_payload = payload
+            if job["status"] in FINISHED_STATUSES:
+                break
+            time.sleep(interval)
+
+    return Response(generate(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+# =====================================
+# STORAGE ROUTES
+# =====================================
+
+@app.route("/storage/cache_stats", methods=["GET"])
+def storage_cache_stats():
+    """
+    Returns the hit/miss counters of the in-process project cache.
+    """
+    return jsonify(project_cache_stats())
+
+
+@app.route("/runtime/stats", methods=["GET"])
+def runtime_stats():
+    """
+    Returns the number of workflow runs and calls currently in flight in the execution runtime.
+    """
+    return jsonify(get_runtime().stats())
+
+
+@app.route("/models/status", methods=["GET"])
+def get_model_status():
+    """
+    Returns the load state of every local model (queued, loading, loaded,
+    failed or evicted), the loaded models in LRU order and current memory use.
+    """
+    return jsonify(model_status())
+
+
+@app.route("/models/preload", methods=["POST"])
+def preload_models_route():
+    data = request.get_json(silent=True) or {}
+    models = data.get("models")
+    if not isinstance(models, list) or not models:
+        return jsonify({"error": "Provide a non-empty list of model names."}), 400
+    preload_models(models)
+    return jsonify({"status": "preloading", "models": models}), 202
+
+
+@app.route("/runtime/rate_limits", methods=["GET"])
+def runtime_rate_limits():
+    """
+    Returns the current (adapted) rate of every provider/model limiter and how often it was throttled.
+    """
+    return jsonify({"limiters": rate_limiter_stats()})
+
+
+@app.route("/llm_cache/stats", methods=["GET"])
+def llm_cache_stats():
+    """
+    Returns the size and hit rate of the persistent LLM response cache.
+    """
+    return jsonify(get_response_cache().stats())
+
+
+@app.route("/llm_cache/clear", methods=["POST"])
+def clear_llm_cache():
+    get_response_cache().clear()
+    return jsonify({"status": "llm_cache_cleared"})
+
+
 # =====================================
 # RUN THE APP
 # =====================================
@@ -0,0 +1,92 @@
+# benchmark_startup.py
+"""
+Import-time benchmark for the Flask app.
+
+Imports `app` in fresh interpreters, reports the median import time and peak
+RSS, and fails when startup is slower than the budget or when a heavy provider
+backend (torch, transformers, groq, httpx) or pyarrow is imported before it is needed.
+
+Usage:
+    python benchmark_startup.py [--runs 5] [--max-seconds 3.0] [--top 15]
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+HEAVY_MODULES = ["torch", "torch.distributed", "transformers", "groq", "httpx", "pyarrow"]
+STARTUP_MAX_SECONDS = float(os.getenv("STARTUP_MAX_SECONDS", "3.0"))
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+_MEASURE = """
+import sys, json, time, resource
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    "seconds": elapsed,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy": [name for name in %r if name in sys.modules]
+}))
+""" % (HEAVY_MODULES,)
+
+
+def measure_once():
+    result = subprocess.run(
+        [sys.executable, "-c", _MEASURE], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    # The last line is ours; anything before it was printed while importing
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(top):
+    """Runs `python -X importtime` and returns the `top` modules with the largest cumulative time."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"], cwd=REPO_ROOT, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark `import app` startup time.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=STARTUP_MAX_SECONDS)
+    parser.add_argument("--top", type=int, default=15, help="Show the N slowest imports (0 to skip).")
+    args = parser.parse_args()
+
+    samples = [measure_once() for _ in range(args.runs)]
+    median = statistics.median(sample["seconds"] for sample in samples)
+    max_rss = max(sample["max_rss_mb"] for sample in samples)
+    heavy = sorted({name for sample in samples for name in sample["heavy"]})
+
+    print(f"import app: median {median:.3f}s over {args.runs} runs "
+          f"(min {min(s['seconds'] for s in samples):.3f}s), peak RSS {max_rss:.0f} MB")
+    if args.top:
+        print("\nSlowest imports (cumulative):")
+        for cumulative_us, name in slowest_imports(args.top):
+            print(f"  {cumulative_us / 1000:9.1f} ms  {name}")
+
+    failures = []
+    if median > args.max_seconds:
+        failures.append(f"median startup {median:.3f}s exceeds the {args.max_seconds:.3f}s budget")
+    if heavy:
+        failures.append(f"heavy modules imported at startup: {', '.join(heavy)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
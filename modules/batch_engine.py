@@ -0,0 +1,179 @@
+# modules/batch_engine.py
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class GenerationRequest:
+    """A single chat waiting to be generated as part of a batch."""
+
+    def __init__(self, messages, generation_kwargs, streamer=None):
+        self.messages = messages
+        self.generation_kwargs = generation_kwargs
+        self.streamer = streamer
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.batch_size = None
+
+    def batch_key(self):
+        # A streamer follows a single sequence, so streamed requests always run alone
+        if self.streamer is not None:
+            return ("stream", id(self))
+        # Requests can only share a forward pass when their sampling parameters match
+        return tuple(sorted(self.generation_kwargs.items()))
+
+
+class BatchingEngine:
+    """
+    Gathers concurrent generation requests for one text-generation pipeline and
+    runs them through the model as padded batches on a dedicated worker thread.
+
+    Callers submit a chat and get back a Future; the worker waits up to
+    `max_wait_ms` for more requests to arrive (or until `max_batch_size` is
+    reached), groups them by sampling parameters and hands every output back
+    to its own Future. Streamed requests go through the same worker, as
+    batches of one, so the worker stays the only caller of the model.
+    """
+
+    def __init__(self, text_generation_pipeline, max_batch_size=8, max_wait_ms=20, name=None):
+        self.pipeline = text_generation_pipeline
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms) / 1000.0)
+        self.name = name or "batching-engine"
+
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._prepare_tokenizer()
+
+        self._thread = threading.Thread(target=self._worker_loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def _prepare_tokenizer(self):
+        """
+        Decoder-only models must be left-padded for batched generation, and many
+        chat models ship without a pad token at all.
+        """
+        tokenizer = getattr(self.pipeline, "tokenizer", None)
+        if tokenizer is None:
+            return
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+
+    def _enqueue(self, messages, generation_kwargs, streamer=None):
+        if self._stopped.is_set():
+            raise RuntimeError(f"{self.name} has been shut down.")
+        request = GenerationRequest(messages, generation_kwargs, streamer)
+        self._queue.put(request)
+        return request
+
+    def submit(self, messages, generation_kwargs):
+        """
+        Queues a chat for generation.
+
+        Args:
+            messages (list): Chat messages as { role, content } dicts.
+            generation_kwargs (dict): Sampling parameters passed to the pipeline.
+
+        Returns:
+            Future: Resolves to the pipeline output for this chat.
+        """
+        return self._enqueue(messages, generation_kwargs).future
+
+    def generate(self, messages, generation_kwargs, stats=None, streamer=None):
+        """
+        Blocking convenience wrapper around submit().
+
+        Args:
+            stats (dict): Optional; filled with queue_wait_seconds (until the
+                request's batch started), generation_seconds and batch_size.
+            streamer: Optional transformers streamer; the chat is then
+                generated on its own, feeding the streamer as it goes.
+        """
+        request = self._enqueue(messages, generation_kwargs, streamer)
+        output = request.future.result()
+        if stats is not None and request.started_at is not None:
+            stats.update({
+                "queue_wait_seconds": request.started_at - request.enqueued_at,
+                "generation_seconds": request.finished_at - request.started_at,
+                "batch_size": request.batch_size
+            })
+        return output
+
+    def shutdown(self, wait=True):
+        self._stopped.set()
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
+
+    def _collect_batch(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                # Shutdown sentinel: finish what we already have, then stop
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _worker_loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+
+            batch = self._collect_batch(first)
+
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.batch_key(), []).append(request)
+
+            for requests in groups.values():
+                self._run_batch(requests)
+
+        # Fail anything still queued after shutdown so callers don't hang
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request.future.set_exception(RuntimeError(f"{self.name} has been shut down."))
+
+    def _run_batch(self, requests):
+        generation_kwargs = requests[0].generation_kwargs
+        chats = [r.messages for r in requests]
+        started = time.monotonic()
+        try:
+            if requests[0].streamer is not None:
+                outputs = [self.pipeline(chats[0], streamer=requests[0].streamer, **generation_kwargs)]
+            else:
+                outputs = list(self.pipeline(chats, batch_size=len(chats), **generation_kwargs))
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+
+        finished = time.monotonic()
+        # A list of chats yields one output list per chat, in input order
+        for index, request in enumerate(requests):
+            request.started_at, request.finished_at, request.batch_size = started, finished, len(requests)
+            if index < len(outputs):
+                request.future.set_result(outputs[index])
+            else:
+                # Never leave a caller waiting on a future nothing will resolve
+                request.future.set_exception(RuntimeError(
+                    f"{self.name}: the pipeline returned {len(outputs)} outputs for a batch of {len(requests)} chats."
+                ))
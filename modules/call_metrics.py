@@ -0,0 +1,155 @@
+# modules/call_metrics.py
+"""
+Timing, token and retry instrumentation of workflow calls.
+
+run_call_with_pydantic_validation() opens a CallMetrics for each LLM call
+and makes it the current one (a context variable, which follows the call into
+the runtime's worker threads). The layers underneath record into whichever
+one is current, so nothing has to be passed through their signatures:
+
+- llm_interface: time spent waiting for the rate limiter, transient retries,
+  the first streamed token and the provider's token usage
+- response_cache: cache hits
+- local models: time queued for and spent in the batching engine, and token
+  counts from the tokenizer
+
+Call metrics are stored with each call result; summarize_calls() and
+summarize_run() add them up per step and per run.
+"""
+
+import time
+import contextlib
+import contextvars
+
+_CURRENT = contextvars.ContextVar("call_metrics", default=None)
+
+# Fields of CallMetrics.as_dict() that add up across calls
+SUMMED_FIELDS = (
+    "latency_seconds", "queue_wait_seconds", "generation_seconds",
+    "prompt_tokens", "completion_tokens", "total_tokens",
+    "retries", "cache_hits"
+)
+
+
+class CallMetrics:
+    """Measurements of one call, across all of its attempts."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.finished = None
+        self.first_token = None
+        self.counts = {}
+
+    def add(self, field, amount=1):
+        self.counts[field] = self.counts.get(field, 0) + amount
+
+    def mark_first_token(self):
+        """Records the time to first token; only the first mark counts."""
+        if self.first_token is None:
+            self.first_token = time.monotonic()
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    def as_dict(self):
+        """
+        Returns latency_seconds, ttft_seconds (first streamed token, or the
+        whole response when not streamed), queue_wait_seconds, generation_seconds
+        (local models), prompt/completion/total tokens (None if never reported),
+        attempts, retries (validation retries plus transient provider retries)
+        and cache_hits.
+        """
+        def seconds(value):
+            return round(value, 3) if value is not None else None
+
+        prompt_tokens = self.counts.get("prompt_tokens")
+        completion_tokens = self.counts.get("completion_tokens")
+        total_tokens = None
+        if prompt_tokens is not None or completion_tokens is not None:
+            total_tokens = (prompt_tokens or 0) + (completion_tokens or 0)
+        attempts = self.counts.get("attempts", 0)
+        return {
+            "latency_seconds": seconds((self.finished or time.monotonic()) - self.started),
+            "ttft_seconds": seconds(self.first_token - self.started if self.first_token else None),
+            "queue_wait_seconds": seconds(self.counts.get("queue_wait_seconds", 0.0)),
+            "generation_seconds": seconds(self.counts.get("generation_seconds")),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": total_tokens,
+            "attempts": attempts,
+            "retries": max(attempts - 1, 0) + self.counts.get("transient_retries", 0),
+            "cache_hits": self.counts.get("cache_hits", 0)
+        }
+
+
+@contextlib.contextmanager
+def measure_call():
+    """Makes a new CallMetrics current for the duration of the block and yields it."""
+    metrics = CallMetrics()
+    token = _CURRENT.set(metrics)
+    try:
+        yield metrics
+    finally:
+        metrics.finish()
+        _CURRENT.reset(token)
+
+
+def current_call_metrics():
+    return _CURRENT.get()
+
+
+def record(field, amount=1):
+    """Adds to a field of the current call's metrics; does nothing outside a measured call."""
+    metrics = _CURRENT.get()
+    if metrics is not None:
+        metrics.add(field, amount)
+
+
+def record_first_token():
+    metrics = _CURRENT.get()
+    if metrics is not None:
+        metrics.mark_first_token()
+
+
+def record_usage(usage):
+    """Adds provider-style usage ({"prompt_tokens", "completion_tokens", ...}) to the current call."""
+    for field in ("prompt_tokens", "completion_tokens"):
+        if isinstance((usage or {}).get(field), int):
+            record(field, usage[field])
+
+
+# ---------- Aggregation ----------
+
+def summarize_calls(calls):
+    """
+    Adds up the metrics of call results: {"calls", "errors", <SUMMED_FIELDS>}.
+    Token totals are None when no call reported tokens.
+    """
+    summary = {"calls": 0, "errors": 0, **{field: None for field in SUMMED_FIELDS}}
+    for call in calls:
+        summary["calls"] += 1
+        if call.get("error"):
+            summary["errors"] += 1
+        for field, value in (call.get("metrics") or {}).items():
+            if field in SUMMED_FIELDS and value is not None:
+                summary[field] = (summary[field] or 0) + value
+    for field in ("latency_seconds", "queue_wait_seconds", "generation_seconds"):
+        if summary[field] is not None:
+            summary[field] = round(summary[field], 3)
+    return summary
+
+
+def summarize_run(run_output, wall_seconds=None):
+    """
+    Per-run totals of the call metrics, with a breakdown per step. Call
+    latencies overlap when calls run concurrently, so the run's own duration
+    is kept separately as wall_seconds.
+    """
+    steps = run_output if isinstance(run_output, list) else []
+    summary = summarize_calls(call for step in steps for call in step.get("calls", []))
+    summary["wall_seconds"] = round(wall_seconds, 3) if wall_seconds is not None else None
+    summary["steps"] = [
+        {"step_id": step.get("step_id"), "step_title": step.get("step_title"), **summarize_calls(step.get("calls", []))}
+        for step in steps
+    ]
+    return summary
@@ -1,8 +1,396 @@
+# modules/evaluation.py
+"""
+Statistics over evaluation results.
+
+Run scores are gathered once into flat NumPy arrays (one row per run, with
+integer codes for the workflow and the variable set), and every statistic is
+computed from those arrays in vectorized passes:
+
+- means and standard deviations per workflow and per (workflow, variable set)
+- bootstrap confidence intervals of each workflow's mean
+- paired permutation tests between workflows, paired on the variable set
+- per-field agreement with the ideal output for structured (pydantic) outputs
+- latency, token and retry percentiles of the recorded calls, per evaluation,
+  workflow and step (call_metrics_summary)
+
+Scores are rounded to 4 decimals when they are computed (modules/scoring.py),
+so a workflow's runs take few distinct values. Bootstrap resamples are drawn
+as multinomial counts over those distinct values, which gives the same
+distribution as resampling the runs themselves at a cost independent of the
+number of runs. Continuous scores with more distinct values than
+EVALUATION_BOOTSTRAP_BINS are first merged into that many value-range bins,
+each represented by the mean of its runs (the overall mean is unchanged).
+"""
+
+import os
+import itertools
+
+import numpy as np
+
+EVALUATION_BOOTSTRAP_SAMPLES = int(os.getenv("EVALUATION_BOOTSTRAP_SAMPLES", "2000"))
+EVALUATION_PERMUTATIONS = int(os.getenv("EVALUATION_PERMUTATIONS", "5000"))
+EVALUATION_CONFIDENCE = float(os.getenv("EVALUATION_CONFIDENCE", "0.95"))
+EVALUATION_BOOTSTRAP_BINS = int(os.getenv("EVALUATION_BOOTSTRAP_BINS", "128"))
+# Paired tests with at most this many pairs enumerate every sign assignment instead of sampling
+EXACT_PERMUTATION_MAX_PAIRS = 12
+# Upper bound on the elements of one block of the permutation sign matrix
+_PERMUTATION_BLOCK_ELEMENTS = 2_000_000
+
+LEGACY_METRIC = "match_score"
+
+
+class ScoreTable:
+    """
+    Run scores of one evaluation as parallel arrays.
+
+    Attributes:
+        workflow_ids (list), variable_set_ids (list): The labels behind the codes.
+        workflow (ndarray), variable_set (ndarray): Per-run integer codes into those lists.
+        run_index (ndarray): Per-run index within its variable set.
+        metrics (dict): {metric name: float ndarray}, NaN where a run has no score.
+        fields (dict): {field path: float ndarray} of 1/0 field matches, NaN where absent.
+    """
+
+    def __init__(self, workflow_ids, variable_set_ids, workflow, variable_set, run_index, metrics, fields):
+        self.workflow_ids = workflow_ids
+        self.variable_set_ids = variable_set_ids
+        self.workflow = workflow
+        self.variable_set = variable_set
+        self.run_index = run_index
+        self.metrics = metrics
+        self.fields = fields
+
+    def __len__(self):
+        return len(self.workflow)
+
+
+def _column(rows_and_values, size):
+    rows, values = rows_and_values
+    column = np.full(size, np.nan)
+    column[np.array(rows, dtype=np.intp)] = np.array(values, dtype=float)
+    return column
+
+
+def gather_scores(results):
+    """
+    Collects the scores stored with each run ({workflow_id: [run, ...]} as
+    returned by load_results) into a ScoreTable. Runs scored before per-scorer
+    scores existed contribute their match_score only.
+    """
+    workflow_ids = list(results)
+    variable_set_codes = {}
+    workflow, variable_set, run_index = [], [], []
+    # {name: ([row, ...], [value, ...])}
+    metric_values, field_values = {}, {}
+
+    def add(columns, name, row, value):
+        column = columns.get(name)
+        if column is None:
+            column = columns[name] = ([], [])
+        column[0].append(row)
+        column[1].append(value)
+
+    row = 0
+    for workflow_code, workflow_id in enumerate(workflow_ids):
+        for run in results[workflow_id] or []:
+            comparison = run.get("comparison") or {}
+            workflow.append(workflow_code)
+            variable_set.append(variable_set_codes.setdefault(run.get("variable_set_id"), len(variable_set_codes)))
+            run_index.append(run.get("run_index") or 0)
+
+            for name, score in (comparison.get("scores") or {}).items():
+                if score is not None:
+                    add(metric_values, name, row, score)
+            if comparison.get(LEGACY_METRIC) is not None:
+                add(metric_values, LEGACY_METRIC, row, comparison[LEGACY_METRIC])
+            for path, matched in (comparison.get("field_matches") or {}).items():
+                add(field_values, path, row, matched)
+            row += 1
+
+    return ScoreTable(
+        workflow_ids=workflow_ids,
+        variable_set_ids=list(variable_set_codes),
+        workflow=np.asarray(workflow, dtype=np.intp),
+        variable_set=np.asarray(variable_set, dtype=np.intp),
+        run_index=np.asarray(run_index, dtype=np.intp),
+        metrics={name: _column(values, row) for name, values in metric_values.items()},
+        fields={path: _column(values, row) for path, values in sorted(field_values.items())}
+    )
+
+
+# ---------- Vectorized building blocks ----------
+
+def group_moments(groups, values, n_groups):
+    """
+    Count, mean and (sample) standard deviation of `values` per group code,
+    ignoring NaNs. Returns three arrays of length n_groups (NaN for empty groups).
+    """
+    valid = ~np.isnan(values)
+    groups, values = groups[valid], values[valid]
+    counts = np.bincount(groups, minlength=n_groups)
+    sums = np.bincount(groups, weights=values, minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+        squares = np.bincount(groups, weights=(values - means[groups]) ** 2, minlength=n_groups)
+        stds = np.sqrt(squares / (counts - 1))
+    return counts, means, np.where(counts > 1, stds, np.nan)
+
+
+def bootstrap_ci(values, samples=EVALUATION_BOOTSTRAP_SAMPLES, confidence=EVALUATION_CONFIDENCE, rng=None):
+    """
+    Percentile bootstrap confidence interval of the mean of `values` (NaNs ignored).
+
+    Returns:
+        tuple: (low, high), or (None, None) with fewer than two values.
+    """
+    values = values[~np.isnan(values)]
+    if len(values) < 2 or samples < 1:
+        return None, None
+    rng = rng if rng is not None else np.random.default_rng()
+    distinct, counts = np.unique(values, return_counts=True)
+    if len(distinct) == 1:
+        return float(distinct[0]), float(distinct[0])
+    if len(distinct) > EVALUATION_BOOTSTRAP_BINS:
+        edges = np.linspace(distinct[0], distinct[-1], EVALUATION_BOOTSTRAP_BINS + 1)
+        bins = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, EVALUATION_BOOTSTRAP_BINS - 1)
+        counts = np.bincount(bins, minlength=EVALUATION_BOOTSTRAP_BINS)
+        sums = np.bincount(bins, weights=values, minlength=EVALUATION_BOOTSTRAP_BINS)
+        occupied = counts > 0
+        distinct, counts = sums[occupied] / counts[occupied], counts[occupied]
+    # Each row is one resample of the runs, expressed as how often each distinct value was drawn
+    draws = rng.multinomial(len(values), counts / len(values), size=samples)
+    means = draws @ distinct / len(values)
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(means, [tail, 100 - tail])
+    return float(low), float(high)
+
+
+def paired_permutation_test(differences, permutations=EVALUATION_PERMUTATIONS, rng=None):
+    """
+    Two-sided sign-flip permutation test of whether paired differences have
+    mean zero. Small samples are tested exactly over every sign assignment.
+
+    Returns:
+        tuple: (p_value, method), method being "exact" or "monte_carlo";
+        (None, None) without differences.
+    """
+    differences = differences[~np.isnan(differences)]
+    n = len(differences)
+    if n == 0:
+        return None, None
+    observed = abs(differences.mean())
+    # Tolerance so that ties with the observed statistic are not lost to rounding
+    threshold = observed - 1e-12
+
+    if n <= EXACT_PERMUTATION_MAX_PAIRS:
+        signs = np.array(list(itertools.product((1.0, -1.0), repeat=n)))
+        extreme = np.count_nonzero(np.abs(signs @ differences) / n >= threshold)
+        return float(extreme / len(signs)), "exact"
+
+    rng = rng if rng is not None else np.random.default_rng()
+    block = max(1, min(permutations, _PERMUTATION_BLOCK_ELEMENTS // n))
+    extreme, done = 0, 0
+    while done < permutations:
+        size = min(block, permutations - done)
+        signs = rng.integers(0, 2, size=(size, n), dtype=np.int8) * 2 - 1
+        extreme += np.count_nonzero(np.abs(signs @ differences) / n >= threshold)
+        done += size
+    # The observed assignment counts as one of the permutations
+    return float((extreme + 1) / (permutations + 1)), "monte_carlo"
+
+
+def _stat(value):
+    return None if value is None or np.isnan(value) else round(float(value), 4)
+
+
+# ---------- Evaluation summary ----------
+
+def evaluation_statistics(results, confidence=EVALUATION_CONFIDENCE, bootstrap_samples=EVALUATION_BOOTSTRAP_SAMPLES,
+                          permutations=EVALUATION_PERMUTATIONS, seed=None):
+    """
+    Summarizes an evaluation's results.
+
+    Args:
+        results (dict): {workflow_id: [run, ...]}, as returned by load_results.
+        confidence (float): Confidence level of the bootstrap intervals.
+        bootstrap_samples (int): Bootstrap resamples per interval.
+        permutations (int): Sign permutations per paired test (when not exact).
+        seed (int): Seed for reproducible intervals and p-values.
+
+    Returns:
+        dict: {"runs", "metrics", "fields", "workflows": {workflow_id: {...}},
+        "comparisons": [...], "settings": {...}}. Each workflow has per-metric
+        mean/std/n/ci_low/ci_high, per-field agreement, and per-variable-set
+        means; each comparison is a paired test between two workflows on one
+        metric, over the variable sets both workflows have scores for.
+    """
+    rng = np.random.default_rng(seed)
+    table = gather_scores(results)
+    n_workflows, n_sets = len(table.workflow_ids), len(table.variable_set_ids)
+    cells = table.workflow * n_sets + table.variable_set
+
+    workflows = {
+        workflow_id: {"runs": int(count), "metrics": {}, "fields": {}, "variable_sets": {}}
+        for workflow_id, count in zip(table.workflow_ids, np.bincount(table.workflow, minlength=n_workflows))
+    }
+    cell_means = {}
+    # Row indexes of each workflow's runs
+    order = np.argsort(table.workflow, kind="stable")
+    boundaries = np.searchsorted(table.workflow[order], np.arange(n_workflows + 1))
+    workflow_rows = [order[boundaries[code]:boundaries[code + 1]] for code in range(n_workflows)]
+
+    for name, values in table.metrics.items():
+        counts, means, stds = group_moments(table.workflow, values, n_workflows)
+        cell_counts, cell_means[name], _ = group_moments(cells, values, n_workflows * n_sets)
+        for code, workflow_id in enumerate(table.workflow_ids):
+            low, high = bootstrap_ci(values[workflow_rows[code]],
+                                     samples=bootstrap_samples, confidence=confidence, rng=rng)
+            workflows[workflow_id]["metrics"][name] = {
+                "mean": _stat(means[code]), "std": _stat(stds[code]), "n": int(counts[code]),
+                "ci_low": _stat(low), "ci_high": _stat(high)
+            }
+            for set_code in np.flatnonzero(cell_counts[code * n_sets:(code + 1) * n_sets]):
+                workflows[workflow_id]["variable_sets"].setdefault(table.variable_set_ids[set_code], {})[name] = {
+                    "mean": _stat(cell_means[name][code * n_sets + set_code]),
+                    "n": int(cell_counts[code * n_sets + set_code])
+                }
+
+    for path, matches in table.fields.items():
+        counts, agreement, _ = group_moments(table.workflow, matches, n_workflows)
+        for code, workflow_id in enumerate(table.workflow_ids):
+            if not counts[code]:
+                continue
+            low, high = bootstrap_ci(matches[workflow_rows[code]],
+                                     samples=bootstrap_samples, confidence=confidence, rng=rng)
+            workflows[workflow_id]["fields"][path] = {
+                "agreement": _stat(agreement[code]), "n": int(counts[code]),
+                "ci_low": _stat(low), "ci_high": _stat(high)
+            }
+
+    comparisons = []
+    for name, means in cell_means.items():
+        by_set = means.reshape(n_workflows, n_sets)
+        for a, b in itertools.combinations(range(n_workflows), 2):
+            differences = by_set[a] - by_set[b]
+            paired = differences[~np.isnan(differences)]
+            p_value, method = paired_permutation_test(paired, permutations=permutations, rng=rng)
+            comparisons.append({
+                "metric": name,
+                "workflow_a": table.workflow_ids[a],
+                "workflow_b": table.workflow_ids[b],
+                "pairs": int(len(paired)),
+                "mean_difference": _stat(paired.mean()) if len(paired) else None,
+                "p_value": _stat(p_value),
+                "method": method
+            })
+
+    return {
+        "runs": len(table),
+        "metrics": list(table.metrics),
+        "fields": list(table.fields),
+        "workflows": workflows,
+        "comparisons": comparisons,
+        "settings": {
+            "confidence": confidence, "bootstrap_samples": bootstrap_samples,
+            "permutations": permutations, "seed": seed
+        }
+    }
+
+
+# ---------- Call metrics ----------
+
+# Per-call measurements gathered by call_metrics_summary(); see CallMetrics.as_dict()
+CALL_METRIC_FIELDS = (
+    "latency_seconds", "ttft_seconds", "queue_wait_seconds", "generation_seconds",
+    "prompt_tokens", "completion_tokens", "retries", "cache_hits"
+)
+
+
+def _metric_stats(values):
+    """Count, total, mean, median and 95th percentile of one group's values (NaNs ignored)."""
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return None
+    p50, p95 = np.percentile(values, [50, 95])
+    return {
+        "n": int(len(values)), "total": _stat(values.sum()), "mean": _stat(values.mean()),
+        "p50": _stat(p50), "p95": _stat(p95)
+    }
+
+
+def _group_summary(rows, columns, wall_seconds=None):
+    summary = {
+        "calls": int(len(rows)),
+        "errors": int(columns["error"][rows].sum()),
+        **{field: _metric_stats(columns[field][rows]) for field in CALL_METRIC_FIELDS}
+    }
+    cache_hits = columns["cache_hits"][rows]
+    cache_hits = cache_hits[~np.isnan(cache_hits)]
+    summary["cache_hit_rate"] = _stat(np.minimum(cache_hits, 1).mean()) if len(cache_hits) else None
+    if wall_seconds is not None:
+        summary["run_wall_seconds"] = _metric_stats(wall_seconds)
+    return summary
+
+
+def call_metrics_summary(results):
+    """
+    Aggregates the per-call metrics stored with each run, to show where an
+    evaluation's time, tokens and GPU capacity go.
+
+    Args:
+        results (dict): {workflow_id: [run, ...]}, as returned by load_results.
+
+    Returns:
+        dict: {"evaluation": summary, "workflows": {workflow_id: {**summary, "steps":
+        {step_id: {"step_title", **summary}}}}}, where a summary holds call and
+        error counts, n/total/mean/p50/p95 of every CALL_METRIC_FIELDS entry,
+        the share of calls served from the cache and, for whole workflows, the
+        runs' wall-clock durations. Runs recorded without metrics count as calls only.
+    """
+    workflow_codes, step_keys = [], {}
+    step_codes, fields = [], {field: [] for field in CALL_METRIC_FIELDS}
+    errors, wall = [], {}
+    for workflow_id, runs in results.items():
+        for run in runs or []:
+            output = run.get("output")
+            wall_seconds = (run.get("metrics") or {}).get("wall_seconds")
+            if wall_seconds is not None:
+                wall.setdefault(workflow_id, []).append(wall_seconds)
+            for step in output if isinstance(output, list) else []:
+                step_code = step_keys.setdefault((workflow_id, step.get("step_id")), (len(step_keys), step.get("step_title")))[0]
+                for call in step.get("calls", []):
+                    metrics = call.get("metrics") or {}
+                    workflow_codes.append(workflow_id)
+                    step_codes.append(step_code)
+                    errors.append(bool(call.get("error")))
+                    for field in CALL_METRIC_FIELDS:
+                        value = metrics.get(field)
+                        fields[field].append(np.nan if value is None else value)
+
+    columns = {field: np.asarray(values, dtype=float) for field, values in fields.items()}
+    columns["error"] = np.asarray(errors, dtype=bool)
+    step_codes = np.asarray(step_codes, dtype=np.intp)
+    workflow_codes = np.asarray(workflow_codes, dtype=object)
+
+    all_wall = np.asarray([seconds for values in wall.values() for seconds in values], dtype=float)
+    summary = {"evaluation": _group_summary(np.arange(len(step_codes)), columns, all_wall), "workflows": {}}
+    for workflow_id in results:
+        rows = np.flatnonzero(workflow_codes == workflow_id)
+        workflow_summary = _group_summary(rows, columns, np.asarray(wall.get(workflow_id, []), dtype=float))
+        workflow_summary["steps"] = {
+            step_id: {"step_title": step_title, **_group_summary(np.flatnonzero(step_codes == step_code), columns)}
+            for (wf_id, step_id), (step_code, step_title) in step_keys.items() if wf_id == workflow_id
+        }
+        summary["workflows"][workflow_id] = workflow_summary
+    return summary
+
+
 def evaluate_outputs(all_outputs):
     """
     Evaluate the LLM outputs using custom metrics.
-    For demonstration, we measure length. 
-    Returns p_value and CI as placeholders if you have real stats later.
+    For demonstration, we measure length. The summary carries a bootstrap
+    confidence interval of the average length; per-call p_value and
+    confidence_interval stay None, since a single call has no distribution.
     """
     evaluations = []
     for step_result in all_outputs:
@@ -12,15 +400,17 @@ def evaluate_outputs(all_outputs):
             "call_id": step_result["call_id"],
             "model_name": step_result["model_name"],
             "score_length": length_score,
-            # Placeholder stats
             "p_value": None,
             "confidence_interval": None
         })
 
-    average_length = sum(e["score_length"] for e in evaluations) / len(evaluations) if evaluations else 0
+    lengths = np.array([e["score_length"] for e in evaluations], dtype=float)
+    average_length = float(lengths.mean()) if len(lengths) else 0
+    low, high = bootstrap_ci(lengths)
     return {
         "evaluation_details": evaluations,
         "summary": {
-            "average_response_length": average_length
+            "average_response_length": average_length,
+            "confidence_interval": [low, high] if low is not None else None
         }
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,202 @@
+# modules/evaluation_scheduler.py
+
+import os
+import threading
+import concurrent.futures
+
+DEFAULT_MAX_WORKERS = int(os.getenv("EVAL_MAX_WORKERS", "4"))
+DEFAULT_MODEL_CONCURRENCY = int(os.getenv("EVAL_MODEL_CONCURRENCY", "0"))  # 0 = bounded only by the pool
+
+
+def parse_model_limits(spec):
+    """
+    Parses per-model concurrency limits from a "model=2,other-model=4" string.
+    """
+    limits = {}
+    if not spec:
+        return limits
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, value = item.split("=", 1)
+        try:
+            limits[name.strip()] = int(value)
+        except ValueError:
+            continue
+    return limits
+
+
+DEFAULT_MODEL_LIMITS = parse_model_limits(os.getenv("EVAL_MODEL_LIMITS", ""))
+
+
+def _positive_int(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+def validate_scheduler_options(max_workers=None, model_limits=None):
+    """
+    Checks scheduler options given by a client before they are queued.
+
+    Args:
+        max_workers: None or a positive int.
+        model_limits: None, a {model: positive int} dict or a "model=2,other=4" string.
+
+    Returns:
+        tuple: (max_workers, model_limits), the limits as a dict (or None).
+
+    Raises:
+        ValueError: If an option is malformed.
+    """
+    if max_workers is not None and not _positive_int(max_workers):
+        raise ValueError("max_workers must be a positive integer.")
+    if model_limits is None:
+        return max_workers, None
+    if isinstance(model_limits, str):
+        items = [item for item in model_limits.split(",") if item.strip()]
+        parsed = parse_model_limits(model_limits)
+        if len(parsed) != len(items):
+            raise ValueError("model_limits must look like \"model=2,other-model=4\".")
+        model_limits = parsed
+    if not isinstance(model_limits, dict):
+        raise ValueError("model_limits must be an object of model name to limit, or a \"model=2\" string.")
+    for name, limit in model_limits.items():
+        if not name or not _positive_int(limit):
+            raise ValueError(f"The limit of model '{name}' must be a positive integer.")
+    return max_workers, model_limits
+
+
+def workflow_models(workflow):
+    """Returns the sorted set of model names used by the calls of a workflow dict."""
+    models = set()
+    for step in workflow.get("steps", []):
+        for call in step.get("calls", []):
+            if call.get("model_name"):
+                models.add(call["model_name"])
+    return sorted(models)
+
+
+def plan_pending_runs(project_data, evaluation, results=None):
+    """
+    Lists every workflow x variable set x iteration that still has to run.
+
+    Runs whose run_index is already recorded in the results (by default
+    evaluation["results"]) are skipped, so an interrupted evaluation resumes
+    where it left off. The returned list is in deterministic
+    (workflow, variable set, run) order.
+    """
+    if results is None:
+        results = evaluation.get("results", {})
+    common_vars = project_data.get("common_variable_names", [])
+    pending = []
+
+    for wf in project_data.get("workflows", []):
+        wf_id = wf["workflow_id"]
+        models = workflow_models(wf)
+        wf_results = results.get(wf_id, [])
+
+        for var_set_id, vset in evaluation.get("variable_sets", {}).items():
+            done = {
+                r.get("run_index") for r in wf_results if r.get("variable_set_id") == var_set_id
+            }
+            num_runs = vset.get("num_runs", 1)
+
+            # Merge common variables with the specific variable set
+            input_vars = vset.get("variables", {})
+            variables_for_run = {var_name: input_vars.get(var_name, "") for var_name in common_vars}
+
+            for run_index in range(num_runs):
+                if run_index in done:
+                    continue
+                pending.append({
+                    "workflow": wf,
+                    "workflow_id": wf_id,
+                    "variable_set_id": var_set_id,
+                    "run_index": run_index,
+                    "num_runs": num_runs,
+                    "variables": variables_for_run,
+                    "ideal_output": vset.get("ideal_output", ""),
+                    "models": models
+                })
+    return pending
+
+
+class EvaluationScheduler:
+    """
+    Fans independent evaluation runs out over a bounded thread pool.
+
+    Each run holds a slot on every model its workflow uses, so a model with a
+    concurrency limit never sees more in-flight runs than allowed, whatever
+    the pool size. Results are reported through a callback that is invoked
+    one at a time, so callers can update and persist shared state safely.
+    """
+
+    def __init__(self, run_fn, max_workers=None, model_limits=None, default_model_limit=None):
+        self.run_fn = run_fn
+        self.max_workers = max(1, int(max_workers or DEFAULT_MAX_WORKERS))
+        self.model_limits = {**DEFAULT_MODEL_LIMITS, **(model_limits or {})}
+        self.default_model_limit = DEFAULT_MODEL_CONCURRENCY if default_model_limit is None else default_model_limit
+
+        self._semaphores = {}
+        self._semaphores_lock = threading.Lock()
+        self._result_lock = threading.Lock()
+
+    def _semaphore_for(self, model_name):
+        with self._semaphores_lock:
+            if model_name not in self._semaphores:
+                limit = self.model_limits.get(model_name, self.default_model_limit)
+                self._semaphores[model_name] = threading.BoundedSemaphore(limit) if limit and limit > 0 else None
+            return self._semaphores[model_name]
+
+    def _execute(self, run, on_result):
+        # Acquire model slots in sorted order so two runs can never deadlock
+        held = []
+        try:
+            for model_name in run.get("models", []):
+                semaphore = self._semaphore_for(model_name)
+                if semaphore is not None:
+                    semaphore.acquire()
+                    held.append(semaphore)
+            result = self.run_fn(run)
+        finally:
+            for semaphore in reversed(held):
+                semaphore.release()
+
+        if on_result is not None:
+            with self._result_lock:
+                on_result(run, result)
+        return result
+
+    def run(self, runs, on_result=None):
+        """
+        Executes the given runs and blocks until all of them have finished.
+
+        Args:
+            runs (list): Run descriptions as produced by plan_pending_runs().
+            on_result (callable): Called as on_result(run, result) after each run.
+
+        Returns:
+            list: The results, in the same order as `runs`.
+
+        Raises:
+            Exception: The first error raised by a run. Runs that have not
+            started yet are cancelled; runs already in flight are allowed to finish.
+        """
+        if not runs:
+            return []
+
+        workers = min(self.max_workers, len(runs))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="eval-run") as pool:
+            futures = [pool.submit(self._execute, run, on_result) for run in runs]
+            first_error = None
+            for future in concurrent.futures.as_completed(futures):
+                if future.cancelled():
+                    continue
+                error = future.exception()
+                if error is not None and first_error is None:
+                    first_error = error
+                    for pending in futures:
+                        pending.cancel()
+
+        if first_error is not None:
+            raise first_error
+        return [future.result() for future in futures]
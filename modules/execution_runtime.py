@@ -0,0 +1,158 @@
+# modules/execution_runtime.py
+
+import os
+import time
+import atexit
+import asyncio
+import threading
+import contextlib
+import concurrent.futures
+
+from .evaluation_scheduler import parse_model_limits
+from .rate_limiter import PrioritySemaphore
+
+RUNTIME_CALL_WORKERS = int(os.getenv("RUNTIME_CALL_WORKERS", "32"))
+# Max in-flight calls per provider, e.g. "huggingface=8,groq=16"; unlisted providers use the default
+RUNTIME_PROVIDER_LIMITS = parse_model_limits(os.getenv("RUNTIME_PROVIDER_LIMITS", ""))
+RUNTIME_DEFAULT_PROVIDER_LIMIT = int(os.getenv("RUNTIME_DEFAULT_PROVIDER_LIMIT", "0"))  # 0 = bounded only by the pool
+RUNTIME_SHUTDOWN_TIMEOUT = float(os.getenv("RUNTIME_SHUTDOWN_TIMEOUT", "30"))
+
+
+class ExecutionRuntime:
+    """
+    Application-wide home for workflow execution: one event loop running on a
+    dedicated thread, plus a fixed-size thread pool for the blocking LLM and
+    function calls.
+
+    Every workflow run submits its coroutine to the same loop, so no run
+    creates its own loop or pool, and the number of call threads stays
+    bounded however many runs are in flight. Async provider requests are
+    awaited on the loop itself and need no thread at all. Calls can
+    additionally be limited per provider. Calls waiting for a provider slot or
+    a pool thread are served in request priority order (see rate_limiter).
+    """
+
+    def __init__(self, call_workers=RUNTIME_CALL_WORKERS, provider_limits=None,
+                 default_provider_limit=RUNTIME_DEFAULT_PROVIDER_LIMIT):
+        self.call_workers = max(1, int(call_workers))
+        self.provider_limits = {**RUNTIME_PROVIDER_LIMITS, **(provider_limits or {})}
+        self.default_provider_limit = default_provider_limit
+
+        self.loop = asyncio.new_event_loop()
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.call_workers, thread_name_prefix="runtime-call"
+        )
+        self._semaphores = {}  # Only touched from the loop thread
+        self._pool_slots = PrioritySemaphore(self.call_workers)
+        self._state_lock = threading.Lock()
+        self._pending = set()
+        self._closed = False
+        self.calls_in_flight = 0
+
+        self._thread = threading.Thread(target=self._run_loop, name="runtime-loop", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _semaphore_for(self, limit_key):
+        if limit_key not in self._semaphores:
+            limit = self.provider_limits.get(limit_key, self.default_provider_limit)
+            self._semaphores[limit_key] = PrioritySemaphore(limit) if limit and limit > 0 else None
+        return self._semaphores[limit_key]
+
+    @contextlib.asynccontextmanager
+    async def limit(self, limit_key):
+        """Holds a slot of `limit_key`'s concurrency limit (typically the provider name)."""
+        semaphore = self._semaphore_for(limit_key) if limit_key else None
+        if semaphore is not None:
+            await semaphore.acquire()
+        self.calls_in_flight += 1
+        try:
+            yield
+        finally:
+            self.calls_in_flight -= 1
+            if semaphore is not None:
+                semaphore.release()
+
+    async def run_blocking(self, fn, *args, limit_key=None):
+        """Runs fn(*args) on the call pool within `limit_key`'s concurrency limit."""
+        async with self.limit(limit_key):
+            return await self.run_in_pool(fn, *args)
+
+    async def run_in_pool(self, fn, *args):
+        """Runs fn(*args) on the call pool, queueing by priority while every thread is busy."""
+        async with self._pool_slots:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def submit(self, coro):
+        """Schedules a coroutine on the runtime loop and returns a concurrent.futures.Future."""
+        with self._state_lock:
+            if self._closed:
+                coro.close()
+                raise RuntimeError("The execution runtime has been shut down.")
+            future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+            self._pending.add(future)
+        future.add_done_callback(self._forget)
+        return future
+
+    def _forget(self, future):
+        with self._state_lock:
+            self._pending.discard(future)
+
+    def run(self, coro):
+        """Runs a coroutine on the runtime loop and blocks the calling thread until it finishes."""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("ExecutionRuntime.run() cannot be called from the runtime loop itself.")
+        return self.submit(coro).result()
+
+    def stats(self):
+        with self._state_lock:
+            runs = len(self._pending)
+        return {
+            "runs_in_flight": runs,
+            "calls_in_flight": self.calls_in_flight,
+            "call_workers": self.call_workers,
+            "provider_limits": self.provider_limits,
+            "default_provider_limit": self.default_provider_limit,
+            "closed": self._closed
+        }
+
+    def shutdown(self, timeout=RUNTIME_SHUTDOWN_TIMEOUT):
+        """
+        Stops accepting new runs, gives in-flight runs up to `timeout` seconds
+        to finish, cancels whatever is left and stops the loop and the pool.
+        """
+        with self._state_lock:
+            if self._closed:
+                return
+            self._closed = True
+            pending = list(self._pending)
+
+        deadline = time.monotonic() + timeout
+        for future in pending:
+            remaining = deadline - time.monotonic()
+            try:
+                future.result(timeout=max(0.0, remaining))
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+            except BaseException:
+                pass
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_RUNTIME = None
+_RUNTIME_LOCK = threading.Lock()
+
+
+def get_runtime():
+    global _RUNTIME
+    with _RUNTIME_LOCK:
+        if _RUNTIME is None:
+            _RUNTIME = ExecutionRuntime()
+            atexit.register(_RUNTIME.shutdown)
+        return _RUNTIME
@@ -1,13 +1,40 @@
 # modules/function_executor.py
+import os
+import hashlib
+import operator
+import threading
+from collections import OrderedDict
+
 import RestrictedPython
 from RestrictedPython import compile_restricted
 from RestrictedPython.Guards import safe_builtins
 
+FUNCTION_CODE_CACHE_SIZE = int(os.getenv("FUNCTION_CODE_CACHE_SIZE", "256"))
+
+_INPLACE_OPERATORS = {
+    '+=': operator.iadd, '-=': operator.isub, '*=': operator.imul, '/=': operator.itruediv,
+    '//=': operator.ifloordiv, '%=': operator.imod, '**=': operator.ipow,
+    '|=': operator.ior, '&=': operator.iand, '^=': operator.ixor
+}
+
+
+def _inplacevar(op, x, y):
+    """Augmented assignment (`total += x`) for restricted code."""
+    if op not in _INPLACE_OPERATORS:
+        raise FunctionExecutionError(f"Operator not allowed: {op}")
+    return _INPLACE_OPERATORS[op](x, y)
+
+
 ALLOWED_BUILTINS = {
     '__builtins__': {
         **safe_builtins,
         '_getiter_': RestrictedPython.Eval.default_guarded_getiter,
+        '_getitem_': RestrictedPython.Eval.default_guarded_getitem,
         '_getattr_': RestrictedPython.Guards.safer_getattr,
+        '_write_': RestrictedPython.Guards.full_write_guard,
+        '_iter_unpack_sequence_': RestrictedPython.Guards.guarded_iter_unpack_sequence,
+        '_unpack_sequence_': RestrictedPython.Guards.guarded_unpack_sequence,
+        '_inplacevar_': _inplacevar,
         'str': str,
         'int': int,
         'float': float,
@@ -24,6 +51,43 @@ class FunctionExecutionError(Exception):
     """Custom exception for errors during function execution."""
     pass
 
+
+# Restricted bytecode per sha256 of the source, so a function that runs on every
+# evaluation iteration is only compiled once
+_compiled_code = OrderedDict()
+_compiled_code_lock = threading.Lock()
+
+
+def code_hash(code_string):
+    return hashlib.sha256(code_string.encode("utf-8")).hexdigest()
+
+
+def compile_function(code_string):
+    """
+    Returns the restricted bytecode for code_string, compiling it on first use.
+
+    Raises:
+        FunctionExecutionError: If the code does not compile or uses forbidden constructs.
+    """
+    key = code_hash(code_string)
+    with _compiled_code_lock:
+        byte_code = _compiled_code.get(key)
+        if byte_code is not None:
+            _compiled_code.move_to_end(key)
+            return byte_code
+
+    try:
+        byte_code = compile_restricted(code_string, '<inline>', 'exec')
+    except SyntaxError as e:
+        raise FunctionExecutionError(f"Syntax error in function code: {e}")
+
+    with _compiled_code_lock:
+        _compiled_code[key] = byte_code
+        while len(_compiled_code) > FUNCTION_CODE_CACHE_SIZE:
+            _compiled_code.popitem(last=False)
+    return byte_code
+
+
 def execute_function(code_string, input_values, allowed_modules=None):
     """
     Executes Python code in a restricted environment using RestrictedPython.
@@ -39,13 +103,13 @@ def execute_function(code_string, input_values, allowed_modules=None):
     Raises:
         FunctionExecutionError: If there's an error during code compilation or execution.
     """
-    try:
-        # Compile the code with restrictions
-        byte_code = compile_restricted(code_string, '<inline>', 'exec')
+    # Compile the code with restrictions (cached per code hash)
+    byte_code = compile_function(code_string)
 
-        # Create a restricted globals dictionary
-        restricted_globals = {}
-        restricted_globals.update(ALLOWED_BUILTINS)
+    try:
+        # Create a restricted globals dictionary; the builtins are copied so that
+        # allowed modules do not leak into other executions
+        restricted_globals = {'__builtins__': dict(ALLOWED_BUILTINS['__builtins__'])}
 
         # Add allowed modules if any
         if allowed_modules:
@@ -64,9 +128,9 @@ def execute_function(code_string, input_values, allowed_modules=None):
 
         return local_vars.get("return_value")
 
-    except SyntaxError as e:
-        raise FunctionExecutionError(f"Syntax error in function code: {e}")
-    except RestrictedPython.Errors.RestrictionError as e:
-        raise FunctionExecutionError(f"Forbidden operation in function code: {e}")
+    except FunctionExecutionError:
+        raise
+    except MemoryError:
+        raise FunctionExecutionError("Function exceeded the memory limit.")
     except Exception as e:
-        raise FunctionExecutionError(f"Error executing function: {e}")
\ No newline at end of file
+        raise FunctionExecutionError(f"Error executing function: {e}")
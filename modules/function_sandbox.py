@@ -0,0 +1,263 @@
+# modules/function_sandbox.py
+"""
+Warm pool of worker processes that run workflow functions out of the web process.
+
+Each worker is a separate interpreter (started with `python -m modules.function_sandbox`)
+with an address-space limit, so CPU-bound or runaway user code cannot hold the
+GIL of the request threads or exhaust the server's memory. Calls that exceed
+their wall-clock timeout get their worker killed and replaced.
+"""
+
+import os
+import sys
+import queue
+import atexit
+import threading
+import subprocess
+import concurrent.futures
+from multiprocessing.connection import Connection
+
+from .function_executor import FunctionExecutionError, compile_function, execute_function
+
+# 0 workers runs functions in-process, as before the sandbox existed
+FUNCTION_SANDBOX_WORKERS = int(os.getenv("FUNCTION_SANDBOX_WORKERS", str(min(4, os.cpu_count() or 1))))
+FUNCTION_TIMEOUT_SECONDS = float(os.getenv("FUNCTION_TIMEOUT_SECONDS", "5"))
+FUNCTION_MEMORY_LIMIT_MB = int(os.getenv("FUNCTION_MEMORY_LIMIT_MB", "512"))  # 0 = unlimited
+FUNCTION_MAX_TASKS_PER_WORKER = int(os.getenv("FUNCTION_MAX_TASKS_PER_WORKER", "1000"))  # Recycle after this many calls
+
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _Worker:
+    """One sandbox process and the pipe pair used to talk to it."""
+
+    def __init__(self, memory_limit_mb):
+        to_worker_r, to_worker_w = os.pipe()
+        from_worker_r, from_worker_w = os.pipe()
+
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [_PACKAGE_ROOT, env.get("PYTHONPATH")]))
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "modules.function_sandbox",
+             str(to_worker_r), str(from_worker_w), str(memory_limit_mb)],
+            pass_fds=(to_worker_r, from_worker_w),
+            env=env,
+            stdin=subprocess.DEVNULL
+        )
+        os.close(to_worker_r)
+        os.close(from_worker_w)
+        self.send_conn = Connection(to_worker_w, readable=False)
+        self.recv_conn = Connection(from_worker_r, writable=False)
+        self.tasks = 0
+
+    def call(self, request, timeout):
+        """Sends one request and waits for its reply; raises TimeoutError or EOFError."""
+        self.tasks += 1
+        self.send_conn.send(request)
+        if not self.recv_conn.poll(timeout):
+            raise TimeoutError()
+        return self.recv_conn.recv()
+
+    def stop(self):
+        for conn in (self.send_conn, self.recv_conn):
+            try:
+                conn.close()
+            except OSError:
+                pass
+        if self.process.poll() is None:
+            self.process.kill()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+
+
+class SandboxPool:
+    """
+    Fixed-size pool of warm sandbox workers.
+
+    Args:
+        size (int): Number of worker processes.
+        timeout (float): Default wall-clock limit per function call, in seconds.
+        memory_limit_mb (int): Address-space limit of each worker (RLIMIT_AS); 0 disables it.
+        max_tasks_per_worker (int): Workers are replaced after this many calls.
+    """
+
+    def __init__(self, size=FUNCTION_SANDBOX_WORKERS, timeout=FUNCTION_TIMEOUT_SECONDS,
+                 memory_limit_mb=FUNCTION_MEMORY_LIMIT_MB, max_tasks_per_worker=FUNCTION_MAX_TASKS_PER_WORKER):
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks_per_worker = max_tasks_per_worker
+
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._batch_executor = None
+        self.respawns = 0
+        self.timeouts = 0
+        for _ in range(self.size):
+            self._idle.put(_Worker(self.memory_limit_mb))
+
+    def _replace(self, worker):
+        worker.stop()
+        with self._lock:
+            self.respawns += 1
+            closed = self._closed
+        if not closed:
+            self._idle.put(_Worker(self.memory_limit_mb))
+
+    def run(self, code_string, input_values, allowed_modules=None, timeout=None):
+        """
+        Runs a function in a sandbox worker and returns its 'return_value'.
+
+        Raises:
+            FunctionExecutionError: On compile or runtime errors, timeouts and worker crashes.
+        """
+        # Fail fast on code that does not compile (cached per code hash)
+        compile_function(code_string)
+        timeout = self.timeout if timeout is None else timeout
+
+        worker = self._idle.get()
+        try:
+            status, payload = worker.call((code_string, input_values, allowed_modules), timeout)
+        except TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            self._replace(worker)
+            raise FunctionExecutionError(f"Function timed out after {timeout} seconds.")
+        except (EOFError, OSError):
+            self._replace(worker)
+            raise FunctionExecutionError("Function worker exited unexpectedly (memory limit exceeded?).")
+        except Exception as e:
+            # Unpicklable inputs leave the worker untouched
+            self._idle.put(worker)
+            raise FunctionExecutionError(f"Error executing function: {e}")
+
+        if self.max_tasks_per_worker and worker.tasks >= self.max_tasks_per_worker:
+            self._replace(worker)
+        else:
+            self._idle.put(worker)
+
+        if status == "error":
+            raise FunctionExecutionError(payload)
+        return payload
+
+    def run_batch(self, calls, timeout=None):
+        """
+        Runs many functions across all workers at once.
+
+        Args:
+            calls (list): (code_string, input_values) tuples.
+
+        Returns:
+            list: One entry per call, in order: the return value, or the
+            FunctionExecutionError raised for that call.
+        """
+        with self._lock:
+            if self._batch_executor is None:
+                self._batch_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.size, thread_name_prefix="function-sandbox"
+                )
+            executor = self._batch_executor
+
+        futures = [executor.submit(self.run, code, inputs, None, timeout) for code, inputs in calls]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except FunctionExecutionError as e:
+                results.append(e)
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.size,
+                "idle": self._idle.qsize(),
+                "respawns": self.respawns,
+                "timeouts": self.timeouts,
+                "timeout_seconds": self.timeout,
+                "memory_limit_mb": self.memory_limit_mb
+            }
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            executor, self._batch_executor = self._batch_executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def sandbox_enabled():
+    return FUNCTION_SANDBOX_WORKERS > 0 and os.name == "posix"
+
+
+def get_sandbox_pool():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = SandboxPool()
+            atexit.register(_POOL.shutdown)
+        return _POOL
+
+
+def run_function(code_string, input_values, allowed_modules=None, timeout=None):
+    """
+    Runs a workflow function in the sandbox pool, or in-process when the pool is disabled.
+    """
+    if not sandbox_enabled():
+        return execute_function(code_string, input_values, allowed_modules)
+    return get_sandbox_pool().run(code_string, input_values, allowed_modules, timeout)
+
+
+def run_functions(calls, timeout=None):
+    """Batch form of run_function(); see SandboxPool.run_batch()."""
+    if not sandbox_enabled():
+        results = []
+        for code_string, input_values in calls:
+            try:
+                results.append(execute_function(code_string, input_values))
+            except FunctionExecutionError as e:
+                results.append(e)
+        return results
+    return get_sandbox_pool().run_batch(calls, timeout)
+
+
+def _worker_main(recv_fd, send_fd, memory_limit_mb):
+    if memory_limit_mb > 0:
+        import resource
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    recv_conn = Connection(recv_fd, writable=False)
+    send_conn = Connection(send_fd, readable=False)
+    while True:
+        try:
+            code_string, input_values, allowed_modules = recv_conn.recv()
+        except EOFError:
+            return
+        try:
+            reply = ("ok", execute_function(code_string, input_values, allowed_modules))
+        except FunctionExecutionError as e:
+            reply = ("error", str(e))
+        except MemoryError:
+            reply = ("error", "Function exceeded the memory limit.")
+        try:
+            send_conn.send(reply)
+        except Exception as e:
+            # e.g. a return value that cannot be pickled
+            send_conn.send(("error", f"Function returned a value that cannot be transferred: {e}"))
+
+
+if __name__ == "__main__":
+    _worker_main(int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]))
@@ -1,9 +1,10 @@
 # modules/graph_generator.py
 
-import re
 import string
 import itertools
 
+from .prompt_templates import compile_template
+
 def assign_letters(items, start_index=0):
     """
     Assigns letters to items starting from a given index.
@@ -25,28 +26,17 @@ def find_variables_in_content(content, variables_set):
     Finds variables enclosed in {{ }} within the content.
     Returns a set of variable names that are used.
     """
-    pattern = r"\{\{([^}]+)\}\}"
-    matches = re.findall(pattern, content)
-    found_vars = set()
-    for match in matches:
-        var = match.split("[")[0].split(".")[0].strip()
-        if var in variables_set:
-            found_vars.add(var)
-    return found_vars
+    return {var for var in compile_template(content).variables if var in variables_set}
 
 def find_variable_usages(content, variable_names):
     """
     Finds variable usages within {{ }} in the content.
     Returns a list of tuples (variable, path) where path can be empty or something like ['other_notes']
     """
-    pattern = r"\{\{([^}]+)\}\}"
-    matches = re.findall(pattern, content)
     usages = []
-    for match in matches:
-        var = match.split("[")[0].split(".")[0].strip()
-        path = match[len(var):].strip()
-        if var in variable_names:
-            usages.append((var, path))
+    for ref in compile_template(content).references:
+        if ref.name in variable_names:
+            usages.append((ref.name, ref.expr[len(ref.name):].strip()))
     return usages
 
 def json_to_mermaid(json_data):
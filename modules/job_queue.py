@@ -0,0 +1,354 @@
+# modules/job_queue.py
+
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import threading
+
+from .storage import PROJECTS_DIR
+
+JOBS_DB_PATH = os.path.join(PROJECTS_DIR, "jobs.sqlite3")
+# Finished jobs are deleted after this many seconds (0 = keep them forever)
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+JOB_PRUNE_INTERVAL_SECONDS = float(os.getenv("JOB_PRUNE_INTERVAL_SECONDS", "3600"))
+# Larger results are not stored; the job completes with an error saying so (0 = no limit)
+JOB_RESULT_MAX_BYTES = int(os.getenv("JOB_RESULT_MAX_BYTES", str(5 * 1024 * 1024)))
+
+ACTIVE_STATUSES = ("queued", "running")
+FINISHED_STATUSES = ("completed", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    project_id TEXT,
+    target_id TEXT,
+    payload TEXT,
+    status TEXT NOT NULL,
+    owner_pid INTEGER,
+    total INTEGER DEFAULT 0,
+    completed INTEGER DEFAULT 0,
+    baseline INTEGER DEFAULT 0,
+    message TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL,
+    started_at REAL,
+    updated_at REAL,
+    finished_at REAL
+)
+"""
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class JobProgress:
+    """Handed to job handlers so they can report completed/total counts."""
+
+    def __init__(self, job_queue, job_id):
+        self._job_queue = job_queue
+        self.job_id = job_id
+        self.total = 0
+        self.completed = 0
+        self._lock = threading.Lock()
+
+    def set_total(self, total, completed=0):
+        """
+        Sets the amount of work for this job. `completed` is work that was already
+        done before this attempt (e.g. runs saved before a restart); it counts toward
+        progress but not toward throughput.
+        """
+        with self._lock:
+            self.total = total
+            self.completed = completed
+            self._job_queue._update(self.job_id, total=total, completed=completed, baseline=completed)
+
+    def advance(self, amount=1, message=None):
+        with self._lock:
+            self.completed += amount
+            self._job_queue._update(self.job_id, completed=self.completed, message=message)
+
+
+class JobQueue:
+    """
+    A small SQLite-backed job queue processed by in-process worker threads.
+
+    Jobs are persisted before they run, so a restarted process picks up anything
+    that was queued or left running by a dead process. Handlers are expected to be
+    resumable: they are simply invoked again with the same payload.
+
+    Each job kind runs in a lane, a FIFO queue with its own worker threads, so
+    short interactive jobs need not wait behind long ones in the "default" lane.
+
+    Finished jobs are pruned after retention_seconds, and results larger than
+    result_max_bytes are not stored.
+    """
+
+    def __init__(self, db_path=JOBS_DB_PATH, num_workers=1, lanes=None,
+                 retention_seconds=JOB_RETENTION_SECONDS, result_max_bytes=JOB_RESULT_MAX_BYTES):
+        """
+        Args:
+            db_path (str): SQLite database holding the jobs.
+            num_workers (int): Worker threads of the "default" lane.
+            lanes (dict): Optional {lane: worker count} of additional lanes.
+            retention_seconds (float): Age after which finished jobs are deleted; 0 keeps them.
+            result_max_bytes (int): Largest JSON result stored; 0 means no limit.
+        """
+        self.db_path = db_path
+        self.retention_seconds = retention_seconds
+        self.result_max_bytes = result_max_bytes
+        self._last_prune = 0.0
+        self.num_workers = max(1, int(num_workers))
+        self.lane_workers = {"default": self.num_workers}
+        self.lane_workers.update({lane: max(1, int(count)) for lane, count in (lanes or {}).items()})
+        self.handlers = {}
+        self._handler_lanes = {}
+
+        self._queues = {lane: queue.Queue() for lane in self.lane_workers}
+        self._local = threading.local()
+        self._start_lock = threading.Lock()
+        self._started = False
+        self._threads = []
+
+    # ---------- SQLite helpers ----------
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _update(self, job_id, **fields):
+        fields = {k: v for k, v in fields.items() if v is not None}
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        conn = self._conn()
+        with conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+    # ---------- Public API ----------
+
+    def register_handler(self, kind, handler, lane="default"):
+        """
+        Registers the function that runs jobs of the given kind, in the given lane.
+
+        The handler is called as handler(payload, progress) and returns a
+        JSON-serializable result.
+        """
+        if lane not in self._queues:
+            raise ValueError(f"Unknown job lane '{lane}'.")
+        self.handlers[kind] = handler
+        self._handler_lanes[kind] = lane
+
+    def _enqueue(self, job_id, kind):
+        self._queues[self._handler_lanes.get(kind, "default")].put(job_id)
+
+    def prune(self, max_age_seconds=None):
+        """Deletes jobs that finished more than max_age_seconds (default: retention_seconds) ago."""
+        max_age_seconds = self.retention_seconds if max_age_seconds is None else max_age_seconds
+        self._last_prune = time.time()
+        if not max_age_seconds or max_age_seconds <= 0:
+            return 0
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (*FINISHED_STATUSES, time.time() - max_age_seconds)
+            )
+        return cursor.rowcount
+
+    def _maybe_prune(self):
+        if time.time() - self._last_prune >= JOB_PRUNE_INTERVAL_SECONDS:
+            self.prune()
+
+    def delete_project_jobs(self, project_id):
+        """Deletes every job of a project (e.g. when it is removed); running jobs just find their row gone."""
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute("DELETE FROM jobs WHERE project_id = ?", (project_id,))
+        return cursor.rowcount
+
+    def start(self):
+        """Recovers unfinished jobs, prunes old ones and starts the worker threads (idempotent)."""
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+
+            self.prune()
+            conn = self._conn()
+            rows = conn.execute(
+                "SELECT job_id, kind, status, owner_pid FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                ACTIVE_STATUSES
+            ).fetchall()
+            for row in rows:
+                if row["status"] == "running" and _pid_alive(row["owner_pid"]) and row["owner_pid"] != os.getpid():
+                    continue  # Still owned by another live worker process
+                with conn:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'queued', owner_pid = NULL WHERE job_id = ?",
+                        (row["job_id"],)
+                    )
+                self._enqueue(row["job_id"], row["kind"])
+
+            for lane, count in self.lane_workers.items():
+                for i in range(count):
+                    thread = threading.Thread(
+                        target=self._worker_loop, args=(self._queues[lane],), name=f"job-worker-{lane}-{i}", daemon=True
+                    )
+                    thread.start()
+                    self._threads.append((lane, thread))
+
+    def submit(self, kind, payload, project_id=None, target_id=None):
+        """
+        Persists a new job and queues it for execution.
+
+        If a job of the same kind is already queued or running for the same target,
+        that job's id is returned instead of creating a duplicate.
+
+        Returns:
+            str: The job id.
+        """
+        self.start()
+        conn = self._conn()
+        if target_id is not None:
+            existing = conn.execute(
+                "SELECT job_id FROM jobs WHERE kind = ? AND project_id IS ? AND target_id = ? "
+                "AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                (kind, project_id, target_id, *ACTIVE_STATUSES)
+            ).fetchone()
+            if existing:
+                return existing["job_id"]
+
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, kind, project_id, target_id, payload, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, project_id, target_id, json.dumps(payload, ensure_ascii=False), now, now)
+            )
+        self._enqueue(job_id, kind)
+        return job_id
+
+    def get(self, job_id, include_result=True):
+        """
+        Returns the job's status and progress, including throughput (items/second)
+        and an ETA in seconds, or None if the job does not exist.
+        """
+        row = self._conn().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        now = time.time()
+        total = row["total"] or 0
+        completed = row["completed"] or 0
+        throughput = None
+        eta_seconds = None
+        if row["started_at"]:
+            end = row["finished_at"] or now
+            elapsed = max(end - row["started_at"], 1e-6)
+            done_this_attempt = completed - (row["baseline"] or 0)
+            if done_this_attempt > 0:
+                throughput = done_this_attempt / elapsed
+                if row["status"] == "running" and total:
+                    eta_seconds = max(total - completed, 0) / throughput
+
+        job = {
+            "job_id": row["job_id"],
+            "kind": row["kind"],
+            "project_id": row["project_id"],
+            "target_id": row["target_id"],
+            "status": row["status"],
+            "total": total,
+            "completed": completed,
+            "progress": (completed / total) if total else None,
+            "throughput": round(throughput, 4) if throughput is not None else None,
+            "eta_seconds": round(eta_seconds, 1) if eta_seconds is not None else None,
+            "message": row["message"],
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "updated_at": row["updated_at"],
+            "finished_at": row["finished_at"]
+        }
+        if include_result and row["result"] is not None:
+            job["result"] = json.loads(row["result"])
+        return job
+
+    def list_jobs(self, project_id=None, limit=50):
+        conn = self._conn()
+        if project_id is None:
+            rows = conn.execute("SELECT job_id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT job_id FROM jobs WHERE project_id = ? ORDER BY created_at DESC LIMIT ?",
+                (project_id, limit)
+            ).fetchall()
+        return [self.get(row["job_id"], include_result=False) for row in rows]
+
+    # ---------- Worker ----------
+
+    def _claim(self, job_id):
+        """Marks a queued job as running by this process; False if someone else got it."""
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'running', owner_pid = ?, started_at = ?, updated_at = ?, error = NULL "
+                "WHERE job_id = ? AND status = 'queued'",
+                (os.getpid(), now, now, job_id)
+            )
+        return cursor.rowcount == 1
+
+    def _worker_loop(self, jobs):
+        while True:
+            job_id = jobs.get()
+            if job_id is None:
+                break
+            if not self._claim(job_id):
+                continue
+
+            row = self._conn().execute("SELECT kind, payload FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            handler = self.handlers.get(row["kind"])
+            progress = JobProgress(self, job_id)
+            try:
+                if handler is None:
+                    raise RuntimeError(f"No handler registered for job kind '{row['kind']}'.")
+                result = handler(json.loads(row["payload"] or "{}"), progress)
+                encoded = json.dumps(result, ensure_ascii=False)
+                if self.result_max_bytes and len(encoded.encode("utf-8")) > self.result_max_bytes:
+                    self._update(
+                        job_id, status="completed", finished_at=time.time(),
+                        error=f"The result ({len(encoded.encode('utf-8'))} bytes) exceeds the "
+                              f"{self.result_max_bytes} bytes kept for job results and was not stored."
+                    )
+                else:
+                    self._update(job_id, status="completed", finished_at=time.time(), result=encoded)
+            except Exception as e:
+                self._update(job_id, status="failed", finished_at=time.time(), error=str(e))
+            self._maybe_prune()
+
+    def shutdown(self):
+        for lane, _ in self._threads:
+            self._queues[lane].put(None)
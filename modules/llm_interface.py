@@ -1,33 +1,151 @@
 # modules/llm_interface.py
 
-import requests
 import os
-from groq import Groq
-import transformers
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline, BitsAndBytesConfig
+import time
+import asyncio
+import threading
+import functools
 
-import torch.distributed as dist
+from .batch_engine import BatchingEngine
+from .model_manager import ModelManager, PRELOAD_MODELS
+from .execution_runtime import get_runtime
+from .llm_providers import (
+    GROQ_BASE_URL, OPENAI_BASE_URL, LLM_PROVIDERS, LLM_MODEL_ROUTES,
+    ProviderError, ProviderRegistry, OpenAICompatibleProvider, LocalCallableProvider,
+    build_messages, load_extra_providers, parse_model_routes
+)
+from .rate_limiter import (
+    LLM_TRANSIENT_RETRIES, get_rate_limiter, backoff_delay, is_transient, estimate_tokens
+)
+from .call_metrics import record, record_first_token, record_usage
 
-# Global cache for loaded models/pipelines
-LOADED_MODELS = {}
+# One batching engine per loaded model, so concurrent calls share forward passes
+BATCH_ENGINES = {}
+_BATCH_ENGINES_LOCK = threading.Lock()
 
+HF_MAX_BATCH_SIZE = int(os.getenv("HF_MAX_BATCH_SIZE", "8"))
+HF_BATCH_WAIT_MS = float(os.getenv("HF_BATCH_WAIT_MS", "20"))
+HF_MODELS_DIR = os.getenv("HF_MODELS_DIR", "/scratch/maxspad_root/maxspad0/jspagnol/hf_models")
 
-def generate_llm_response(model_name, combined_prompt, params):
+
+def build_provider_registry():
+    """
+    Local transformers models for "huggingface*" names, Groq for "groq*" names
+    and OpenAI for everything else, plus the LLM_PROVIDERS endpoints and
+    LLM_MODEL_ROUTES overrides.
+    """
+    registry = ProviderRegistry()
+    registry.register(LocalCallableProvider("huggingface", call_huggingface_transformers,
+                                            stream_fn=stream_huggingface_transformers))
+    registry.register(OpenAICompatibleProvider("groq", GROQ_BASE_URL, api_key_env="GROQ_API_KEY"))
+    registry.register(OpenAICompatibleProvider("openai", OPENAI_BASE_URL, api_key_env="OPENAI_API_KEY"), default=True)
+    for provider in load_extra_providers(LLM_PROVIDERS):
+        registry.register(provider)
+
+    for pattern, provider_name, remote_model in parse_model_routes(LLM_MODEL_ROUTES):
+        registry.add_route(pattern, provider_name, remote_model)
+    registry.add_route("huggingface", "huggingface")
+    registry.add_route("groq-llm", "groq", model_name_map("groq-llm"))
+    registry.add_route("groq", "groq")
+    return registry
+
+
+async def _collect_stream(provider, model, combined_prompt, params, on_token):
+    chunks = []
+    async for text in provider.astream(model, combined_prompt, params):
+        chunks.append(text)
+        on_token(text)
+    return {"content": "".join(chunks)}
+
+
+async def agenerate_llm_response(model_name, combined_prompt, params, on_token=None):
     """
     A generic function that calls the appropriate LLM provider.
     combined_prompt now can include:
        - 'system_prompt': str
        - 'conversation': list of { role: 'user'|'assistant', content: str }
+
+    Requests pass through the provider/model's adaptive rate limiter, and rate
+    limits, server errors and dropped connections are retried with jittered
+    exponential backoff (up to LLM_TRANSIENT_RETRIES times).
+
+    When on_token is given the response is streamed, and on_token(text) is
+    called with each chunk as it arrives. A stream that fails after emitting
+    text is not retried, since the text already shown cannot be taken back.
+
+    The rate-limiter wait, transient retries, first streamed token and token
+    usage are recorded in the current call's metrics (modules/call_metrics.py).
+
+    Raises:
+        ProviderError: If the provider request fails.
     """
-    if "huggingface" in model_name.lower():
-        return call_huggingface_transformers(combined_prompt, params)
+    provider, remote_model = PROVIDER_REGISTRY.resolve(model_name)
+    limiter = get_rate_limiter(provider.name, remote_model)
+    estimated_tokens = estimate_tokens(combined_prompt, params)
+
+    streamed = []
+    if on_token is not None:
+        user_on_token = on_token
+
+        def on_token(text):
+            if not streamed:
+                record_first_token()
+            streamed.append(len(text))
+            user_on_token(text)
+
+    attempt = 0
+    while True:
+        attempt += 1
+        queued = time.monotonic()
+        await limiter.acquire(estimated_tokens)
+        started = time.monotonic()
+        record("queue_wait_seconds", started - queued)
+        try:
+            if on_token is None:
+                result = await provider.agenerate(remote_model, combined_prompt, params)
+            else:
+                result = await _collect_stream(provider, remote_model, combined_prompt, params, on_token)
+        except ProviderError as e:
+            if e.status_code == 429:
+                limiter.record_rate_limited(e.retry_after)
+            if not is_transient(e) or attempt > LLM_TRANSIENT_RETRIES or streamed:
+                raise
+            record("transient_retries")
+            delay = backoff_delay(attempt, retry_after=e.retry_after)
+            print(f"{e} - retrying in {delay:.1f}s (attempt {attempt}/{LLM_TRANSIENT_RETRIES})")
+            await asyncio.sleep(delay)
+            continue
 
+        usage = result.get("usage") or {}
+        record_usage(usage)
+        limiter.record_success(time.monotonic() - started, estimated_tokens, usage.get("total_tokens"))
+        return result
+
+
+def generate_llm_response(model_name, combined_prompt, params):
+    """Blocking form of agenerate_llm_response(), run on the shared execution runtime."""
+    return get_runtime().run(agenerate_llm_response(model_name, combined_prompt, params))
+
+
+def provider_for_model(model_name):
+    """
+    Returns the name of the provider serving model_name, used to apply
+    per-provider concurrency limits.
+    """
+    try:
+        return PROVIDER_REGISTRY.resolve(model_name)[0].name
+    except ProviderError:
+        return "default"
+
+
+def load_model_pipeline(model_name):
+    """Loads a local model from HF_MODELS_DIR as a 4-bit text-generation pipeline (slow; see MODEL_MANAGER)."""
+    # Imported on first load: torch and transformers take seconds to import and most sessions never need them
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline, BitsAndBytesConfig
+
+    model_path = os.path.join(HF_MODELS_DIR, model_name)
 
-def get_loaded_model(model_path, model_name, params):
-    if model_name in LOADED_MODELS:
-        return LOADED_MODELS[model_name]
-    
     # Create an appropriate BitsAndBytesConfig to avoid deprecated parameters
     if model_name == "llama-3.3-70b-instruct-bnb-4bit-unsloth":
         quantization_config = BitsAndBytesConfig(
@@ -61,16 +179,66 @@ def get_loaded_model(model_path, model_name, params):
         tokenizer=tokenizer,
     )
 
-    LOADED_MODELS[model_name] = text_generation_pipeline
     return text_generation_pipeline
 
+
+def drop_batch_engine(model_name):
+    """Stops the batching engine of an evicted model (no call is using the model at that point)."""
+    with _BATCH_ENGINES_LOCK:
+        engine = BATCH_ENGINES.pop(model_name, None)
+    if engine is not None:
+        engine.shutdown(wait=False)
+
+
+def preload_models(model_names=None):
+    """
+    Starts loading models (names as used in calls, e.g. "huggingface_phi-4";
+    default: PRELOAD_MODELS) in the background.
+    """
+    if model_names is None:
+        model_names = [name.strip() for name in PRELOAD_MODELS.split(",")]
+    MODEL_MANAGER.preload([model_name_map(name) for name in model_names if name])
+
+
+def model_status():
+    return MODEL_MANAGER.status()
+
+
+def get_batch_engine(model_name, text_generation_pipeline):
+    """
+    Returns the batching engine for a loaded model, creating it on first use.
+    """
+    with _BATCH_ENGINES_LOCK:
+        engine = BATCH_ENGINES.get(model_name)
+        if engine is None:
+            engine = BatchingEngine(
+                text_generation_pipeline,
+                max_batch_size=HF_MAX_BATCH_SIZE,
+                max_wait_ms=HF_BATCH_WAIT_MS,
+                name=f"batch-{model_name}"
+            )
+            BATCH_ENGINES[model_name] = engine
+        return engine
+
+def count_tokens(tokenizer, messages, response):
+    """
+    Provider-style usage for a local generation: the chat prompt's tokens and
+    the response's tokens. Returns {} when the tokenizer cannot count them.
+    """
+    try:
+        prompt_tokens = len(tokenizer.apply_chat_template(messages, tokenize=True, add_generation_prompt=True))
+        completion_tokens = len(tokenizer.encode(response, add_special_tokens=False))
+    except Exception:
+        return {}
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+
 def call_huggingface_transformers(combined_prompt, params):
-    # Map the model name and create the model path
     model_name = model_name_map(params.get("model_name", "phi-4"))
-    model_path = f"/scratch/maxspad_root/maxspad0/jspagnol/hf_models/{model_name}"
-    
-    # Get cached pipeline (loads from disk only the first time)
-    text_generation_pipeline = get_loaded_model(model_path, model_name, params)
 
     # Prepare prompts from combined_prompt
     system_prompt = combined_prompt.get('system_prompt', '').strip()
@@ -87,21 +255,71 @@ def call_huggingface_transformers(combined_prompt, params):
     if user_prompt:
         messages.append({"role": "user", "content": user_prompt})
 
-    # Generate the response
-    outputs = text_generation_pipeline(
-        messages,
-        temperature=params.get("temperature", 0.0),
-        max_new_tokens=params.get("max_tokens", 8000),
-        top_p=params.get("top_p", 1.0)
-    )
-    print(outputs)
+    # Generate the response; concurrent calls for the same model are batched together.
+    # The model cannot be evicted while the call holds it (loads from disk only the first time).
+    stats = {}
+    with MODEL_MANAGER.use(model_name) as text_generation_pipeline:
+        engine = get_batch_engine(model_name, text_generation_pipeline)
+        outputs = engine.generate(messages, {
+            "temperature": params.get("temperature", 0.0),
+            "max_new_tokens": params.get("max_tokens", 8000),
+            "top_p": params.get("top_p", 1.0)
+        }, stats=stats)
+    # Time waiting for a batch slot and on the model, for the current call's metrics
+    record("queue_wait_seconds", stats.get("queue_wait_seconds", 0.0))
+    record("generation_seconds", stats.get("generation_seconds", 0.0))
 
     # Depending on your pipeline output structure, adjust extraction of the response.
     response = outputs[0]["generated_text"][-1]["content"]
+    return {
+        "content": response,
+        "usage": count_tokens(text_generation_pipeline.tokenizer, messages, response)
+    }
+
+@functools.lru_cache(maxsize=None)
+def _callback_streamer_class():
+    from transformers import TextStreamer
+
+    class CallbackStreamer(TextStreamer):
+        """Hands each piece of decoded text to a callback as generate() produces it."""
+
+        def __init__(self, tokenizer, on_token):
+            super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+            self.on_token = on_token
+
+        def on_finalized_text(self, text, stream_end=False):
+            if text:
+                self.on_token(text)
+
+    return CallbackStreamer
+
+
+def stream_huggingface_transformers(combined_prompt, params, on_token):
+    """
+    Streaming form of call_huggingface_transformers(). Streamed requests are
+    queued on the model's batching engine like any other, but generated on
+    their own, since a streamer follows a single sequence.
+    """
+    model_name = model_name_map(params.get("model_name", "phi-4"))
+    messages = build_messages(combined_prompt)
+    stats = {}
+    with MODEL_MANAGER.use(model_name) as text_generation_pipeline:
+        engine = get_batch_engine(model_name, text_generation_pipeline)
+        outputs = engine.generate(messages, {
+            "temperature": params.get("temperature", 0.0),
+            "max_new_tokens": params.get("max_tokens", 8000),
+            "top_p": params.get("top_p", 1.0)
+        }, stats=stats, streamer=_callback_streamer_class()(text_generation_pipeline.tokenizer, on_token))
+    record("queue_wait_seconds", stats.get("queue_wait_seconds", 0.0))
+    record("generation_seconds", stats.get("generation_seconds", 0.0))
+    response = outputs[0]["generated_text"][-1]["content"]
+    # Streamed results are not returned through agenerate_llm_response, so usage is recorded here
+    record_usage(count_tokens(text_generation_pipeline.tokenizer, messages, response))
     return {
         "content": response
     }
 
+
 def model_name_map(model_name):
     mapping = {
         "groq-llm": "llama-3.3-70b-versatile",
@@ -110,3 +328,10 @@ def model_name_map(model_name):
         "huggingface_llama3.1_70b": "llama-3.3-70b"
     }
     return mapping.get(model_name.lower(), "llama-3.3-70b-versatile")
+
+
+# Loaded local pipelines, with memory-aware LRU eviction
+MODEL_MANAGER = ModelManager(load_model_pipeline, on_evict=drop_batch_engine)
+
+# Built last, since the routes refer to the provider functions defined above
+PROVIDER_REGISTRY = build_provider_registry()
@@ -0,0 +1,327 @@
+# modules/llm_providers.py
+"""
+Async LLM providers and the registry that maps model names to them.
+
+Remote providers speak the OpenAI chat-completions protocol over a pooled,
+keep-alive httpx.AsyncClient, so concurrent calls reuse connections instead
+of paying a TLS handshake each. Base URLs and keys come from the environment,
+which also makes every provider testable against a local mock server.
+httpx is only imported once a provider makes its first request, which keeps
+it out of app startup.
+"""
+
+import os
+import json
+import asyncio
+import contextvars
+import threading
+
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "256"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "64"))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "300"))
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+
+# Extra OpenAI-compatible endpoints, e.g.
+# '{"local": {"base_url": "http://localhost:8000/v1", "api_key_env": "LOCAL_API_KEY"}}'
+LLM_PROVIDERS = os.getenv("LLM_PROVIDERS", "")
+# Model routing overrides, checked before the built-in routes, e.g.
+# "my-model=local:served-model-id,gpt-=openai" (substring match; ":model" renames the model)
+LLM_MODEL_ROUTES = os.getenv("LLM_MODEL_ROUTES", "")
+
+
+class ProviderError(Exception):
+    """
+    A provider request that failed; carries the HTTP status when there is one.
+    `transient` says whether retrying can help (None: decide from the status).
+    """
+
+    def __init__(self, provider, message, status_code=None, retry_after=None, transient=None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.transient = transient
+
+
+def build_messages(combined_prompt):
+    """Flattens a combined prompt (system_prompt, conversation, user_prompt) into chat messages."""
+    messages = []
+    system_prompt = (combined_prompt.get("system_prompt") or "").strip()
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    for msg in combined_prompt.get("conversation", []):
+        messages.append({"role": msg["role"], "content": msg["content"]})
+    user_prompt = (combined_prompt.get("user_prompt") or "").strip()
+    if user_prompt:
+        messages.append({"role": "user", "content": user_prompt})
+    return messages
+
+
+class LLMProvider:
+    """Base class; subclasses implement agenerate()."""
+
+    name = "provider"
+
+    async def agenerate(self, model, combined_prompt, params):
+        """
+        Generates one response.
+
+        Returns:
+            dict: {"content": str} plus "usage" when the provider reports it.
+
+        Raises:
+            ProviderError: If the request fails.
+        """
+        raise NotImplementedError
+
+    async def astream(self, model, combined_prompt, params):
+        """
+        Yields the response text in chunks as it is generated. Providers that
+        cannot stream yield the whole response at once.
+
+        Raises:
+            ProviderError: If the request fails.
+        """
+        result = await self.agenerate(model, combined_prompt, params)
+        yield result["content"]
+
+    async def aclose(self):
+        pass
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """
+    Any endpoint implementing POST {base_url}/chat/completions (OpenAI, Groq,
+    vLLM, llama.cpp server, ...).
+    """
+
+    def __init__(self, name, base_url, api_key=None, api_key_env=None, max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                 max_keepalive=LLM_HTTP_MAX_KEEPALIVE, timeout=LLM_HTTP_TIMEOUT):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key if api_key is not None else (os.getenv(api_key_env) if api_key_env else None)
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.timeout = timeout
+
+        # One pooled client per event loop; in practice that is the runtime loop
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+
+    def client(self):
+        import httpx
+        loop = asyncio.get_running_loop()
+        with self._clients_lock:
+            client = self._clients.get(loop)
+            if client is None:
+                headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+                limits = httpx.Limits(max_connections=self.max_connections,
+                                      max_keepalive_connections=self.max_keepalive)
+                client = httpx.AsyncClient(
+                    base_url=self.base_url, headers=headers, limits=limits, timeout=self.timeout
+                )
+                self._clients[loop] = client
+            return client
+
+    def request_body(self, model, combined_prompt, params):
+        body = {
+            "model": model,
+            "messages": build_messages(combined_prompt),
+            "temperature": params.get("temperature", 1.0),
+            "top_p": params.get("top_p", 1.0)
+        }
+        if params.get("max_tokens"):
+            body["max_tokens"] = params["max_tokens"]
+        return body
+
+    def http_error(self, response):
+        retry_after = response.headers.get("retry-after")
+        return ProviderError(
+            self.name,
+            f"HTTP {response.status_code}: {response.text[:500]}",
+            status_code=response.status_code,
+            retry_after=float(retry_after) if retry_after and retry_after.replace(".", "", 1).isdigit() else None
+        )
+
+    async def agenerate(self, model, combined_prompt, params):
+        import httpx
+        try:
+            response = await self.client().post("/chat/completions", json=self.request_body(model, combined_prompt, params))
+        except httpx.HTTPError as e:
+            raise ProviderError(self.name, f"request failed: {e}")
+
+        if response.status_code >= 400:
+            raise self.http_error(response)
+
+        try:
+            data = response.json()
+            content = data["choices"][0]["message"]["content"]
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise ProviderError(self.name, f"unexpected response: {e}", transient=False)
+
+        result = {"content": content or ""}
+        if data.get("usage"):
+            result["usage"] = data["usage"]
+        return result
+
+    async def astream(self, model, combined_prompt, params):
+        import httpx
+        body = {**self.request_body(model, combined_prompt, params), "stream": True}
+        try:
+            async with self.client().stream("POST", "/chat/completions", json=body) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    raise self.http_error(response)
+
+                # Server-sent events: "data: {chunk}" lines, terminated by "data: [DONE]"
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        choices = json.loads(data).get("choices") or []
+                        text = (choices[0].get("delta") or {}).get("content") if choices else None
+                    except (ValueError, AttributeError) as e:
+                        raise ProviderError(self.name, f"unexpected stream chunk: {e}", transient=False)
+                    if text:
+                        yield text
+        except httpx.HTTPError as e:
+            raise ProviderError(self.name, f"request failed: {e}")
+
+    async def aclose(self):
+        with self._clients_lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            await client.aclose()
+
+
+class LocalCallableProvider(LLMProvider):
+    """
+    Wraps a blocking generate(combined_prompt, params) function, such as the
+    local transformers pipeline, by running it on the execution runtime's call pool.
+    An optional stream_fn(combined_prompt, params, on_token) streams instead,
+    calling on_token(text) from its thread as text is generated.
+    """
+
+    def __init__(self, name, generate_fn, stream_fn=None):
+        self.name = name
+        self.generate_fn = generate_fn
+        self.stream_fn = stream_fn
+
+    async def agenerate(self, model, combined_prompt, params):
+        from .execution_runtime import get_runtime
+        params = {**params, "model_name": model}
+        # run_in_executor does not carry context variables (e.g. the call's metrics) into the thread
+        context = contextvars.copy_context()
+        try:
+            return await get_runtime().run_in_pool(context.run, self.generate_fn, combined_prompt, params)
+        except Exception as e:
+            raise ProviderError(self.name, str(e), transient=False)
+
+    async def astream(self, model, combined_prompt, params):
+        if self.stream_fn is None:
+            async for text in super().astream(model, combined_prompt, params):
+                yield text
+            return
+
+        from .execution_runtime import get_runtime
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+
+        def on_token(text):
+            loop.call_soon_threadsafe(chunks.put_nowait, text)
+
+        params = {**params, "model_name": model}
+        context = contextvars.copy_context()
+        future = asyncio.ensure_future(
+            get_runtime().run_in_pool(context.run, self.stream_fn, combined_prompt, params, on_token)
+        )
+        # Scheduled after every token the worker thread queued before returning
+        future.add_done_callback(lambda _: chunks.put_nowait(None))
+        while True:
+            text = await chunks.get()
+            if text is None:
+                break
+            yield text
+        try:
+            await future
+        except Exception as e:
+            raise ProviderError(self.name, str(e), transient=False)
+
+
+class ProviderRegistry:
+    """
+    Maps model names to providers.
+
+    Routes are (pattern, provider name, remote model) tuples checked in order;
+    a route matches when its pattern occurs in the lower-cased model name, and
+    the remote model (default: the model name itself) is what is sent to the provider.
+    """
+
+    def __init__(self):
+        self.providers = {}
+        self.routes = []
+        self.default_provider = None
+
+    def register(self, provider, default=False):
+        self.providers[provider.name] = provider
+        if default:
+            self.default_provider = provider.name
+
+    def add_route(self, pattern, provider_name, remote_model=None, first=False):
+        route = (pattern.lower(), provider_name, remote_model)
+        if first:
+            self.routes.insert(0, route)
+        else:
+            self.routes.append(route)
+
+    def resolve(self, model_name):
+        """
+        Returns (provider, remote_model) for model_name.
+
+        Raises:
+            ProviderError: If no provider serves the model.
+        """
+        name = (model_name or "").lower()
+        for pattern, provider_name, remote_model in self.routes:
+            if pattern in name and provider_name in self.providers:
+                return self.providers[provider_name], remote_model or model_name
+        if self.default_provider:
+            return self.providers[self.default_provider], model_name
+        raise ProviderError("registry", f"No provider configured for model '{model_name}'.", transient=False)
+
+    async def aclose(self):
+        for provider in self.providers.values():
+            await provider.aclose()
+
+
+def parse_model_routes(spec):
+    """Parses "pattern=provider[:remote-model],..." into route tuples."""
+    routes = []
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        pattern, target = item.split("=", 1)
+        provider_name, _, remote_model = target.strip().partition(":")
+        routes.append((pattern.strip(), provider_name.strip(), remote_model.strip() or None))
+    return routes
+
+
+def load_extra_providers(spec):
+    """Builds the OpenAI-compatible providers described by the LLM_PROVIDERS JSON."""
+    if not spec:
+        return []
+    try:
+        config = json.loads(spec)
+    except json.JSONDecodeError as e:
+        print(f"Ignoring invalid LLM_PROVIDERS setting: {e}")
+        return []
+    return [
+        OpenAICompatibleProvider(name, options["base_url"], api_key=options.get("api_key"),
+                                 api_key_env=options.get("api_key_env"))
+        for name, options in config.items()
+    ]
@@ -0,0 +1,80 @@
+# modules/migrate_storage.py
+"""
+One-shot migration of all projects (including evaluation runs) between storage backends.
+
+Usage:
+    python -m modules.migrate_storage --from json --to sqlite
+"""
+
+import argparse
+
+from .storage import create_storage
+
+
+def migrate(source_backend, target_backend, overwrite=False):
+    """
+    Copies every project, with its workflows, evaluations and recorded runs,
+    from one storage backend to another.
+
+    Args:
+        source_backend (str): Name of the backend to read from ("json" or "sqlite").
+        target_backend (str): Name of the backend to write to.
+        overwrite (bool): Replace projects that already exist in the target.
+
+    Returns:
+        dict: Counts of migrated and skipped projects and migrated runs.
+    """
+    source = create_storage(source_backend)
+    target = create_storage(target_backend)
+    source.ensure_ready()
+    target.ensure_ready()
+
+    summary = {"projects": 0, "skipped": 0, "runs": 0}
+    for project_id in source.list_project_ids():
+        if target.project_exists(project_id) and not overwrite:
+            print(f"Skipping project {project_id}: already present in the {target_backend} backend.")
+            summary["skipped"] += 1
+            continue
+
+        project = source.load_project(project_id)
+        if project is None:
+            continue
+
+        # Read the runs through the source backend before the evaluations are rewritten
+        runs_per_evaluation = {}
+        for evaluation in project.get("evaluations", []):
+            runs_per_evaluation[evaluation["evaluation_id"]] = source.load_results(project_id, evaluation)
+            evaluation.pop("results", None)
+            evaluation.pop("results_log", None)
+
+        target.save_project(project_id, project)
+        for evaluation in project.get("evaluations", []):
+            target.delete_results(project_id, evaluation["evaluation_id"])
+            target.save_evaluation(project_id, evaluation)
+            for workflow_id, runs in runs_per_evaluation[evaluation["evaluation_id"]].items():
+                for run in runs:
+                    target.append_run(project_id, evaluation["evaluation_id"], workflow_id, run)
+                    summary["runs"] += 1
+
+        summary["projects"] += 1
+        print(f"Migrated project {project_id} ({project.get('name', '')}).")
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate projects between storage backends.")
+    parser.add_argument("--from", dest="source", default="json", choices=["json", "sqlite"])
+    parser.add_argument("--to", dest="target", default="sqlite", choices=["json", "sqlite"])
+    parser.add_argument("--overwrite", action="store_true", help="Replace projects that already exist in the target.")
+    args = parser.parse_args()
+
+    if args.source == args.target:
+        parser.error("--from and --to must name different backends.")
+
+    summary = migrate(args.source, args.target, overwrite=args.overwrite)
+    print(f"Done: {summary['projects']} projects and {summary['runs']} runs migrated, {summary['skipped']} skipped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# modules/model_manager.py
+"""
+Keeps local model pipelines loaded, and only as many as fit.
+
+Models can be preloaded in the background, concurrent first requests for the
+same model wait for a single load, and least-recently-used models that are not
+generating are unloaded when GPU or host memory use crosses a threshold.
+"""
+
+import os
+import gc
+import time
+import threading
+import contextlib
+from collections import OrderedDict
+
+# Comma-separated model names to load in the background when the server starts
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "")
+MODEL_MEMORY_THRESHOLD = float(os.getenv("MODEL_MEMORY_THRESHOLD", "0.9"))  # Used fraction of any device or host RAM
+MODEL_MAX_LOADED = int(os.getenv("MODEL_MAX_LOADED", "0"))  # 0 = bounded by memory only
+
+
+def memory_usage():
+    """
+    Returns the used fraction of every CUDA device and of host RAM, e.g.
+    {"cuda:0": 0.82, "host": 0.41}.
+    """
+    usage = {}
+    try:
+        import torch
+        if torch.cuda.is_available():
+            for index in range(torch.cuda.device_count()):
+                free, total = torch.cuda.mem_get_info(index)
+                usage[f"cuda:{index}"] = 1.0 - free / total
+    except (ImportError, AttributeError, RuntimeError):
+        pass
+
+    try:
+        with open("/proc/meminfo") as f:
+            meminfo = {line.split(":")[0]: int(line.split()[1]) for line in f if line.split()[1:]}
+        usage["host"] = 1.0 - meminfo["MemAvailable"] / meminfo["MemTotal"]
+    except (OSError, KeyError, ValueError, ZeroDivisionError):
+        try:
+            usage["host"] = 1.0 - os.sysconf("SC_AVPHYS_PAGES") / os.sysconf("SC_PHYS_PAGES")
+        except (ValueError, OSError, AttributeError, ZeroDivisionError):
+            pass
+    return usage
+
+
+def _release_memory():
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except (ImportError, AttributeError, RuntimeError):
+        pass
+
+
+class ModelManager:
+    """
+    Loads models through `loader(model_name)` and keeps them in LRU order.
+
+    Args:
+        loader (callable): Loads and returns the pipeline for a model name.
+        memory_threshold (float): Evict idle models while any device (or host RAM) is fuller than this.
+        max_loaded (int): Upper bound on loaded models; 0 for none.
+        on_evict (callable): Optional on_evict(model_name), called after a model is unloaded.
+        memory_usage_fn (callable): Returns {device: used fraction}; defaults to memory_usage().
+    """
+
+    def __init__(self, loader, memory_threshold=MODEL_MEMORY_THRESHOLD, max_loaded=MODEL_MAX_LOADED,
+                 on_evict=None, memory_usage_fn=memory_usage):
+        self.loader = loader
+        self.memory_threshold = memory_threshold
+        self.max_loaded = max_loaded
+        self.on_evict = on_evict
+        self.memory_usage_fn = memory_usage_fn
+
+        self.models = OrderedDict()  # model_name -> pipeline, least recently used first
+        self._state = {}
+        self._in_use = {}
+        self._load_locks = {}
+        self._lock = threading.Lock()
+
+    def _set_state(self, model_name, **fields):
+        self._state.setdefault(model_name, {"state": "not_loaded"}).update(fields)
+
+    def get(self, model_name):
+        """
+        Returns the loaded pipeline, loading it first if needed. Concurrent
+        callers asking for a model that is not loaded yet share one load.
+        """
+        with self._lock:
+            if model_name in self.models:
+                self.models.move_to_end(model_name)
+                self._set_state(model_name, last_used=time.time())
+                return self.models[model_name]
+            load_lock = self._load_locks.setdefault(model_name, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                if model_name in self.models:
+                    self.models.move_to_end(model_name)
+                    self._set_state(model_name, last_used=time.time())
+                    return self.models[model_name]
+                self._set_state(model_name, state="loading", error=None)
+
+            # Make room before loading rather than after running out
+            self.evict_if_needed(reserve=1)
+            started = time.monotonic()
+            try:
+                pipeline = self.loader(model_name)
+            except Exception as e:
+                with self._lock:
+                    self._set_state(model_name, state="failed", error=str(e))
+                raise
+
+            with self._lock:
+                self.models[model_name] = pipeline
+                now = time.time()
+                self._set_state(model_name, state="loaded", loaded_at=now, last_used=now,
+                                load_seconds=round(time.monotonic() - started, 2))
+            print(f"Loaded model '{model_name}' in {time.monotonic() - started:.1f}s.")
+
+        self.evict_if_needed(keep=model_name)
+        return pipeline
+
+    @contextlib.contextmanager
+    def use(self, model_name):
+        """Yields the model's pipeline and keeps it from being evicted until the block exits."""
+        with self._lock:
+            self._in_use[model_name] = self._in_use.get(model_name, 0) + 1
+        try:
+            yield self.get(model_name)
+        finally:
+            with self._lock:
+                self._in_use[model_name] -= 1
+
+    def _over_limit(self, reserve):
+        if self.max_loaded and len(self.models) + reserve > self.max_loaded:
+            return True
+        if self.memory_threshold and self.memory_threshold < 1:
+            usage = self.memory_usage_fn()
+            return bool(usage) and max(usage.values()) > self.memory_threshold
+        return False
+
+    def evict_if_needed(self, keep=None, reserve=0):
+        """
+        Unloads least-recently-used idle models while over the memory threshold
+        or the model count limit.
+
+        Args:
+            keep (str): A model that must stay loaded.
+            reserve (int): Slots to keep free under max_loaded (1 before a load).
+
+        Returns:
+            list: The evicted model names.
+        """
+        evicted = []
+        while self._over_limit(reserve):
+            with self._lock:
+                candidates = [name for name in self.models if name != keep and not self._in_use.get(name)]
+                if not candidates:
+                    break
+                model_name = candidates[0]
+                self.models.pop(model_name)
+                self._set_state(model_name, state="evicted", evicted_at=time.time())
+            if self.on_evict is not None:
+                self.on_evict(model_name)
+            _release_memory()
+            print(f"Evicted model '{model_name}' to free memory.")
+            evicted.append(model_name)
+        return evicted
+
+    def preload(self, model_names):
+        """Loads the given models one after another on a background thread."""
+        model_names = [name for name in model_names if name]
+        if not model_names:
+            return
+        with self._lock:
+            for model_name in model_names:
+                if self._state.get(model_name, {}).get("state") in (None, "not_loaded", "evicted", "failed"):
+                    self._set_state(model_name, state="queued")
+
+        def run():
+            for model_name in model_names:
+                try:
+                    self.get(model_name)
+                except Exception as e:
+                    print(f"Preloading model '{model_name}' failed: {e}")
+
+        threading.Thread(target=run, name="model-preload", daemon=True).start()
+
+    def status(self):
+        with self._lock:
+            models = [
+                {"model_name": name, "in_use": self._in_use.get(name, 0), **state}
+                for name, state in self._state.items()
+            ]
+            loaded = list(self.models)
+        return {
+            "models": models,
+            "loaded": loaded,
+            "memory": {device: round(used, 3) for device, used in self.memory_usage_fn().items()},
+            "memory_threshold": self.memory_threshold,
+            "max_loaded": self.max_loaded
+        }
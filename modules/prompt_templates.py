@@ -0,0 +1,116 @@
+# modules/prompt_templates.py
+"""
+Compiled {{ variable }} templates for system prompts and conversation messages.
+
+A template is parsed once into literal text and variable references, and the
+result is cached per template string, so rendering the same prompt across
+retries and evaluation iterations is a plain join.
+"""
+
+import os
+import re
+import functools
+
+PROMPT_TEMPLATE_CACHE_SIZE = int(os.getenv("PROMPT_TEMPLATE_CACHE_SIZE", "4096"))
+
+PLACEHOLDER_PATTERN = re.compile(r'{{\s*(.*?)\s*}}')
+SIMPLE_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_]+$')
+
+
+class TemplateReference:
+    """
+    One {{ }} placeholder: the variable name plus the dict keys to follow,
+    e.g. name "notes" and path ("other",) for {{notes['other']}}.
+    """
+
+    def __init__(self, expr):
+        self.expr = expr
+        self.error = None
+        self.simple = bool(SIMPLE_NAME_PATTERN.match(expr))
+        if self.simple:
+            self.name = expr
+            self.path = ()
+            return
+
+        self.name = expr.split("[", 1)[0].strip()
+        keys = []
+        rest = expr[len(self.name):].strip()
+        while rest.startswith("["):
+            end_index = rest.find("]")
+            if end_index == -1:
+                self.error = "Mismatched brackets in expression: " + expr
+                break
+            keys.append(rest[1:end_index].strip().strip("'\""))
+            rest = rest[end_index + 1:].strip()
+        self.path = tuple(keys)
+
+    def resolve(self, variables):
+        if self.simple:
+            if self.name in variables:
+                return str(variables[self.name])
+            raise KeyError(f"Variable '{self.expr}' not found.")
+
+        if self.name not in variables:
+            raise KeyError(f"Error accessing expression '{self.expr}': Base variable '{self.name}' not found.")
+        if self.error is not None:
+            raise KeyError(f"Error accessing expression '{self.expr}': {self.error}")
+
+        value = variables[self.name]
+        for key in self.path:
+            if not isinstance(value, dict):
+                raise KeyError(
+                    f"Error accessing expression '{self.expr}': "
+                    f"Variable '{self.name}' is not a dictionary; cannot index '{key}'"
+                )
+            if key not in value:
+                raise KeyError(f"Error accessing expression '{self.expr}': {key} not found in variable '{self.name}'")
+            value = value[key]
+        return str(value)
+
+
+class CompiledTemplate:
+    """A template split into literal strings and TemplateReference objects."""
+
+    def __init__(self, template):
+        self.template = template
+        self.segments = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(template):
+            if match.start() > position:
+                self.segments.append(template[position:match.start()])
+            self.segments.append(TemplateReference(match.group(1)))
+            position = match.end()
+        if position < len(template):
+            self.segments.append(template[position:])
+
+        self.references = [s for s in self.segments if isinstance(s, TemplateReference)]
+        self.variables = frozenset(ref.name for ref in self.references)
+
+    def render(self, variables):
+        """
+        Substitutes the variables into the template.
+
+        Raises:
+            KeyError: If a variable or one of the keys along its path is missing.
+        """
+        if not self.references:
+            return self.template
+        return "".join(
+            segment if isinstance(segment, str) else segment.resolve(variables)
+            for segment in self.segments
+        )
+
+
+@functools.lru_cache(maxsize=PROMPT_TEMPLATE_CACHE_SIZE)
+def compile_template(template):
+    return CompiledTemplate(template or "")
+
+
+def render_prompt(template, variables):
+    """Renders a {{ }} template with the given variables, compiling it on first use."""
+    return compile_template(template).render(variables)
+
+
+def template_variables(template):
+    """Returns the names of the variables a template references."""
+    return compile_template(template).variables
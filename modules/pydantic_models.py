@@ -1,6 +1,9 @@
 # modules/pydantic_models.py
 
-from pydantic import BaseModel, Field
+import json
+import functools
+
+from pydantic import BaseModel, Field, TypeAdapter
 from typing import Optional
 
 # Example Pydantic Models
@@ -41,44 +44,97 @@ PYDANTIC_MODELS = {
 }
 
 
+SCHEMA_INSTRUCTIONS = "\n\nBelow is JSON like object that describes the expected structure of your output. Only respond in JSON.\n"
+
+
 def resolve_ref(schema: dict, ref: str) -> dict:
     """Resolve a `$ref` in the schema."""
-    if ref.startswith("#/$defs/"):
-        def_name = ref.split("/")[-1]
-        return schema["$defs"][def_name]
+    for prefix in ("#/$defs/", "#/definitions/"):
+        if ref.startswith(prefix):
+            def_name = ref[len(prefix):]
+            definitions = schema.get(prefix[2:-1], {})
+            if def_name not in definitions:
+                raise ValueError(f"Reference schema '{ref}' not found.")
+            return definitions[def_name]
     raise ValueError(f"Unsupported $ref format: {ref}")
 
 
+def _describe_type(details: dict) -> str:
+    if "type" in details:
+        return details["type"]
+    variants = details.get("anyOf") or details.get("oneOf") or []
+    types = [variant.get("type") for variant in variants if variant.get("type")]
+    return " | ".join(types) if types else "unknown"
+
+
+def _describe_node(schema: dict, details: dict, nested: bool, seen: tuple):
+    """
+    Describes one property: nested models (including ones behind $ref, arrays
+    and Optional) become dicts of their own properties, anything else a
+    description/type string.
+    """
+    if "$ref" in details:
+        ref = details["$ref"]
+        if ref in seen:
+            return f"Recursive reference to {ref.rsplit('/', 1)[-1]}"
+        return _describe_node(schema, {**resolve_ref(schema, ref), **{k: v for k, v in details.items() if k != "$ref"}},
+                              nested, seen + (ref,))
+
+    if "properties" in details:
+        return {
+            field: _describe_node(schema, subdetails, True, seen)
+            for field, subdetails in details["properties"].items()
+        }
+
+    if details.get("type") == "array" and isinstance(details.get("items"), dict):
+        items = _describe_node(schema, details["items"], True, seen)
+        if isinstance(items, dict) or "$ref" in details["items"]:
+            return [items]
+
+    variants = details.get("anyOf") or details.get("oneOf") or []
+    object_variants = [v for v in variants if "$ref" in v or "properties" in v]
+    if len(object_variants) == 1:
+        # Optional[Model]
+        return _describe_node(schema, object_variants[0], nested, seen)
+
+    if nested:
+        return (
+            f"Description: {details.get('description', 'No description provided.')} "
+            f"Data Type: {_describe_type(details)}"
+        )
+    return (
+        f"Description: {details.get('description', 'No description provided.')}. "
+        f"Type: {_describe_type(details)}"
+    )
+
+
 def generate_json_schema(schema: dict) -> dict:
     """
     Generate a JSON-like structure from a Pydantic schema where keys are field names,
     and values are their descriptions and types in a human-readable format.
+    Nested models are expanded recursively, through any number of `$ref`s.
+    """
+    root, seen = schema, ()
+    if "$ref" in schema and "properties" not in schema:
+        # Self-referencing models put their own definition in $defs too
+        root, seen = resolve_ref(schema, schema["$ref"]), (schema["$ref"],)
+    return {
+        field: _describe_node(schema, details, False, seen)
+        for field, details in root.get("properties", {}).items()
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def schema_prompt_fragment(model_name: str) -> str:
     """
-    json_structure = {}
-    properties = schema.get("properties", {})
-
-    for field, details in properties.items():
-        if "$ref" in details:
-            # Handle references
-            ref_schema = resolve_ref(schema, details["$ref"])
-            if not ref_schema:
-                raise ValueError(f"Reference schema for '{field}' not found.")
-            # Include a nested structure with descriptions and types for subfields
-            json_structure[field] = {
-                subfield: (
-                    f"Description: {subdetails.get('description', 'No description provided.')} "
-                    f"Data Type: {subdetails.get('type', 'unknown')}"
-                )
-                for subfield, subdetails in ref_schema.get("properties", {}).items()
-            }
-        else:
-            # Include the field description and type directly
-            json_structure[field] = (
-                f"Description: {details.get('description', 'No description provided.')}. "
-                f"Type: {details.get('type', 'unknown')}"
-            )
-    return json_structure
-
-
-
-print(generate_json_schema(Evaluation.model_json_schema()))
\ No newline at end of file
+    The instructions appended to a call's system prompt for a model in
+    PYDANTIC_MODELS, built once per model.
+    """
+    structure = generate_json_schema(PYDANTIC_MODELS[model_name].model_json_schema())
+    return SCHEMA_INSTRUCTIONS + f"\n{json.dumps(structure, indent=2)}\n"
+
+
+@functools.lru_cache(maxsize=None)
+def get_type_adapter(model_name: str) -> TypeAdapter:
+    """A validator for a model in PYDANTIC_MODELS, built once per model."""
+    return TypeAdapter(PYDANTIC_MODELS[model_name])
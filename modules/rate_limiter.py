@@ -0,0 +1,300 @@
+# modules/rate_limiter.py
+"""
+Adaptive per-provider/model rate limiting for LLM requests.
+
+Each (provider, model) pair gets a limiter with two token buckets, one for
+requests and one for tokens per minute. The allowed rate backs off
+multiplicatively on HTTP 429 (and on slow responses, when a latency target is
+set) and recovers additively on success (AIMD). Waiting requests are served
+in priority order, so interactive workflow runs go ahead of bulk evaluation
+traffic.
+
+The buckets only exist for configured rate limits. The other places calls
+wait for, the runtime's per-provider limits and call pool, use
+PrioritySemaphore, so priority applies there too.
+"""
+
+import os
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import contextvars
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# "provider=rpm/tpm" or "provider:model=rpm/tpm", comma separated; 0 = unlimited
+LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "")
+LLM_DEFAULT_RPM = float(os.getenv("LLM_DEFAULT_RPM", "0"))
+LLM_DEFAULT_TPM = float(os.getenv("LLM_DEFAULT_TPM", "0"))
+LLM_RATE_BURST_SECONDS = float(os.getenv("LLM_RATE_BURST_SECONDS", "10"))  # Bucket capacity, in seconds of rate
+LLM_LATENCY_TARGET = float(os.getenv("LLM_LATENCY_TARGET", "0"))  # Seconds; 0 = ignore latency
+LLM_TRANSIENT_RETRIES = int(os.getenv("LLM_TRANSIENT_RETRIES", "5"))  # 429/5xx/connection retries per request
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+LLM_RETRY_BACKOFF_BASE = float(os.getenv("LLM_RETRY_BACKOFF_BASE", "0.5"))  # Between a call's validation retries
+
+# AIMD tuning
+_DECREASE_ON_429 = 0.5
+_DECREASE_ON_SLOW = 0.9
+_INCREASE_FRACTION = 0.05  # Of the configured rate, per successful request
+_MIN_FRACTION = 0.05
+
+_priority = contextvars.ContextVar("llm_request_priority", default=PRIORITY_INTERACTIVE)
+
+
+def current_priority():
+    return _priority.get()
+
+
+async def with_priority(coro, priority):
+    """Runs a coroutine with every LLM request it makes queued at `priority`."""
+    _priority.set(priority)
+    return await coro
+
+
+class PrioritySemaphore:
+    """
+    asyncio semaphore that hands free slots to waiters in priority order (lower
+    number first, FIFO within a priority); the priority defaults to the
+    current request priority. Must be used from a single event loop.
+    """
+
+    def __init__(self, value):
+        self._value = value
+        self._waiters = []
+        self._sequence = itertools.count()
+
+    async def acquire(self, priority=None):
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        priority = current_priority() if priority is None else priority
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # Granted just as the waiter was cancelled: pass the slot on
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():  # Cancelled waiters are skipped
+                future.set_result(None)
+                return
+        self._value += 1
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+def backoff_delay(attempt, base=LLM_BACKOFF_BASE, cap=LLM_BACKOFF_MAX, retry_after=None):
+    """
+    Full-jitter exponential backoff for the given 1-based attempt, never
+    shorter than a server-provided Retry-After.
+    """
+    delay = random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+    if retry_after:
+        delay = max(delay, min(float(retry_after), cap))
+    return delay
+
+
+def is_transient(error):
+    """True for provider errors worth retrying: rate limits, server errors and connection failures."""
+    if getattr(error, "transient", None) is not None:
+        return error.transient
+    status = getattr(error, "status_code", None)
+    return status is None or status == 429 or status >= 500
+
+
+def estimate_tokens(combined_prompt, params):
+    """Rough token count of a request (about four characters per token) plus its completion budget."""
+    chars = len(combined_prompt.get("system_prompt") or "")
+    chars += sum(len(msg.get("content") or "") for msg in combined_prompt.get("conversation", []))
+    return chars // 4 + int(params.get("max_tokens") or 0)
+
+
+def parse_rate_limits(spec):
+    """Parses "groq=30/6000,openai:gpt-4=500/0" into {key: (rpm, tpm)}."""
+    limits = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        key, value = item.split("=", 1)
+        rpm, _, tpm = value.partition("/")
+        try:
+            limits[key.strip()] = (float(rpm or 0), float(tpm or 0))
+        except ValueError:
+            continue
+    return limits
+
+
+class TokenBucket:
+    """Refills at `rate_per_minute`, holding at most LLM_RATE_BURST_SECONDS worth of tokens."""
+
+    def __init__(self, rate_per_minute):
+        self.max_rate = rate_per_minute
+        self.rate = rate_per_minute
+        self.capacity = max(1.0, rate_per_minute / 60.0 * LLM_RATE_BURST_SECONDS)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self):
+        return not self.max_rate
+
+    def refill(self, now):
+        if self.unlimited:
+            return
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` can be taken (0 if it can be taken now)."""
+        if self.unlimited:
+            return 0.0
+        # A request larger than the whole bucket only has to wait for a full bucket
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.rate
+
+    def take(self, amount):
+        if not self.unlimited:
+            self.level -= amount
+
+    def scale(self, factor):
+        if not self.unlimited:
+            self.rate = min(self.max_rate, max(self.max_rate * _MIN_FRACTION, self.rate * factor))
+
+    def increase(self):
+        if not self.unlimited:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * _INCREASE_FRACTION)
+
+
+class AdaptiveRateLimiter:
+    """
+    Request and token buckets for one provider/model, with a priority queue of waiters.
+
+    All methods must be called from the same event loop (the execution runtime's).
+    """
+
+    def __init__(self, key, rpm=0, tpm=0, latency_target=LLM_LATENCY_TARGET):
+        self.key = key
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.latency_target = latency_target
+
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._changed = None
+        self._paused_until = 0.0
+
+        self.granted = 0
+        self.rate_limited = 0
+        self.slow = 0
+        self.latency_ewma = None
+
+    def _condition(self):
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    def _wait_time(self, estimated_tokens, now):
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        return max(self._paused_until - now, self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+
+    async def acquire(self, estimated_tokens=0, priority=None):
+        """Waits until this request may be sent, serving higher-priority (lower number) waiters first."""
+        priority = current_priority() if priority is None else priority
+        entry = (priority, next(self._sequence))
+        heapq.heappush(self._waiters, entry)
+        changed = self._condition()
+        try:
+            async with changed:
+                while True:
+                    timeout = None
+                    if self._waiters[0] == entry:
+                        timeout = self._wait_time(estimated_tokens, time.monotonic())
+                        if timeout <= 0:
+                            heapq.heappop(self._waiters)
+                            self.requests.take(1)
+                            self.tokens.take(estimated_tokens)
+                            self.granted += 1
+                            changed.notify_all()
+                            return
+                    try:
+                        await asyncio.wait_for(changed.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+        except BaseException:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                async with changed:
+                    changed.notify_all()
+            raise
+
+    def record_success(self, latency, estimated_tokens=0, used_tokens=None):
+        """Additive increase, or a small decrease when responses are slower than the latency target."""
+        if used_tokens is not None:
+            # Settle the estimate against what the provider actually counted
+            self.tokens.take(used_tokens - estimated_tokens)
+        self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+        if self.latency_target and self.latency_ewma > self.latency_target:
+            self.slow += 1
+            self.requests.scale(_DECREASE_ON_SLOW)
+            self.tokens.scale(_DECREASE_ON_SLOW)
+        else:
+            self.requests.increase()
+            self.tokens.increase()
+
+    def record_rate_limited(self, retry_after=None):
+        """Multiplicative decrease, and a pause for everyone when the server sent Retry-After."""
+        self.rate_limited += 1
+        self.requests.scale(_DECREASE_ON_429)
+        self.tokens.scale(_DECREASE_ON_429)
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + float(retry_after))
+
+    def stats(self):
+        return {
+            "key": self.key,
+            "rpm": round(self.requests.rate, 2) if not self.requests.unlimited else None,
+            "tpm": round(self.tokens.rate, 2) if not self.tokens.unlimited else None,
+            "configured_rpm": self.requests.max_rate or None,
+            "configured_tpm": self.tokens.max_rate or None,
+            "waiting": len(self._waiters),
+            "granted": self.granted,
+            "rate_limited": self.rate_limited,
+            "slow_responses": self.slow,
+            "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None
+        }
+
+
+_LIMITS = parse_rate_limits(LLM_RATE_LIMITS)
+_LIMITERS = {}
+
+
+def get_rate_limiter(provider_name, model):
+    """Returns the limiter for a provider/model pair, configured from LLM_RATE_LIMITS."""
+    key = f"{provider_name}:{model}"
+    limiter = _LIMITERS.get(key)
+    if limiter is None:
+        rpm, tpm = _LIMITS.get(key) or _LIMITS.get(provider_name) or (LLM_DEFAULT_RPM, LLM_DEFAULT_TPM)
+        limiter = AdaptiveRateLimiter(key, rpm=rpm, tpm=tpm)
+        _LIMITERS[key] = limiter
+    return limiter
+
+
+def rate_limiter_stats():
+    return [limiter.stats() for limiter in list(_LIMITERS.values())]
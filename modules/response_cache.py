@@ -0,0 +1,255 @@
+# modules/response_cache.py
+
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+
+from .storage import PROJECTS_DIR
+from .call_metrics import record
+
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", os.path.join(PROJECTS_DIR, "response_cache.sqlite3"))
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") != "0"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))  # Seconds; 0 = never expire
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "50000"))
+RESPONSE_CACHE_MAX_MB = float(os.getenv("RESPONSE_CACHE_MAX_MB", "512"))
+# Sampled (temperature > 0) responses are only cached when explicitly allowed, since
+# repeated evaluation runs are meant to produce independent samples
+RESPONSE_CACHE_ALL_TEMPERATURES = os.getenv("RESPONSE_CACHE_ALL_TEMPERATURES", "0") == "1"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    cache_key TEXT PRIMARY KEY,
+    model_name TEXT,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_accessed REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_accessed ON responses (last_accessed);
+"""
+
+# Evict after this many stores rather than on every write
+_EVICT_EVERY = 100
+
+
+def make_cache_key(model_name, combined_prompt, params):
+    """
+    Hashes everything that determines an LLM response: the model, the rendered
+    system prompt and conversation, and the sampling parameters.
+    """
+    payload = {
+        "model_name": model_name,
+        "system_prompt": combined_prompt.get("system_prompt", ""),
+        "conversation": [
+            {"role": msg.get("role"), "content": msg.get("content")}
+            for msg in combined_prompt.get("conversation", [])
+        ],
+        "temperature": params.get("temperature"),
+        "top_p": params.get("top_p"),
+        "max_tokens": params.get("max_tokens")
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def is_cacheable(params):
+    """Only deterministic (temperature 0) requests are cached unless RESPONSE_CACHE_ALL_TEMPERATURES is set."""
+    if RESPONSE_CACHE_ALL_TEMPERATURES:
+        return True
+    try:
+        return float(params.get("temperature", 1.0)) == 0.0
+    except (TypeError, ValueError):
+        return False
+
+
+class ResponseCache:
+    """
+    Content-addressed cache of LLM responses in SQLite.
+
+    Entries expire after `ttl_seconds` and the least recently used ones are
+    evicted once the cache holds more than `max_entries` responses or
+    `max_bytes` of response text. Hit/miss counters are kept per process.
+    """
+
+    def __init__(self, db_path=RESPONSE_CACHE_PATH, ttl_seconds=RESPONSE_CACHE_TTL,
+                 max_entries=RESPONSE_CACHE_MAX_ENTRIES, max_bytes=int(RESPONSE_CACHE_MAX_MB * 1024 * 1024)):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, counter, amount=1):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def get(self, cache_key):
+        """Returns the cached response dict, or None on a miss or an expired entry."""
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT response, created_at FROM responses WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        now = time.time()
+        if row is None or (self.ttl_seconds and now - row["created_at"] > self.ttl_seconds):
+            self._count("misses")
+            return None
+        with conn:
+            conn.execute(
+                "UPDATE responses SET last_accessed = ?, hits = hits + 1 WHERE cache_key = ?", (now, cache_key)
+            )
+        self._count("hits")
+        return json.loads(row["response"])
+
+    def put(self, cache_key, model_name, response):
+        encoded = json.dumps(response, ensure_ascii=False)
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (cache_key, model_name, response, size, created_at, last_accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key, model_name, encoded, len(encoded), now, now)
+            )
+        self._count("stores")
+        if self.stores % _EVICT_EVERY == 0:
+            self.evict()
+
+    def invalidate(self, cache_key):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM responses WHERE cache_key = ?", (cache_key,))
+
+    def evict(self):
+        """Drops expired entries, then the least recently used ones until the size limits hold."""
+        conn = self._conn()
+        removed = 0
+        with conn:
+            if self.ttl_seconds:
+                removed += conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+                ).rowcount
+
+            count = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if self.max_entries and count > self.max_entries:
+                removed += conn.execute(
+                    "DELETE FROM responses WHERE cache_key IN "
+                    "(SELECT cache_key FROM responses ORDER BY last_accessed LIMIT ?)",
+                    (count - self.max_entries,)
+                ).rowcount
+
+            if self.max_bytes:
+                total_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                excess = total_size - self.max_bytes
+                if excess > 0:
+                    keys = []
+                    for row in conn.execute("SELECT cache_key, size FROM responses ORDER BY last_accessed"):
+                        if excess <= 0:
+                            break
+                        keys.append(row["cache_key"])
+                        excess -= row["size"]
+                    conn.executemany("DELETE FROM responses WHERE cache_key = ?", [(k,) for k in keys])
+                    removed += len(keys)
+        self._count("evictions", removed)
+        return removed
+
+    def clear(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM responses")
+
+    def stats(self):
+        count, total_size = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": RESPONSE_CACHE_ENABLED,
+                "entries": count,
+                "size_bytes": total_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "ttl_seconds": self.ttl_seconds,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes
+            }
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_response_cache():
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = ResponseCache()
+        return _CACHE
+
+
+async def acached_llm_response(agenerate_fn, model_name, combined_prompt, params, use_cache=True, refresh=False):
+    """
+    Returns await agenerate_fn(model_name, combined_prompt, params), answered
+    from the response cache when an identical cacheable request was made before.
+    The SQLite lookups run in a worker thread so they never block the event loop.
+
+    Args:
+        agenerate_fn (callable): The coroutine function that actually calls the model.
+        use_cache (bool): False skips the cache entirely (per-call opt-out).
+        refresh (bool): Skip the lookup but store the new response, e.g. when
+            retrying because the cached response failed validation.
+
+    Returns:
+        tuple: (response, cache_key). cache_key is None when the cache was not used;
+        otherwise it can be passed to ainvalidate_cached_response().
+    """
+    if not (RESPONSE_CACHE_ENABLED and use_cache and is_cacheable(params)):
+        return await agenerate_fn(model_name, combined_prompt, params), None
+
+    cache = get_response_cache()
+    cache_key = make_cache_key(model_name, combined_prompt, params)
+    if not refresh:
+        cached = await asyncio.to_thread(cache.get, cache_key)
+        if cached is not None:
+            record("cache_hits")
+            return cached, cache_key
+
+    response = await agenerate_fn(model_name, combined_prompt, params)
+    # Failed provider calls are never cached
+    if isinstance(response, dict) and "content" in response and not response.get("error"):
+        await asyncio.to_thread(cache.put, cache_key, model_name, response)
+    return response, cache_key
+
+
+async def ainvalidate_cached_response(cache_key):
+    """
+    Drops a cached response that turned out to be unusable (e.g. invalid JSON).
+    The SQLite write runs off the event loop.
+    """
+    if cache_key is not None:
+        await asyncio.to_thread(get_response_cache().invalidate, cache_key)
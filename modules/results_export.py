@@ -0,0 +1,326 @@
+# modules/results_export.py
+"""
+Exports evaluation runs as flat rows, for analysis in pandas or DuckDB.
+
+Each run becomes one row: its keys, error and notes, its scores, its
+totals of the call metrics, and per response variable the response, the
+fields of structured (pydantic) responses and the call's metrics. Rows are
+written in batches as CSV, Parquet or an Arrow IPC stream, so an export never
+holds the whole evaluation in memory: one pass over the runs settles the
+columns and their types, and a second pass writes the rows.
+
+Parquet and Arrow need pyarrow, which is optional.
+
+Usage:
+    python -m modules.results_export --project <id> --evaluation <id> [--format csv] [--output runs.csv]
+"""
+
+import io
+import os
+import csv
+import sys
+import json
+import argparse
+
+from .scoring import maybe_json, flatten_fields
+from .storage import get_storage
+
+EXPORT_FORMATS = {
+    "csv": {"mimetype": "text/csv", "extension": "csv"},
+    "parquet": {"mimetype": "application/vnd.apache.parquet", "extension": "parquet"},
+    "arrow": {"mimetype": "application/vnd.apache.arrow.stream", "extension": "arrows"}
+}
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "1000"))
+
+KEY_COLUMNS = ["workflow_id", "variable_set_id", "run_index", "error", "notes"]
+CALL_METRICS = [
+    "latency_seconds", "ttft_seconds", "queue_wait_seconds", "generation_seconds",
+    "prompt_tokens", "completion_tokens", "total_tokens", "retries", "cache_hits"
+]
+RUN_METRICS = ["wall_seconds", "latency_seconds", "queue_wait_seconds", "total_tokens", "retries", "cache_hits"]
+
+
+class ExportError(Exception):
+    """Raised when an export cannot be produced in the requested format."""
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ExportError("Parquet and Arrow exports require pyarrow (pip install pyarrow).") from e
+    return pyarrow
+
+
+def check_format(export_format):
+    """Raises ExportError unless export_format can be written here."""
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown export format '{export_format}'; use one of {', '.join(EXPORT_FORMATS)}.")
+    if export_format != "csv":
+        _pyarrow()
+
+
+# ---------- Flattening ----------
+
+def _cell(value):
+    """Leaves scalars as they are and writes anything structured as JSON text."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+def flatten_run(workflow_id, run):
+    """
+    One run as a flat {column: value} row.
+
+    Columns: the KEY_COLUMNS, match_score and score.<scorer>, run.<metric>
+    for the RUN_METRICS, then per response variable response.<var>,
+    field.<var>.<path> for structured responses, and <metric>.<var> for the
+    CALL_METRICS of LLM calls.
+    """
+    output = run.get("output")
+    row = {
+        "workflow_id": workflow_id,
+        "variable_set_id": run.get("variable_set_id"),
+        "run_index": run.get("run_index"),
+        "error": output.get("error") if isinstance(output, dict) else None,
+        "notes": run.get("notes") or None
+    }
+
+    comparison = run.get("comparison") or {}
+    row["match_score"] = comparison.get("match_score")
+    for name, score in (comparison.get("scores") or {}).items():
+        row[f"score.{name}"] = score
+    run_metrics = run.get("metrics") or {}
+    for metric in RUN_METRICS:
+        if run_metrics.get(metric) is not None:
+            row[f"run.{metric}"] = run_metrics[metric]
+
+    for step in output if isinstance(output, list) else []:
+        for call in step.get("calls", []):
+            variable = call.get("variable_name") or call.get("call_id")
+            if not variable:
+                continue
+            if call.get("error"):
+                row[f"error.{variable}"] = call["error"]
+            response = maybe_json(call.get("response"))
+            row[f"response.{variable}"] = _cell(response)
+            if isinstance(response, (dict, list)):
+                for path, value in flatten_fields(response).items():
+                    row[f"field.{variable}.{path}"] = _cell(value)
+            metrics = call.get("metrics") or {}
+            for metric in CALL_METRICS:
+                if metrics.get(metric) is not None:
+                    row[f"{metric}.{variable}"] = metrics[metric]
+        for function in step.get("functions", []):
+            variable = function.get("output_variable") or function.get("call_id")
+            if variable and "response" in function:
+                row[f"response.{variable}"] = _cell(maybe_json(function["response"]))
+    return row
+
+
+# ---------- Schema ----------
+
+def _kind(value):
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    return "string"
+
+
+def _column_type(kinds):
+    if kinds == {"bool"}:
+        return "bool"
+    if kinds == {"int"}:
+        return "int"
+    if kinds and kinds <= {"int", "float"}:
+        return "float"
+    return "string"
+
+
+def infer_schema(rows):
+    """
+    [(column, type)] over all rows, types being "bool", "int", "float" or
+    "string" (columns with mixed values). Key columns come first, then the
+    remaining columns in the order they first appear.
+    """
+    kinds = {column: set() for column in KEY_COLUMNS}
+    for row in rows:
+        for column, value in row.items():
+            seen = kinds.setdefault(column, set())
+            if value is not None:
+                seen.add(_kind(value))
+    return [(column, _column_type(seen)) for column, seen in kinds.items()]
+
+
+def _coerce(value, column_type):
+    """
+    Fits a value to its column's type. A value that does not fit (the run
+    changed after the schema was inferred) is written as null rather than
+    failing the export halfway through.
+    """
+    if value is None:
+        return None
+    if column_type == "string":
+        return value if isinstance(value, str) else json.dumps(value)
+    if column_type == "bool":
+        return value if isinstance(value, bool) else None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if column_type == "float":
+        return float(value)
+    return value if isinstance(value, int) else None
+
+
+# ---------- Writers ----------
+
+class _Chunks(io.RawIOBase):
+    """Write-only stream that collects what pyarrow writes until it is drained."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _arrow_schema(pa, schema):
+    types = {"bool": pa.bool_(), "int": pa.int64(), "float": pa.float64(), "string": pa.string()}
+    return pa.schema([(column, types[column_type]) for column, column_type in schema])
+
+
+def write_rows(rows, schema, export_format, batch_rows=EXPORT_BATCH_ROWS):
+    """
+    Encodes rows in the given format, yielding bytes batch by batch.
+
+    Args:
+        rows (iterable): Flat rows (see flatten_run()).
+        schema (list): [(column, type)] from infer_schema().
+        export_format (str): "csv", "parquet" or "arrow".
+        batch_rows (int): Rows encoded per yielded chunk.
+    """
+    check_format(export_format)
+    columns = [column for column, _ in schema]
+
+    if export_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for batch in _batches(rows, batch_rows):
+            for row in batch:
+                # Only the schema's columns are written; anything else in the row is ignored
+                writer.writerow(["" if row.get(column) is None else row[column] for column in columns])
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+        return
+
+    pa = _pyarrow()
+    arrow_schema = _arrow_schema(pa, schema)
+    sink = _Chunks()
+    if export_format == "parquet":
+        writer = pa.parquet.ParquetWriter(sink, arrow_schema)
+    else:
+        writer = pa.ipc.new_stream(sink, arrow_schema)
+    try:
+        for batch in _batches(rows, batch_rows):
+            arrays = {
+                column: [_coerce(row.get(column), column_type) for row in batch]
+                for column, column_type in schema
+            }
+            writer.write_table(pa.Table.from_pydict(arrays, schema=arrow_schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_evaluation(project_id, evaluation, export_format="csv", workflow_id=None, storage=None):
+    """
+    Streams an evaluation's runs in the given format (see write_rows()),
+    optionally only those of one workflow. Reads the runs twice: once for the
+    columns, once to write them. Runs appended in between (the evaluation is
+    still running) are left out, since the columns were settled without them.
+    """
+    check_format(export_format)
+    storage = storage or get_storage()
+    counted = set()
+
+    def rows(first_pass):
+        for wf_id, run in storage.iter_runs(project_id, evaluation):
+            if workflow_id is not None and wf_id != workflow_id:
+                continue
+            key = (wf_id, run.get("variable_set_id"), run.get("run_index"))
+            if first_pass:
+                counted.add(key)
+            elif key not in counted:
+                continue
+            yield flatten_run(wf_id, run)
+
+    return write_rows(rows(False), infer_schema(rows(True)), export_format)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export evaluation runs as CSV, Parquet or Arrow.")
+    parser.add_argument("--project", required=True, help="Project ID.")
+    parser.add_argument("--evaluation", required=True, help="Evaluation ID.")
+    parser.add_argument("--format", default="csv", choices=list(EXPORT_FORMATS))
+    parser.add_argument("--workflow", default=None, help="Only export the runs of this workflow.")
+    parser.add_argument("--output", default=None,
+                        help="Output file (default: <evaluation>.<extension>; '-' writes to stdout).")
+    args = parser.parse_args()
+
+    storage = get_storage()
+    evaluation = storage.load_evaluation(args.project, args.evaluation)
+    if evaluation is None:
+        parser.error(f"Evaluation {args.evaluation} not found in project {args.project}.")
+    try:
+        chunks = export_evaluation(args.project, evaluation, args.format, workflow_id=args.workflow, storage=storage)
+    except ExportError as e:
+        parser.error(str(e))
+
+    output = args.output or f"{args.evaluation}.{EXPORT_FORMATS[args.format]['extension']}"
+    written = 0
+    with (open(sys.stdout.fileno(), "wb", closefd=False) if output == "-" else open(output, "wb")) as f:
+        for chunk in chunks:
+            f.write(chunk)
+            written += len(chunk)
+    if output != "-":
+        print(f"Wrote {written} bytes to {output}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# modules/results_store.py
+
+import os
+import json
+import shutil
+import threading
+from collections import OrderedDict
+
+from .storage import PROJECTS_DIR, RESULTS_PAGE_SIZE, fcntl, page_run_keys, variable_set_positions
+
+RESULTS_DIR = os.path.join(PROJECTS_DIR, "results")
+# Indexed logs kept in memory (least recently used first out); an evicted log is re-read on next use
+RESULTS_LOG_CACHE_SIZE = int(os.getenv("RESULTS_LOG_CACHE_SIZE", "8"))
+
+
+def results_log_reference(project_id, evaluation_id):
+    """The path (relative to PROJECTS_DIR) stored in the project file for an evaluation's log."""
+    return f"results/{project_id}/{evaluation_id}.jsonl"
+
+
+def _results_log_path(project_id, evaluation_id):
+    return os.path.join(PROJECTS_DIR, results_log_reference(project_id, evaluation_id))
+
+
+def run_key(workflow_id, variable_set_id, run_index):
+    return (workflow_id, variable_set_id, run_index)
+
+
+class ResultsLog:
+    """
+    Append-only JSONL log of evaluation runs.
+
+    Every line is either a full run record ({"type": "run", ...}) or a partial
+    update of an existing run ({"type": "update", "fields": {...}}), e.g. notes.
+    Writing a run therefore costs one line, regardless of how many runs the
+    evaluation already has. Records are indexed in memory by
+    (workflow_id, variable_set_id, run_index); lines appended by other processes
+    are picked up incrementally by tailing the file from the last read offset.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._index = {}
+        self._offset = 0
+
+    def _refresh(self):
+        if not os.path.exists(self.path):
+            self._index = {}
+            self._offset = 0
+            return
+        size = os.path.getsize(self.path)
+        if size < self._offset:
+            # File was truncated or replaced; rebuild the index
+            self._index = {}
+            self._offset = 0
+        if size == self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            for raw_line in f:
+                if not raw_line.endswith(b"\n"):
+                    break  # Partially written line; read it next time
+                self._offset += len(raw_line)
+                line = raw_line.strip()
+                if line:
+                    self._apply(json.loads(line.decode("utf-8")))
+
+    def _apply(self, record):
+        key = run_key(record.get("workflow_id"), record.get("variable_set_id"), record.get("run_index"))
+        if record.get("type") == "update":
+            if key in self._index:
+                self._index[key].update(record.get("fields", {}))
+        else:
+            run = {k: v for k, v in record.items() if k not in ("type", "workflow_id")}
+            self._index[key] = run
+
+    def _append(self, record):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with open(self.path, "ab") as f:
+            # Worker processes may append to the same log; keep each record in one piece
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append_run(self, workflow_id, run_result):
+        with self._lock:
+            self._refresh()
+            self._append({"type": "run", "workflow_id": workflow_id, **run_result})
+            self._refresh()
+
+    def update_run(self, workflow_id, variable_set_id, run_index, fields):
+        """Records a partial update of a run. Returns False if the run does not exist."""
+        with self._lock:
+            self._refresh()
+            if run_key(workflow_id, variable_set_id, run_index) not in self._index:
+                return False
+            self._append({
+                "type": "update",
+                "workflow_id": workflow_id,
+                "variable_set_id": variable_set_id,
+                "run_index": run_index,
+                "fields": fields
+            })
+            self._refresh()
+            return True
+
+    def get_run(self, workflow_id, variable_set_id, run_index):
+        with self._lock:
+            self._refresh()
+            return self._index.get(run_key(workflow_id, variable_set_id, run_index))
+
+    def page(self, variable_set_order, workflow_id=None, variable_set_id=None,
+             run_start=None, run_end=None, after=None, limit=RESULTS_PAGE_SIZE):
+        """One page of runs (see storage.page_run_keys()); only the page's runs are copied."""
+        with self._lock:
+            self._refresh()
+            page, total, has_more = page_run_keys(
+                self._index, variable_set_order, workflow_id, variable_set_id, run_start, run_end, after, limit
+            )
+            runs = [{**self._index[key], "workflow_id": key[0]} for key in page]
+        return {"runs": runs, "total": total, "has_more": has_more}
+
+    def iter_runs(self, variable_set_order):
+        """Yields (workflow_id, run) in page order, copying one run at a time."""
+        with self._lock:
+            self._refresh()
+            keys, _, _ = page_run_keys(self._index, variable_set_order, limit=len(self._index))
+        for key in keys:
+            with self._lock:
+                run = self._index.get(key)
+            if run is not None:
+                yield key[0], dict(run)
+
+    def results(self, variable_set_order=None):
+        """
+        Returns the runs grouped per workflow, in the same shape as the legacy
+        evaluation["results"] dict: { workflow_id: [run, ...] }.
+        """
+        variable_set_order = variable_set_order or {}
+        with self._lock:
+            self._refresh()
+            grouped = {}
+            for (wf_id, _, _), run in self._index.items():
+                grouped.setdefault(wf_id, []).append(dict(run))
+        for runs in grouped.values():
+            runs.sort(key=lambda r: (
+                variable_set_order.get(r.get("variable_set_id"), len(variable_set_order)),
+                r.get("run_index", 0)
+            ))
+        return grouped
+
+
+_LOGS = OrderedDict()
+_LOGS_LOCK = threading.Lock()
+
+
+def get_results_log(project_id, evaluation_id):
+    """
+    The evaluation's ResultsLog. At most RESULTS_LOG_CACHE_SIZE logs stay
+    cached; an evicted log still in use keeps working, since every instance
+    tails the same file.
+    """
+    path = _results_log_path(project_id, evaluation_id)
+    with _LOGS_LOCK:
+        log = _LOGS.get(path)
+        if log is None:
+            log = _LOGS[path] = ResultsLog(path)
+        _LOGS.move_to_end(path)
+        while len(_LOGS) > max(1, RESULTS_LOG_CACHE_SIZE):
+            _LOGS.popitem(last=False)
+        return log
+
+
+def append_run(project_id, evaluation_id, workflow_id, run_result):
+    get_results_log(project_id, evaluation_id).append_run(workflow_id, run_result)
+
+
+def update_run(project_id, evaluation_id, workflow_id, variable_set_id, run_index, fields):
+    return get_results_log(project_id, evaluation_id).update_run(workflow_id, variable_set_id, run_index, fields)
+
+
+def load_results(project_id, evaluation):
+    """
+    Loads an evaluation's results from its log, ordered by variable set and run index.
+    Evaluations that still embed their results in the project file are returned as-is.
+    """
+    if "results" in evaluation:
+        return evaluation["results"]
+    variable_set_order = {vs_id: idx for idx, vs_id in enumerate(evaluation.get("variable_sets", {}))}
+    return get_results_log(project_id, evaluation["evaluation_id"]).results(variable_set_order)
+
+
+def query_runs(project_id, evaluation, workflow_id=None, variable_set_id=None,
+               run_start=None, run_end=None, after=None, limit=RESULTS_PAGE_SIZE):
+    """One page of an evaluation's logged runs; see StorageBackend.query_runs()."""
+    return get_results_log(project_id, evaluation["evaluation_id"]).page(
+        variable_set_positions(evaluation), workflow_id, variable_set_id, run_start, run_end, after, limit
+    )
+
+
+def iter_runs(project_id, evaluation):
+    return get_results_log(project_id, evaluation["evaluation_id"]).iter_runs(variable_set_positions(evaluation))
+
+
+def migrate_embedded_results(project_id, evaluation):
+    """
+    Moves results embedded in the project file into the evaluation's log and
+    replaces them with a reference. Returns True if the evaluation was changed,
+    in which case the caller should save the project.
+    """
+    if "results" not in evaluation:
+        if "results_log" not in evaluation:
+            evaluation["results_log"] = results_log_reference(project_id, evaluation["evaluation_id"])
+            return True
+        return False
+
+    log = get_results_log(project_id, evaluation["evaluation_id"])
+    for wf_id, runs in evaluation["results"].items():
+        for run in runs:
+            if log.get_run(wf_id, run.get("variable_set_id"), run.get("run_index")) is None:
+                log.append_run(wf_id, run)
+    del evaluation["results"]
+    evaluation["results_log"] = results_log_reference(project_id, evaluation["evaluation_id"])
+    return True
+
+
+def delete_results(project_id, evaluation_id=None):
+    """Deletes one evaluation's log, or every log of the project if evaluation_id is None."""
+    with _LOGS_LOCK:
+        if evaluation_id is None:
+            project_dir = os.path.join(RESULTS_DIR, project_id)
+            for path in [p for p in _LOGS if os.path.dirname(p) == project_dir]:
+                del _LOGS[path]
+            if os.path.isdir(project_dir):
+                shutil.rmtree(project_dir)
+            return
+        path = _results_log_path(project_id, evaluation_id)
+        _LOGS.pop(path, None)
+        if os.path.exists(path):
+            os.remove(path)
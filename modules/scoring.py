@@ -0,0 +1,263 @@
+# modules/scoring.py
+"""
+Scores an evaluation run against its ideal output.
+
+Only the final response variables of a run are compared (by default the
+outputs of the workflow's last step), never the prompts and call settings
+stored alongside them. Every scorer is linear or close to it in the size of
+its inputs; text diffs are only produced on demand, by compute_diff().
+
+Scorers are plain functions registered with @register_scorer; each receives
+the run's value and the ideal value and returns a float in [0, 1], or None
+when it does not apply (e.g. field comparison of two plain strings).
+"""
+
+import os
+import re
+import json
+import difflib
+import string
+from collections import Counter
+
+try:
+    from rapidfuzz.distance import Levenshtein as _rapidfuzz_levenshtein
+except ImportError:
+    _rapidfuzz_levenshtein = None
+
+EVALUATION_SCORERS = [
+    name.strip() for name in
+    os.getenv("EVALUATION_SCORERS", "exact_match,normalized_match,token_f1,json_fields,edit_similarity").split(",")
+    if name.strip()
+]
+# Without rapidfuzz, edit similarity falls back to pure Python and is skipped beyond this many DP cells
+EDIT_DISTANCE_MAX_CELLS = int(os.getenv("EDIT_DISTANCE_MAX_CELLS", "250000"))
+
+SCORERS = {}
+
+_PUNCTUATION = str.maketrans("", "", string.punctuation)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def register_scorer(name):
+    """Decorator registering fn(run_value, ideal_value) -> float | None under `name`."""
+    def decorator(fn):
+        SCORERS[name] = fn
+        return fn
+    return decorator
+
+
+# ---------- Extracting what to compare ----------
+
+def maybe_json(value):
+    """Parses strings that hold JSON objects or arrays; anything else is returned unchanged."""
+    if isinstance(value, str):
+        stripped = value.strip()
+        if stripped[:1] in ("{", "["):
+            try:
+                return json.loads(stripped)
+            except json.JSONDecodeError:
+                pass
+    return value
+
+
+def response_variables(run_output):
+    """
+    Returns {variable_name: response} per step of a run, in step order:
+    a list of dicts, one per step.
+    """
+    if not isinstance(run_output, list):
+        return []
+    steps = []
+    for step in run_output:
+        variables = {}
+        for call in step.get("calls", []):
+            if call.get("variable_name") and "response" in call:
+                variables[call["variable_name"]] = call["response"]
+        for function in step.get("functions", []):
+            if function.get("output_variable") and "response" in function:
+                variables[function["output_variable"]] = function["response"]
+        steps.append(variables)
+    return steps
+
+
+def final_output(run_output, variables=None):
+    """
+    The part of a run that is scored: the named `variables` if given,
+    otherwise every response of the last step that produced any. A single
+    variable is returned as its bare value.
+    """
+    if not isinstance(run_output, list):
+        return maybe_json(run_output)
+
+    steps = response_variables(run_output)
+    if variables:
+        selected = {}
+        for step_variables in steps:
+            selected.update({k: v for k, v in step_variables.items() if k in variables})
+    else:
+        selected = next((step_variables for step_variables in reversed(steps) if step_variables), {})
+
+    if len(selected) == 1:
+        return maybe_json(next(iter(selected.values())))
+    return {name: maybe_json(value) for name, value in selected.items()}
+
+
+def _as_text(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, indent=2, sort_keys=True, ensure_ascii=False)
+    return "" if value is None else str(value)
+
+
+def normalize_text(text):
+    """Lower-cases, drops punctuation and collapses whitespace."""
+    return _WHITESPACE.sub(" ", _as_text(text).lower().translate(_PUNCTUATION)).strip()
+
+
+def flatten_fields(value, prefix=""):
+    """Flattens nested dicts/lists into {"a.b[0]": leaf}."""
+    if isinstance(value, dict):
+        items = {}
+        for key, child in value.items():
+            items.update(flatten_fields(child, f"{prefix}.{key}" if prefix else str(key)))
+        return items
+    if isinstance(value, list):
+        items = {}
+        for index, child in enumerate(value):
+            items.update(flatten_fields(child, f"{prefix}[{index}]"))
+        return items
+    return {prefix: value}
+
+
+# ---------- Built-in scorers ----------
+
+@register_scorer("exact_match")
+def exact_match(run_value, ideal_value):
+    if isinstance(run_value, (dict, list)) or isinstance(ideal_value, (dict, list)):
+        return float(run_value == ideal_value)
+    return float(_as_text(run_value).strip() == _as_text(ideal_value).strip())
+
+
+@register_scorer("normalized_match")
+def normalized_match(run_value, ideal_value):
+    return float(normalize_text(run_value) == normalize_text(ideal_value))
+
+
+@register_scorer("token_f1")
+def token_f1(run_value, ideal_value):
+    """F1 over the multisets of normalized tokens (SQuAD-style)."""
+    run_tokens = normalize_text(run_value).split()
+    ideal_tokens = normalize_text(ideal_value).split()
+    if not run_tokens or not ideal_tokens:
+        return float(run_tokens == ideal_tokens)
+    common = sum((Counter(run_tokens) & Counter(ideal_tokens)).values())
+    if common == 0:
+        return 0.0
+    precision = common / len(run_tokens)
+    recall = common / len(ideal_tokens)
+    return 2 * precision * recall / (precision + recall)
+
+
+def field_matches(run_value, ideal_value):
+    """
+    {field path: 1 or 0} for every leaf field of a structured ideal output,
+    saying whether the run reproduced it (normalized); None for unstructured outputs.
+    """
+    if not isinstance(ideal_value, (dict, list)) or not isinstance(run_value, (dict, list)):
+        return None
+    run_fields = flatten_fields(run_value)
+    return {
+        path: int(path in run_fields and normalize_text(run_fields[path]) == normalize_text(expected))
+        for path, expected in flatten_fields(ideal_value).items()
+    }
+
+
+@register_scorer("json_fields")
+def json_fields(run_value, ideal_value):
+    """Fraction of the ideal output's leaf fields that the run reproduces (normalized)."""
+    matches = field_matches(run_value, ideal_value)
+    if matches is None:
+        return None
+    if not matches:
+        return float(not flatten_fields(run_value))
+    return sum(matches.values()) / len(matches)
+
+
+def _levenshtein(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+@register_scorer("edit_similarity")
+def edit_similarity(run_value, ideal_value):
+    """1 - normalized Levenshtein distance; uses rapidfuzz when it is installed."""
+    a, b = _as_text(run_value), _as_text(ideal_value)
+    if not a and not b:
+        return 1.0
+    if _rapidfuzz_levenshtein is not None:
+        return _rapidfuzz_levenshtein.normalized_similarity(a, b)
+    if len(a) * len(b) > EDIT_DISTANCE_MAX_CELLS:
+        return None
+    return 1.0 - _levenshtein(a, b) / max(len(a), len(b))
+
+
+# ---------- Entry points ----------
+
+def score_output(run_output, ideal_output, scorers=None, variables=None):
+    """
+    Scores a run against the ideal output.
+
+    Args:
+        run_output: The run's per-step outputs (or an error dict).
+        ideal_output: The expected output; JSON strings are compared as JSON.
+        scorers (list): Scorer names; defaults to EVALUATION_SCORERS.
+        variables (list): Response variables to compare; defaults to the last step's.
+
+    Returns:
+        dict: {"scores": {name: float|None}, "match_score": float|None}; match_score
+        is json_fields for structured outputs and token_f1 otherwise. Structured
+        outputs also get "field_matches" (see field_matches()).
+    """
+    run_value = final_output(run_output, variables)
+    ideal_value = maybe_json(ideal_output)
+
+    scores = {}
+    for name in scorers or EVALUATION_SCORERS:
+        scorer = SCORERS.get(name)
+        if scorer is None:
+            continue
+        score = scorer(run_value, ideal_value)
+        scores[name] = round(score, 4) if score is not None else None
+
+    primary = "json_fields" if scores.get("json_fields") is not None else "token_f1"
+    if primary not in scores:
+        primary = next(iter(scores), None)
+    comparison = {
+        "scores": scores,
+        "match_score": scores.get(primary) if primary else None
+    }
+    matches = field_matches(run_value, ideal_value)
+    if matches:
+        comparison["field_matches"] = matches
+    return comparison
+
+
+def preview_text(run_output, variables=None, max_chars=300):
+    """The run's final output as text, cut to max_chars (for result listings)."""
+    text = _as_text(final_output(run_output, variables))
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + "…"
+
+
+def compute_diff(run_output, ideal_output, variables=None):
+    """Unified diff between the ideal output and the run's final output (computed on request)."""
+    run_text = _as_text(final_output(run_output, variables))
+    ideal_text = _as_text(maybe_json(ideal_output))
+    return "\n".join(difflib.unified_diff(
+        ideal_text.splitlines(), run_text.splitlines(), fromfile="ideal", tofile="run", lineterm=""
+    ))
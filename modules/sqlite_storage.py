@@ -0,0 +1,590 @@
+# modules/sqlite_storage.py
+
+import os
+import json
+import time
+import sqlite3
+import threading
+import contextlib
+
+from .storage import (
+    StorageBackend, PROJECT_META_FIELDS, PROJECT_CACHE_SIZE, RESULTS_PAGE_SIZE,
+    sort_project_summaries, page_run_keys, variable_set_positions
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    project_id TEXT PRIMARY KEY,
+    name TEXT,
+    description TEXT,
+    common_variable_names TEXT,
+    extra TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS workflows (
+    project_id TEXT NOT NULL,
+    workflow_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT,
+    workflow_description TEXT,
+    variables TEXT,
+    extra TEXT,
+    PRIMARY KEY (project_id, workflow_id)
+);
+CREATE TABLE IF NOT EXISTS steps (
+    project_id TEXT NOT NULL,
+    workflow_id TEXT NOT NULL,
+    step_id TEXT,
+    position INTEGER NOT NULL,
+    title TEXT,
+    description TEXT,
+    inputs TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_steps_workflow ON steps (project_id, workflow_id, position);
+CREATE TABLE IF NOT EXISTS calls (
+    project_id TEXT NOT NULL,
+    workflow_id TEXT NOT NULL,
+    step_position INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    call_id TEXT,
+    title TEXT,
+    model_name TEXT,
+    variable_name TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_calls_workflow ON calls (project_id, workflow_id, step_position, kind, position);
+CREATE TABLE IF NOT EXISTS evaluations (
+    project_id TEXT NOT NULL,
+    evaluation_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT,
+    description TEXT,
+    variable_sets TEXT,
+    extra TEXT,
+    PRIMARY KEY (project_id, evaluation_id)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    project_id TEXT NOT NULL,
+    evaluation_id TEXT NOT NULL,
+    workflow_id TEXT NOT NULL,
+    variable_set_id TEXT NOT NULL,
+    run_index INTEGER NOT NULL,
+    data TEXT,
+    PRIMARY KEY (project_id, evaluation_id, workflow_id, variable_set_id, run_index)
+);
+"""
+
+WORKFLOW_FIELDS = ("workflow_id", "name", "workflow_description", "variables", "steps")
+STEP_FIELDS = ("step_id", "title", "description", "inputs", "calls", "functions")
+EVALUATION_FIELDS = ("evaluation_id", "name", "description", "variable_sets", "results")
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _loads(text, default=None):
+    return json.loads(text) if text else default
+
+
+def _extra(data, known_fields):
+    return _dumps({k: v for k, v in data.items() if k not in known_fields})
+
+
+class SqliteStorage(StorageBackend):
+    """
+    Stores projects, workflows, steps, calls, evaluations and evaluation runs as
+    rows in one SQLite database, so routes can read and update a single
+    workflow or evaluation without touching the rest of the project.
+    Fields the schema does not know about are kept in an `extra` JSON column,
+    so documents round-trip unchanged.
+    Every write runs in a BEGIN IMMEDIATE transaction while holding the project's
+    lock, and bumps the project's version column.
+    """
+
+    def __init__(self, db_path, cache_size=PROJECT_CACHE_SIZE):
+        super().__init__(os.path.join(os.path.dirname(db_path) or ".", ".locks"), cache_size)
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def _write(self, project_id=None):
+        """
+        Runs an immediate (write) transaction that commits on success. With a
+        project_id, the project's lock is held as well; run records are written
+        without it so evaluations do not contend with edits.
+        """
+        with (self.lock(project_id) if project_id is not None else contextlib.nullcontext()):
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def ensure_ready(self):
+        self._conn()
+
+    # ---------- Projects ----------
+
+    def project_exists(self, project_id):
+        row = self._conn().execute("SELECT 1 FROM projects WHERE project_id = ?", (project_id,)).fetchone()
+        return row is not None
+
+    def list_project_ids(self):
+        rows = self._conn().execute("SELECT project_id FROM projects ORDER BY project_id").fetchall()
+        return [row["project_id"] for row in rows]
+
+    def list_project_summaries(self):
+        rows = self._conn().execute(
+            "SELECT p.project_id, p.name, p.description, p.updated_at, "
+            "(SELECT COUNT(*) FROM workflows w WHERE w.project_id = p.project_id) AS workflow_count, "
+            "(SELECT COUNT(*) FROM evaluations e WHERE e.project_id = p.project_id) AS evaluation_count "
+            "FROM projects p"
+        ).fetchall()
+        return sort_project_summaries([
+            {
+                "project_id": row["project_id"],
+                "name": row["name"],
+                "description": row["description"],
+                "workflow_count": row["workflow_count"],
+                "evaluation_count": row["evaluation_count"],
+                "last_modified": row["updated_at"]
+            }
+            for row in rows
+        ])
+
+    def _project_row_to_meta(self, row):
+        project = {
+            "project_id": row["project_id"],
+            "name": row["name"],
+            "description": row["description"],
+            "common_variable_names": _loads(row["common_variable_names"], []),
+            "version": row["version"]
+        }
+        project.update(_loads(row["extra"], {}))
+        return project
+
+    def load_project_meta(self, project_id):
+        row = self._conn().execute("SELECT * FROM projects WHERE project_id = ?", (project_id,)).fetchone()
+        if row is None:
+            return None
+        return self._project_row_to_meta(row)
+
+    def current_version(self, project_id):
+        row = self._conn().execute("SELECT version FROM projects WHERE project_id = ?", (project_id,)).fetchone()
+        return row["version"] if row is not None else None
+
+    def _cache_token(self, project_id):
+        version = self.current_version(project_id)
+        if version is None:
+            return None
+        return (version, self._local_version(project_id))
+
+    def _touch(self, conn, project_id):
+        conn.execute(
+            "UPDATE projects SET updated_at = ?, version = version + 1 WHERE project_id = ?",
+            (time.time(), project_id)
+        )
+
+    def _load_project_uncached(self, project_id):
+        project = self.load_project_meta(project_id)
+        if project is None:
+            return None
+        project["workflows"] = self.list_workflows(project_id)
+        project["evaluations"] = self.list_evaluations(project_id)
+        return project
+
+    def _write_project_row(self, conn, project_id, data):
+        conn.execute(
+            "INSERT INTO projects (project_id, name, description, common_variable_names, extra, version, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, 1, ?) "
+            "ON CONFLICT(project_id) DO UPDATE SET name = excluded.name, description = excluded.description, "
+            "common_variable_names = excluded.common_variable_names, extra = excluded.extra, "
+            "version = projects.version + 1, updated_at = excluded.updated_at",
+            (
+                project_id,
+                data.get("name"),
+                data.get("description"),
+                _dumps(data.get("common_variable_names", [])),
+                _extra(data, PROJECT_META_FIELDS + ("workflows", "evaluations")),
+                time.time()
+            )
+        )
+
+    def save_project(self, project_id, data):
+        with self._write(project_id) as conn:
+            self._write_project_row(conn, project_id, data)
+
+            conn.execute("DELETE FROM workflows WHERE project_id = ?", (project_id,))
+            conn.execute("DELETE FROM steps WHERE project_id = ?", (project_id,))
+            conn.execute("DELETE FROM calls WHERE project_id = ?", (project_id,))
+            for position, workflow in enumerate(data.get("workflows", [])):
+                self._write_workflow(conn, project_id, workflow, position)
+
+            conn.execute("DELETE FROM evaluations WHERE project_id = ?", (project_id,))
+            evaluation_ids = []
+            for position, evaluation in enumerate(data.get("evaluations", [])):
+                self._write_evaluation(conn, project_id, evaluation, position)
+                evaluation_ids.append(evaluation["evaluation_id"])
+
+            # Runs of evaluations that are no longer part of the project go with them
+            placeholders = ", ".join("?" for _ in evaluation_ids)
+            conn.execute(
+                f"DELETE FROM runs WHERE project_id = ? AND evaluation_id NOT IN ({placeholders})",
+                (project_id, *evaluation_ids)
+            )
+        self._bump_version(project_id)
+
+    def save_project_meta(self, project_id, meta):
+        with self._write(project_id) as conn:
+            current = self.load_project_meta(project_id)
+            if current is None:
+                return False
+            current.update({k: v for k, v in meta.items() if k not in ("project_id", "version")})
+            self._write_project_row(conn, project_id, current)
+        self._bump_version(project_id)
+        return True
+
+    def delete_project(self, project_id):
+        with self._write(project_id) as conn:
+            cursor = conn.execute("DELETE FROM projects WHERE project_id = ?", (project_id,))
+            for table in ("workflows", "steps", "calls", "evaluations", "runs"):
+                conn.execute(f"DELETE FROM {table} WHERE project_id = ?", (project_id,))
+        self._bump_version(project_id)
+        return cursor.rowcount > 0
+
+    # ---------- Workflows ----------
+
+    def _write_workflow(self, conn, project_id, workflow, position):
+        workflow_id = workflow["workflow_id"]
+        conn.execute(
+            "INSERT INTO workflows (project_id, workflow_id, position, name, workflow_description, variables, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                project_id, workflow_id, position,
+                workflow.get("name"),
+                workflow.get("workflow_description"),
+                _dumps(workflow.get("variables", {})),
+                _extra(workflow, WORKFLOW_FIELDS)
+            )
+        )
+        for step_position, step in enumerate(workflow.get("steps", [])):
+            conn.execute(
+                "INSERT INTO steps (project_id, workflow_id, step_id, position, title, description, inputs, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    project_id, workflow_id, step.get("step_id"), step_position,
+                    step.get("title"), step.get("description"), step.get("inputs"),
+                    _extra(step, STEP_FIELDS)
+                )
+            )
+            call_rows = [("call", i, c) for i, c in enumerate(step.get("calls", []))]
+            call_rows += [("function", i, f) for i, f in enumerate(step.get("functions", []))]
+            conn.executemany(
+                "INSERT INTO calls (project_id, workflow_id, step_position, kind, position, call_id, title, "
+                "model_name, variable_name, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        project_id, workflow_id, step_position, kind, i,
+                        c.get("call_id"), c.get("title"), c.get("model_name"),
+                        c.get("variable_name") or c.get("output_variable"),
+                        _dumps(c)
+                    )
+                    for kind, i, c in call_rows
+                ]
+            )
+
+    def _delete_workflow_rows(self, conn, project_id, workflow_id):
+        for table in ("workflows", "steps", "calls"):
+            conn.execute(f"DELETE FROM {table} WHERE project_id = ? AND workflow_id = ?", (project_id, workflow_id))
+
+    def _assemble_workflows(self, project_id, workflow_id=None):
+        conn = self._conn()
+        where = "project_id = ?" + (" AND workflow_id = ?" if workflow_id else "")
+        args = (project_id, workflow_id) if workflow_id else (project_id,)
+
+        workflows = {}
+        order = []
+        for row in conn.execute(f"SELECT * FROM workflows WHERE {where} ORDER BY position", args):
+            workflow = {
+                "workflow_id": row["workflow_id"],
+                "name": row["name"],
+                "workflow_description": row["workflow_description"],
+                "steps": [],
+                "variables": _loads(row["variables"], {})
+            }
+            workflow.update(_loads(row["extra"], {}))
+            workflows[row["workflow_id"]] = workflow
+            order.append(row["workflow_id"])
+
+        steps = {}
+        for row in conn.execute(f"SELECT * FROM steps WHERE {where} ORDER BY workflow_id, position", args):
+            step = {
+                "step_id": row["step_id"],
+                "title": row["title"],
+                "description": row["description"],
+                "inputs": row["inputs"],
+                "calls": [],
+                "functions": []
+            }
+            step.update(_loads(row["extra"], {}))
+            steps[(row["workflow_id"], row["position"])] = step
+            workflows[row["workflow_id"]]["steps"].append(step)
+
+        for row in conn.execute(
+            f"SELECT workflow_id, step_position, kind, data FROM calls WHERE {where} "
+            "ORDER BY workflow_id, step_position, kind, position", args
+        ):
+            step = steps.get((row["workflow_id"], row["step_position"]))
+            if step is not None:
+                step["calls" if row["kind"] == "call" else "functions"].append(_loads(row["data"], {}))
+
+        return [workflows[wf_id] for wf_id in order]
+
+    def list_workflows(self, project_id):
+        return self._assemble_workflows(project_id)
+
+    def load_workflow(self, project_id, workflow_id):
+        workflows = self._assemble_workflows(project_id, workflow_id)
+        return workflows[0] if workflows else None
+
+    def save_workflow(self, project_id, workflow):
+        with self._write(project_id) as conn:
+            if not self.project_exists(project_id):
+                return False
+            row = conn.execute(
+                "SELECT position FROM workflows WHERE project_id = ? AND workflow_id = ?",
+                (project_id, workflow["workflow_id"])
+            ).fetchone()
+            if row is not None:
+                position = row["position"]
+            else:
+                position = conn.execute(
+                    "SELECT COALESCE(MAX(position) + 1, 0) FROM workflows WHERE project_id = ?", (project_id,)
+                ).fetchone()[0]
+            self._delete_workflow_rows(conn, project_id, workflow["workflow_id"])
+            self._write_workflow(conn, project_id, workflow, position)
+            self._touch(conn, project_id)
+        self._bump_version(project_id)
+        return True
+
+    def delete_workflow(self, project_id, workflow_id):
+        with self._write(project_id) as conn:
+            exists = conn.execute(
+                "SELECT 1 FROM workflows WHERE project_id = ? AND workflow_id = ?", (project_id, workflow_id)
+            ).fetchone()
+            if exists is None:
+                return False
+            self._delete_workflow_rows(conn, project_id, workflow_id)
+            self._touch(conn, project_id)
+        self._bump_version(project_id)
+        return True
+
+    # ---------- Evaluations ----------
+
+    def _write_evaluation(self, conn, project_id, evaluation, position):
+        conn.execute(
+            "INSERT INTO evaluations (project_id, evaluation_id, position, name, description, variable_sets, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                project_id, evaluation["evaluation_id"], position,
+                evaluation.get("name"), evaluation.get("description"),
+                _dumps(evaluation.get("variable_sets", {})),
+                _extra(evaluation, EVALUATION_FIELDS + ("results_log",))
+            )
+        )
+        # Results embedded by older project files become rows
+        for wf_id, runs in (evaluation.get("results") or {}).items():
+            for run in runs:
+                self._write_run(conn, project_id, evaluation["evaluation_id"], wf_id, run)
+
+    def _row_to_evaluation(self, row):
+        evaluation = {
+            "evaluation_id": row["evaluation_id"],
+            "name": row["name"],
+            "description": row["description"],
+            "variable_sets": _loads(row["variable_sets"], {})
+        }
+        evaluation.update(_loads(row["extra"], {}))
+        return evaluation
+
+    def list_evaluations(self, project_id):
+        rows = self._conn().execute(
+            "SELECT * FROM evaluations WHERE project_id = ? ORDER BY position", (project_id,)
+        ).fetchall()
+        return [self._row_to_evaluation(row) for row in rows]
+
+    def load_evaluation(self, project_id, evaluation_id):
+        row = self._conn().execute(
+            "SELECT * FROM evaluations WHERE project_id = ? AND evaluation_id = ?", (project_id, evaluation_id)
+        ).fetchone()
+        return self._row_to_evaluation(row) if row is not None else None
+
+    def save_evaluation(self, project_id, evaluation):
+        with self._write(project_id) as conn:
+            if not self.project_exists(project_id):
+                return False
+            row = conn.execute(
+                "SELECT position FROM evaluations WHERE project_id = ? AND evaluation_id = ?",
+                (project_id, evaluation["evaluation_id"])
+            ).fetchone()
+            if row is not None:
+                position = row["position"]
+            else:
+                position = conn.execute(
+                    "SELECT COALESCE(MAX(position) + 1, 0) FROM evaluations WHERE project_id = ?", (project_id,)
+                ).fetchone()[0]
+            conn.execute(
+                "DELETE FROM evaluations WHERE project_id = ? AND evaluation_id = ?",
+                (project_id, evaluation["evaluation_id"])
+            )
+            self._write_evaluation(conn, project_id, evaluation, position)
+            self._touch(conn, project_id)
+        self._bump_version(project_id)
+        evaluation.pop("results", None)
+        return True
+
+    def delete_evaluation(self, project_id, evaluation_id):
+        with self._write(project_id) as conn:
+            cursor = conn.execute(
+                "DELETE FROM evaluations WHERE project_id = ? AND evaluation_id = ?", (project_id, evaluation_id)
+            )
+            conn.execute("DELETE FROM runs WHERE project_id = ? AND evaluation_id = ?", (project_id, evaluation_id))
+            self._touch(conn, project_id)
+        self._bump_version(project_id)
+        return cursor.rowcount > 0
+
+    # ---------- Evaluation runs ----------
+
+    def _write_run(self, conn, project_id, evaluation_id, workflow_id, run_result):
+        conn.execute(
+            "INSERT OR REPLACE INTO runs (project_id, evaluation_id, workflow_id, variable_set_id, run_index, data) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                project_id, evaluation_id, workflow_id,
+                run_result.get("variable_set_id"), run_result.get("run_index"),
+                _dumps(run_result)
+            )
+        )
+
+    def append_run(self, project_id, evaluation_id, workflow_id, run_result):
+        with self._write() as conn:
+            self._write_run(conn, project_id, evaluation_id, workflow_id, run_result)
+
+    def update_run(self, project_id, evaluation_id, workflow_id, variable_set_id, run_index, fields):
+        with self._write() as conn:
+            key = (project_id, evaluation_id, workflow_id, variable_set_id, run_index)
+            row = conn.execute(
+                "SELECT data FROM runs WHERE project_id = ? AND evaluation_id = ? AND workflow_id = ? "
+                "AND variable_set_id = ? AND run_index = ?", key
+            ).fetchone()
+            if row is None:
+                return False
+            run = _loads(row["data"], {})
+            run.update(fields)
+            conn.execute(
+                "UPDATE runs SET data = ? WHERE project_id = ? AND evaluation_id = ? AND workflow_id = ? "
+                "AND variable_set_id = ? AND run_index = ?", (_dumps(run), *key)
+            )
+        return True
+
+    def load_results(self, project_id, evaluation):
+        variable_set_order = {vs_id: idx for idx, vs_id in enumerate(evaluation.get("variable_sets", {}))}
+        rows = self._conn().execute(
+            "SELECT workflow_id, data FROM runs WHERE project_id = ? AND evaluation_id = ?",
+            (project_id, evaluation["evaluation_id"])
+        ).fetchall()
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row["workflow_id"], []).append(_loads(row["data"], {}))
+        for runs in grouped.values():
+            runs.sort(key=lambda r: (
+                variable_set_order.get(r.get("variable_set_id"), len(variable_set_order)),
+                r.get("run_index", 0)
+            ))
+        return grouped
+
+    def query_runs(self, project_id, evaluation, workflow_id=None, variable_set_id=None,
+                   run_start=None, run_end=None, after=None, limit=RESULTS_PAGE_SIZE):
+        # Filter and order on the keys alone, then read the data of the page's runs only
+        conditions, params = ["project_id = ?", "evaluation_id = ?"], [project_id, evaluation["evaluation_id"]]
+        for column, operator, value in (("workflow_id", "=", workflow_id), ("variable_set_id", "=", variable_set_id),
+                                        ("run_index", ">=", run_start), ("run_index", "<", run_end)):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.append(value)
+        conn = self._conn()
+        keys = [
+            (row["workflow_id"], row["variable_set_id"], row["run_index"])
+            for row in conn.execute(
+                f"SELECT workflow_id, variable_set_id, run_index FROM runs WHERE {' AND '.join(conditions)}", params
+            )
+        ]
+        page, total, has_more = page_run_keys(
+            keys, variable_set_positions(evaluation), workflow_id, variable_set_id, run_start, run_end, after, limit
+        )
+        runs = []
+        for wf_id, vs_id, run_index in page:
+            row = conn.execute(
+                "SELECT data FROM runs WHERE project_id = ? AND evaluation_id = ? AND workflow_id = ? "
+                "AND variable_set_id = ? AND run_index = ?",
+                (project_id, evaluation["evaluation_id"], wf_id, vs_id, run_index)
+            ).fetchone()
+            runs.append({**_loads(row["data"] if row else None, {}), "workflow_id": wf_id})
+        return {"runs": runs, "total": total, "has_more": has_more}
+
+    def iter_runs(self, project_id, evaluation):
+        # Ordered on the keys alone, like the JSON backend (the evaluation's variable set order),
+        # then each run's data is read and decoded in turn, so the runs are never all in memory
+        conn = self._conn()
+        keys = [
+            (row["workflow_id"], row["variable_set_id"], row["run_index"])
+            for row in conn.execute(
+                "SELECT workflow_id, variable_set_id, run_index FROM runs WHERE project_id = ? AND evaluation_id = ?",
+                (project_id, evaluation["evaluation_id"])
+            )
+        ]
+        ordered, _, _ = page_run_keys(keys, variable_set_positions(evaluation), limit=len(keys))
+        for wf_id, vs_id, run_index in ordered:
+            row = conn.execute(
+                "SELECT data FROM runs WHERE project_id = ? AND evaluation_id = ? AND workflow_id = ? "
+                "AND variable_set_id = ? AND run_index = ?",
+                (project_id, evaluation["evaluation_id"], wf_id, vs_id, run_index)
+            ).fetchone()
+            if row is not None:
+                yield wf_id, _loads(row["data"], {})
+
+    def migrate_embedded_results(self, project_id, evaluation):
+        if "results" not in evaluation:
+            return False
+        with self._write() as conn:
+            for wf_id, runs in evaluation["results"].items():
+                for run in runs:
+                    self._write_run(conn, project_id, evaluation["evaluation_id"], wf_id, run)
+        del evaluation["results"]
+        return True
+
+    def delete_results(self, project_id, evaluation_id=None):
+        with self._write() as conn:
+            if evaluation_id is None:
+                conn.execute("DELETE FROM runs WHERE project_id = ?", (project_id,))
+            else:
+                conn.execute("DELETE FROM runs WHERE project_id = ? AND evaluation_id = ?", (project_id, evaluation_id))
@@ -1,31 +1,823 @@
 # modules/storage.py
 
+import copy
 import json
+import heapq
 import os
+import threading
+import contextlib
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; locks then only cover threads of one process
+    fcntl = None
 
 STORAGE_DIR = "workflows_data"
 PROJECTS_DIR = "projects_data"  # Directory for projects
 
+# "json" keeps one JSON file per project; "sqlite" stores every entity as rows
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").lower()
+SQLITE_DB_PATH = os.getenv("STORAGE_SQLITE_PATH", os.path.join(PROJECTS_DIR, "projects.sqlite3"))
+
+PROJECT_META_FIELDS = ("project_id", "name", "description", "common_variable_names", "version")
+
+# Number of parsed projects kept in memory per process
+PROJECT_CACHE_SIZE = int(os.getenv("PROJECT_CACHE_SIZE", "32"))
+
+# Summary index of all projects kept next to the project files by the JSON backend
+PROJECT_INDEX_FILE = "_index.json"
+
+# Runs returned per page of evaluation results (query_runs)
+RESULTS_PAGE_SIZE = int(os.getenv("RESULTS_PAGE_SIZE", "50"))
+RESULTS_MAX_PAGE_SIZE = 500
+
+
+def project_summary(project_id, data, last_modified):
+    """Builds the summary entry shown on the projects listing."""
+    return {
+        "project_id": project_id,
+        "name": data.get("name", "Untitled Project"),
+        "description": data.get("description", ""),
+        "workflow_count": len(data.get("workflows", [])),
+        "evaluation_count": len(data.get("evaluations", [])),
+        "last_modified": last_modified
+    }
+
+
+def sort_project_summaries(summaries):
+    return sorted(summaries, key=lambda s: ((s.get("name") or "").lower(), s["project_id"]))
+
+
+def variable_set_positions(evaluation):
+    """{variable_set_id: position} in the order the evaluation lists its variable sets."""
+    return {vs_id: idx for idx, vs_id in enumerate(evaluation.get("variable_sets", {}))}
+
+
+def run_sort_key(variable_set_order, workflow_id, variable_set_id, run_index):
+    """
+    Position of a run in paginated results: by variable set (in evaluation
+    order), then workflow, then run index. Also used as the pagination cursor.
+    """
+    return (
+        variable_set_order.get(variable_set_id, len(variable_set_order)),
+        str(variable_set_id),
+        str(workflow_id),
+        run_index if isinstance(run_index, int) else -1
+    )
+
+
+def page_run_keys(keys, variable_set_order, workflow_id=None, variable_set_id=None,
+                  run_start=None, run_end=None, after=None, limit=RESULTS_PAGE_SIZE):
+    """
+    Selects one page of runs from their (workflow_id, variable_set_id, run_index) keys.
+
+    Args:
+        keys (iterable): Keys of every run of the evaluation.
+        variable_set_order (dict): See variable_set_positions().
+        workflow_id, variable_set_id (str): Optional filters.
+        run_start, run_end (int): Optional run index range, end exclusive.
+        after (tuple): run_sort_key() of the last run of the previous page.
+        limit (int): Page size.
+
+    Returns:
+        tuple: (page keys, number of matching runs, whether more pages follow)
+    """
+    after = tuple(after) if after else None
+    total = 0
+    selected = []
+    for key in keys:
+        wf_id, vs_id, run_index = key
+        if workflow_id is not None and wf_id != workflow_id:
+            continue
+        if variable_set_id is not None and vs_id != variable_set_id:
+            continue
+        if run_start is not None and (not isinstance(run_index, int) or run_index < run_start):
+            continue
+        if run_end is not None and (not isinstance(run_index, int) or run_index >= run_end):
+            continue
+        total += 1
+        sort_key = run_sort_key(variable_set_order, *key)
+        if after is None or sort_key > after:
+            selected.append((sort_key, key))
+
+    # Only the page (plus one, to tell whether more follow) needs to be ordered
+    page = heapq.nsmallest(limit + 1, selected)
+    return [key for _, key in page[:limit]], total, len(page) > limit
+
+
+def atomic_write_json(path, data, indent=None):
+    """
+    Writes JSON to a temporary file in the same directory and renames it over `path`,
+    so readers only ever see the old or the new document, never a partial one.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class VersionConflict(Exception):
+    """Raised when a write expects a project version that is no longer current."""
+
+    def __init__(self, project_id, expected_version, current_version):
+        super().__init__(
+            f"Project {project_id} was modified concurrently "
+            f"(expected version {expected_version}, current version {current_version})."
+        )
+        self.project_id = project_id
+        self.expected_version = expected_version
+        self.current_version = current_version
+
+
+class ProjectLocks:
+    """
+    Reentrant per-project read/write locks that also hold across processes.
+
+    Every acquisition opens its own descriptor on <lock_dir>/<project_id>.lock and
+    flocks it, so threads of one process exclude each other exactly like separate
+    worker processes do. A thread that already holds a project's lock may acquire
+    it again (e.g. save_workflow calling save_project). Without fcntl this falls
+    back to one exclusive thread lock per project.
+    """
+
+    def __init__(self, lock_dir):
+        self.lock_dir = lock_dir
+        self._held = threading.local()
+        self._thread_locks = {}
+        self._thread_locks_guard = threading.Lock()
+
+    def _acquire(self, key, exclusive):
+        if fcntl is None:
+            with self._thread_locks_guard:
+                lock = self._thread_locks.setdefault(key, threading.Lock())
+            lock.acquire()
+            return lock.release
+
+        os.makedirs(self.lock_dir, exist_ok=True)
+        fd = os.open(os.path.join(self.lock_dir, f"{key}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        except BaseException:
+            os.close(fd)
+            raise
+
+        def release():
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        return release
+
+    @contextlib.contextmanager
+    def hold(self, key, exclusive=True):
+        held = self._held.__dict__.setdefault("locks", {})
+        if key in held:
+            if exclusive and not held[key]["exclusive"]:
+                raise RuntimeError(f"Cannot upgrade the shared lock on {key} to an exclusive one.")
+            held[key]["depth"] += 1
+            try:
+                yield
+            finally:
+                held[key]["depth"] -= 1
+            return
+
+        release = self._acquire(key, exclusive)
+        held[key] = {"exclusive": exclusive, "depth": 1}
+        try:
+            yield
+        finally:
+            del held[key]
+            release()
+
+
+class ProjectCache:
+    """
+    Bounded LRU cache of parsed projects, keyed by project id.
+
+    Every entry remembers the version token it was loaded at; a lookup with a
+    different token (the file or row changed) counts as a miss and drops the entry.
+    Cached projects are shared, so callers must copy them before mutating.
+    """
+
+    def __init__(self, max_size=PROJECT_CACHE_SIZE):
+        self.max_size = max(0, int(max_size))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, project_id, version):
+        with self._lock:
+            entry = self._entries.get(project_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(project_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[project_id]
+            self.misses += 1
+            return None
+
+    def put(self, project_id, version, data):
+        if self.max_size == 0:
+            return
+        with self._lock:
+            self._entries[project_id] = (version, data)
+            self._entries.move_to_end(project_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, project_id=None):
+        with self._lock:
+            if project_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(project_id, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None
+            }
+
+
+class StorageBackend:
+    """
+    Base class for project storage backends.
+
+    Subclasses implement the project-level and run-level methods. The
+    workflow- and evaluation-level methods below fall back to a full project
+    load/save; backends that can address single entities override them.
+
+    Parsed projects are served from a ProjectCache. Subclasses provide
+    _load_project_uncached() and a cheap _cache_token(), and call
+    _bump_version() after every write so this process never reads stale data.
+
+    Writes hold the project's ProjectLocks entry; transaction() extends that to a
+    whole read-modify-write sequence and checks the project's version number.
+    """
+
+    def __init__(self, lock_dir, cache_size=PROJECT_CACHE_SIZE):
+        self.cache = ProjectCache(cache_size)
+        self.locks = ProjectLocks(lock_dir)
+        self._versions = {}
+        self._versions_lock = threading.Lock()
+
+    def lock(self, project_id, exclusive=True):
+        return self.locks.hold(project_id, exclusive)
+
+    @contextlib.contextmanager
+    def transaction(self, project_id, expected_version=None):
+        """
+        Holds the project's write lock for the duration of the block.
+
+        Raises:
+            VersionConflict: If expected_version is given and the project has
+            been saved since the caller read that version.
+        """
+        with self.lock(project_id, exclusive=True):
+            if expected_version is not None:
+                current = self.current_version(project_id)
+                if current is not None and current != expected_version:
+                    raise VersionConflict(project_id, expected_version, current)
+            yield
+
+    def _bump_version(self, project_id):
+        with self._versions_lock:
+            self._versions[project_id] = self._versions.get(project_id, 0) + 1
+        self.cache.invalidate(project_id)
+
+    def _local_version(self, project_id):
+        with self._versions_lock:
+            return self._versions.get(project_id, 0)
+
+    # ---------- Projects ----------
+
+    def ensure_ready(self):
+        raise NotImplementedError
+
+    def project_exists(self, project_id):
+        raise NotImplementedError
+
+    def list_project_ids(self):
+        raise NotImplementedError
+
+    def list_project_summaries(self):
+        """Returns the summary (see project_summary) of every project, sorted by name."""
+        summaries = []
+        for project_id in self.list_project_ids():
+            project = self.read_project(project_id)
+            if project is not None:
+                summaries.append(project_summary(project_id, project, None))
+        return sort_project_summaries(summaries)
+
+    def current_version(self, project_id):
+        """Returns the project's version number, incremented by every save, or None if it does not exist."""
+        project = self.read_project(project_id)
+        return project.get("version", 0) if project is not None else None
+
+    def _cache_token(self, project_id):
+        """Returns a token that changes whenever the stored project changes, or None if it does not exist."""
+        raise NotImplementedError
+
+    def _load_project_uncached(self, project_id):
+        raise NotImplementedError
+
+    def read_project(self, project_id):
+        """
+        Returns the cached parsed project, loading it on a miss.
+        The returned dict is shared with the cache and must not be mutated.
+        """
+        version = self._cache_token(project_id)
+        if version is None:
+            self.cache.invalidate(project_id)
+            return None
+        data = self.cache.get(project_id, version)
+        if data is None:
+            data = self._load_project_uncached(project_id)
+            if data is not None:
+                self.cache.put(project_id, version, data)
+        return data
+
+    def load_project(self, project_id):
+        """Returns a private copy of the project that the caller may modify."""
+        data = self.read_project(project_id)
+        return copy.deepcopy(data) if data is not None else None
+
+    def save_project(self, project_id, data):
+        raise NotImplementedError
+
+    def delete_project(self, project_id):
+        raise NotImplementedError
+
+    def load_project_meta(self, project_id):
+        """Returns the project's own fields (name, description, ...) without workflows or evaluations."""
+        project = self.read_project(project_id)
+        if project is None:
+            return None
+        return {field: copy.deepcopy(project.get(field)) for field in PROJECT_META_FIELDS}
+
+    def _copy_for_update(self, project_id):
+        # Only the top-level dict and the entity lists are copied; untouched entities stay shared
+        project = self.read_project(project_id)
+        if project is None:
+            return None
+        project = dict(project)
+        project["workflows"] = list(project.get("workflows", []))
+        project["evaluations"] = list(project.get("evaluations", []))
+        return project
+
+    def save_project_meta(self, project_id, meta):
+        with self.lock(project_id):
+            project = self._copy_for_update(project_id)
+            if project is None:
+                return False
+            for field in PROJECT_META_FIELDS:
+                if field in meta and field != "project_id":
+                    project[field] = meta[field]
+            self.save_project(project_id, project)
+            return True
+
+    # ---------- Workflows ----------
+
+    def list_workflows(self, project_id):
+        project = self.read_project(project_id)
+        return copy.deepcopy(project.get("workflows", [])) if project else []
+
+    def load_workflow(self, project_id, workflow_id):
+        project = self.read_project(project_id)
+        if project is None:
+            return None
+        workflow = next((wf for wf in project.get("workflows", []) if wf["workflow_id"] == workflow_id), None)
+        return copy.deepcopy(workflow)
+
+    def save_workflow(self, project_id, workflow):
+        """Replaces the workflow with the same workflow_id, or appends it if it is new."""
+        with self.lock(project_id):
+            project = self._copy_for_update(project_id)
+            if project is None:
+                return False
+            workflows = project.setdefault("workflows", [])
+            for idx, wf in enumerate(workflows):
+                if wf["workflow_id"] == workflow["workflow_id"]:
+                    workflows[idx] = workflow
+                    break
+            else:
+                workflows.append(workflow)
+            self.save_project(project_id, project)
+            return True
+
+    def delete_workflow(self, project_id, workflow_id):
+        with self.lock(project_id):
+            project = self._copy_for_update(project_id)
+            if project is None:
+                return False
+            workflows = project.get("workflows", [])
+            remaining = [wf for wf in workflows if wf["workflow_id"] != workflow_id]
+            if len(remaining) == len(workflows):
+                return False
+            project["workflows"] = remaining
+            self.save_project(project_id, project)
+            return True
+
+    # ---------- Evaluations ----------
+
+    def list_evaluations(self, project_id):
+        project = self.read_project(project_id)
+        return copy.deepcopy(project.get("evaluations", [])) if project else []
+
+    def load_evaluation(self, project_id, evaluation_id):
+        project = self.read_project(project_id)
+        if project is None:
+            return None
+        evaluation = next((e for e in project.get("evaluations", []) if e["evaluation_id"] == evaluation_id), None)
+        return copy.deepcopy(evaluation)
+
+    def save_evaluation(self, project_id, evaluation):
+        """Replaces the evaluation with the same evaluation_id, or appends it if it is new."""
+        with self.lock(project_id):
+            project = self._copy_for_update(project_id)
+            if project is None:
+                return False
+            evaluations = project.setdefault("evaluations", [])
+            for idx, ev in enumerate(evaluations):
+                if ev["evaluation_id"] == evaluation["evaluation_id"]:
+                    evaluations[idx] = evaluation
+                    break
+            else:
+                evaluations.append(evaluation)
+            self.save_project(project_id, project)
+            return True
+
+    def delete_evaluation(self, project_id, evaluation_id):
+        with self.lock(project_id):
+            project = self._copy_for_update(project_id)
+            if project is None:
+                return False
+            evaluations = project.get("evaluations", [])
+            remaining = [e for e in evaluations if e["evaluation_id"] != evaluation_id]
+            if len(remaining) == len(evaluations):
+                return False
+            project["evaluations"] = remaining
+            self.save_project(project_id, project)
+            self.delete_results(project_id, evaluation_id)
+            return True
+
+    # ---------- Evaluation runs ----------
+
+    def append_run(self, project_id, evaluation_id, workflow_id, run_result):
+        raise NotImplementedError
+
+    def update_run(self, project_id, evaluation_id, workflow_id, variable_set_id, run_index, fields):
+        raise NotImplementedError
+
+    def load_results(self, project_id, evaluation):
+        raise NotImplementedError
+
+    def query_runs(self, project_id, evaluation, workflow_id=None, variable_set_id=None,
+                   run_start=None, run_end=None, after=None, limit=RESULTS_PAGE_SIZE):
+        """
+        Returns one page of an evaluation's runs (see page_run_keys()) as
+        {"runs": [run with its "workflow_id", ...], "total": int, "has_more": bool}.
+
+        This fallback loads every run; backends override it to load only the page.
+        """
+        runs = {
+            (wf_id, run.get("variable_set_id"), run.get("run_index")): run
+            for wf_id, wf_runs in self.load_results(project_id, evaluation).items()
+            for run in wf_runs
+        }
+        page, total, has_more = page_run_keys(
+            runs, variable_set_positions(evaluation), workflow_id, variable_set_id, run_start, run_end, after, limit
+        )
+        return {
+            "runs": [{**runs[key], "workflow_id": key[0]} for key in page],
+            "total": total,
+            "has_more": has_more
+        }
+
+    def iter_runs(self, project_id, evaluation):
+        """
+        Yields (workflow_id, run) for every run of an evaluation, for exports.
+        This fallback loads every run; backends override it to read runs one at a time.
+        """
+        for wf_id, runs in self.load_results(project_id, evaluation).items():
+            for run in runs:
+                yield wf_id, run
+
+    def migrate_embedded_results(self, project_id, evaluation):
+        raise NotImplementedError
+
+    def delete_results(self, project_id, evaluation_id=None):
+        raise NotImplementedError
+
+
+class JsonFileStorage(StorageBackend):
+    """
+    One JSON document per project in PROJECTS_DIR. Evaluation runs are kept in
+    per-evaluation append-only logs (see modules/results_store.py).
+
+    A summary of every project is kept in PROJECT_INDEX_FILE and updated on each
+    save, so listing projects never has to parse the project files themselves.
+    """
+
+    def __init__(self, projects_dir=PROJECTS_DIR, cache_size=PROJECT_CACHE_SIZE):
+        super().__init__(os.path.join(projects_dir, ".locks"), cache_size)
+        self.projects_dir = projects_dir
+
+    def _project_path(self, project_id):
+        return os.path.join(self.projects_dir, f"{project_id}.json")
+
+    def ensure_ready(self):
+        if not os.path.exists(self.projects_dir):
+            os.makedirs(self.projects_dir)
+
+    def project_exists(self, project_id):
+        return os.path.exists(self._project_path(project_id))
+
+    def list_project_ids(self):
+        if not os.path.isdir(self.projects_dir):
+            return []
+        # Files starting with an underscore (such as the index) are not projects
+        return [
+            file[:-len(".json")] for file in sorted(os.listdir(self.projects_dir))
+            if file.endswith(".json") and not file.startswith("_")
+        ]
+
+    # ---------- Project index ----------
+
+    def _index_path(self):
+        return os.path.join(self.projects_dir, PROJECT_INDEX_FILE)
+
+    def _read_index(self):
+        try:
+            with open(self._index_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_index(self, index):
+        atomic_write_json(self._index_path(), index)
+
+    def _update_index(self, project_id, data=None):
+        """Replaces the project's index entry, or removes it when data is None."""
+        with self.locks.hold("_index"):
+            index = self._read_index()
+            if index is None:
+                return  # Rebuilt from the project files on the next listing
+            if data is None:
+                index.pop(project_id, None)
+            else:
+                index[project_id] = project_summary(project_id, data, os.path.getmtime(self._project_path(project_id)))
+            self._write_index(index)
+
+    def list_project_summaries(self):
+        index = self._read_index() or {}
+        project_ids = set(self.list_project_ids())
+        if set(index) != project_ids:
+            # Missing or out-of-date index (e.g. files copied in by hand): fix only the differences.
+            # The missing projects are read before taking the index lock, since save_project()
+            # takes the index lock while holding a project's lock.
+            summaries = {}
+            for project_id in project_ids - set(index):
+                project = self.read_project(project_id)
+                try:
+                    mtime = os.path.getmtime(self._project_path(project_id))
+                except FileNotFoundError:
+                    continue
+                if project is not None:
+                    summaries[project_id] = project_summary(project_id, project, mtime)
+            with self.locks.hold("_index"):
+                index = self._read_index() or {}
+                for project_id in set(index) - project_ids:
+                    del index[project_id]
+                for project_id, summary in summaries.items():
+                    # Entries written meanwhile by save_project() are newer
+                    if os.path.exists(self._project_path(project_id)):
+                        index.setdefault(project_id, summary)
+                self._write_index(index)
+        return sort_project_summaries(index.values())
+
+    def _cache_token(self, project_id):
+        # mtime alone can miss two writes within the filesystem's timestamp granularity,
+        # so writes from this process also bump a local counter
+        try:
+            stat = os.stat(self._project_path(project_id))
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, self._local_version(project_id))
+
+    def _load_project_uncached(self, project_id):
+        """
+        Loads the entire project, including nested workflows and common variable names, from a JSON file.
+        """
+        file_path = self._project_path(project_id)
+        if not os.path.exists(file_path):
+            return None
+        with self.lock(project_id, exclusive=False):
+            with open(file_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+    def save_project(self, project_id, data):
+        """
+        Saves the project data to a JSON file with proper encoding.
+        The file is replaced atomically and its version number incremented.
+        """
+        path = self._project_path(project_id)
+        with self.lock(project_id):
+            data["version"] = (self.current_version(project_id) or 0) + 1
+            atomic_write_json(path, data, indent=4)
+            self._bump_version(project_id)
+            self._update_index(project_id, data)
+
+    def delete_project(self, project_id):
+        path = self._project_path(project_id)
+        with self.lock(project_id):
+            if not os.path.exists(path):
+                return False
+            os.remove(path)
+            self._bump_version(project_id)
+            self._update_index(project_id, None)
+        self.delete_results(project_id)
+        return True
+
+    def save_evaluation(self, project_id, evaluation):
+        from . import results_store
+        if "results" not in evaluation and "results_log" not in evaluation:
+            evaluation["results_log"] = results_store.results_log_reference(project_id, evaluation["evaluation_id"])
+        return super().save_evaluation(project_id, evaluation)
+
+    def append_run(self, project_id, evaluation_id, workflow_id, run_result):
+        from . import results_store
+        results_store.append_run(project_id, evaluation_id, workflow_id, run_result)
+
+    def update_run(self, project_id, evaluation_id, workflow_id, variable_set_id, run_index, fields):
+        from . import results_store
+        return results_store.update_run(project_id, evaluation_id, workflow_id, variable_set_id, run_index, fields)
+
+    def load_results(self, project_id, evaluation):
+        from . import results_store
+        return results_store.load_results(project_id, evaluation)
+
+    def query_runs(self, project_id, evaluation, workflow_id=None, variable_set_id=None,
+                   run_start=None, run_end=None, after=None, limit=RESULTS_PAGE_SIZE):
+        if "results" in evaluation:
+            return super().query_runs(project_id, evaluation, workflow_id, variable_set_id,
+                                      run_start, run_end, after, limit)
+        from . import results_store
+        return results_store.query_runs(project_id, evaluation, workflow_id, variable_set_id,
+                                        run_start, run_end, after, limit)
+
+    def iter_runs(self, project_id, evaluation):
+        if "results" in evaluation:
+            return super().iter_runs(project_id, evaluation)
+        from . import results_store
+        return results_store.iter_runs(project_id, evaluation)
+
+    def migrate_embedded_results(self, project_id, evaluation):
+        from . import results_store
+        return results_store.migrate_embedded_results(project_id, evaluation)
+
+    def delete_results(self, project_id, evaluation_id=None):
+        from . import results_store
+        results_store.delete_results(project_id, evaluation_id)
+
+
+_STORAGE = None
+_STORAGE_LOCK = threading.Lock()
+
+
+def create_storage(backend=None):
+    """Creates a storage backend by name ("json" or "sqlite")."""
+    backend = (backend or STORAGE_BACKEND).lower()
+    if backend == "json":
+        return JsonFileStorage()
+    if backend == "sqlite":
+        from .sqlite_storage import SqliteStorage
+        return SqliteStorage(SQLITE_DB_PATH)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def get_storage():
+    """Returns the process-wide storage backend selected by STORAGE_BACKEND."""
+    global _STORAGE
+    with _STORAGE_LOCK:
+        if _STORAGE is None:
+            _STORAGE = create_storage()
+        return _STORAGE
+
+
+# ---------- Module-level helpers used by the app ----------
+
 def ensure_storage_dir():
     if not os.path.exists(PROJECTS_DIR):
         os.makedirs(PROJECTS_DIR)
+    get_storage().ensure_ready()
 
 def save_project(project_id, data):
     """
-    Saves the project data to a JSON file with proper encoding.
+    Saves the whole project through the configured backend.
+    """
+    get_storage().save_project(project_id, data)
+
+def load_project(project_id):
+    """
+    Loads the entire project, including nested workflows, evaluations and common variable names.
     """
-    path = os.path.join(PROJECTS_DIR, f"{project_id}.json")  # Changed from STORAGE_DIR to PROJECTS_DIR
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    return get_storage().load_project(project_id)
 
+def delete_project(project_id):
+    return get_storage().delete_project(project_id)
 
+def project_exists(project_id):
+    return get_storage().project_exists(project_id)
 
-def load_project(project_id):
+def list_project_ids():
+    return get_storage().list_project_ids()
+
+def list_project_summaries():
+    """
+    Returns id, name, description, workflow/evaluation counts and last-modified time
+    of every project, without loading the projects themselves.
+    """
+    return get_storage().list_project_summaries()
+
+def load_project_meta(project_id):
+    return get_storage().load_project_meta(project_id)
+
+def save_project_meta(project_id, meta):
+    return get_storage().save_project_meta(project_id, meta)
+
+def list_workflows(project_id):
+    return get_storage().list_workflows(project_id)
+
+def load_workflow(project_id, workflow_id):
+    return get_storage().load_workflow(project_id, workflow_id)
+
+def save_workflow(project_id, workflow):
+    return get_storage().save_workflow(project_id, workflow)
+
+def delete_workflow(project_id, workflow_id):
+    return get_storage().delete_workflow(project_id, workflow_id)
+
+def list_evaluations(project_id):
+    return get_storage().list_evaluations(project_id)
+
+def load_evaluation(project_id, evaluation_id):
+    return get_storage().load_evaluation(project_id, evaluation_id)
+
+def save_evaluation(project_id, evaluation):
+    return get_storage().save_evaluation(project_id, evaluation)
+
+def delete_evaluation(project_id, evaluation_id):
+    return get_storage().delete_evaluation(project_id, evaluation_id)
+
+def append_run(project_id, evaluation_id, workflow_id, run_result):
+    get_storage().append_run(project_id, evaluation_id, workflow_id, run_result)
+
+def update_run(project_id, evaluation_id, workflow_id, variable_set_id, run_index, fields):
+    return get_storage().update_run(project_id, evaluation_id, workflow_id, variable_set_id, run_index, fields)
+
+def load_results(project_id, evaluation):
+    return get_storage().load_results(project_id, evaluation)
+
+def query_runs(project_id, evaluation, workflow_id=None, variable_set_id=None,
+               run_start=None, run_end=None, after=None, limit=RESULTS_PAGE_SIZE):
+    return get_storage().query_runs(project_id, evaluation, workflow_id, variable_set_id,
+                                    run_start, run_end, after, limit)
+
+def iter_runs(project_id, evaluation):
+    return get_storage().iter_runs(project_id, evaluation)
+
+def migrate_embedded_results(project_id, evaluation):
+    return get_storage().migrate_embedded_results(project_id, evaluation)
+
+def get_project_version(project_id):
+    return get_storage().current_version(project_id)
+
+def project_transaction(project_id, expected_version=None):
     """
-    Loads the entire project, including nested workflows and common variable names, from a JSON file.
+    Context manager that holds the project's write lock (across threads and processes)
+    and, if expected_version is given, raises VersionConflict when the project has changed.
     """
-    file_path = os.path.join(PROJECTS_DIR, f"{project_id}.json")
-    if not os.path.exists(file_path):
-        return None
-    with open(file_path, "r") as f:
-        return json.load(f)
+    return get_storage().transaction(project_id, expected_version)
+
+def project_cache_stats():
+    """Hit/miss counters of the in-process project cache."""
+    return get_storage().cache.stats()
+
+def delete_results(project_id, evaluation_id=None):
+    get_storage().delete_results(project_id, evaluation_id)
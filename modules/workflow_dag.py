@@ -0,0 +1,134 @@
+# modules/workflow_dag.py
+
+import asyncio
+
+from .prompt_templates import template_variables
+
+
+class DagNode:
+    """
+    One call or function of a workflow together with the nodes it has to wait for.
+
+    `dependencies` holds the indices (into the node list) of every node that
+    produces a variable this node reads and runs before it, in step order.
+    """
+
+    def __init__(self, index, kind, step_index, obj, inputs, output_variable):
+        self.index = index
+        self.kind = kind  # "call" or "function"
+        self.step_index = step_index
+        self.obj = obj
+        self.inputs = inputs
+        self.output_variable = output_variable
+        self.dependencies = []
+
+
+def node_inputs(kind, obj):
+    """Lists the context variables a StepCall or FunctionCall reads."""
+    if kind == "function":
+        return {name for name in (obj.input_variables or {}).values() if name}
+
+    names = set(template_variables(obj.system_prompt))
+    for msg in obj.conversation:
+        names |= template_variables(msg.get("content", ""))
+    # Call-specific variables shadow anything produced by the workflow
+    return names - set(obj.variables or {})
+
+
+def _add_node(nodes, producers, kind, step_index, obj, output_variable):
+    node = DagNode(len(nodes), kind, step_index, obj, node_inputs(kind, obj), output_variable)
+    node.dependencies = sorted({i for name in node.inputs for i in producers.get(name, [])})
+    nodes.append(node)
+    return node
+
+
+def _register_outputs(producers, step_nodes):
+    for node in step_nodes:
+        if node.output_variable:
+            producers.setdefault(node.output_variable, []).append(node.index)
+
+
+def build_workflow_dag(steps, include_functions=True):
+    """
+    Builds the dependency graph of a workflow's steps.
+
+    A call only sees variables produced by earlier steps, exactly as when the
+    steps run one after another, so it depends on every earlier-step producer
+    of each variable it references. Functions run after the calls of their own
+    step, so they also see (and wait for) that step's call outputs. Nodes that
+    reference nothing produced by the workflow are ready immediately.
+
+    Args:
+        steps (list): WorkflowStep objects, in workflow order.
+        include_functions (bool): Also add a node for each FunctionCall.
+
+    Returns:
+        list: DagNode objects in step order (a valid topological order).
+    """
+    nodes = []
+    producers = {}  # variable name -> indices of the nodes that set it
+
+    for step_index, step in enumerate(steps):
+        call_nodes = [
+            _add_node(nodes, producers, "call", step_index, call, call.variable_name)
+            for call in step.calls
+        ]
+
+        function_nodes = []
+        if include_functions:
+            visible = {name: list(indices) for name, indices in producers.items()}
+            _register_outputs(visible, call_nodes)
+            function_nodes = [
+                _add_node(nodes, visible, "function", step_index, fn, fn.output_variable)
+                for fn in step.functions
+            ]
+
+        # Outputs only become visible to later steps
+        _register_outputs(producers, call_nodes + function_nodes)
+
+    return nodes
+
+
+def node_output(result):
+    """Returns (True, value) when a node result carries a usable output, else (False, None)."""
+    if isinstance(result, dict) and "error" not in result and "response" in result:
+        return True, result["response"]
+    return False, None
+
+
+async def run_workflow_dag(nodes, base_variables, run_node, on_node_done=None):
+    """
+    Runs every node as soon as the nodes it depends on have finished.
+
+    Args:
+        nodes (list): DagNode objects from build_workflow_dag().
+        base_variables (dict): Workflow and run variables available to all nodes.
+        run_node (coroutine function): await run_node(node, variables) -> result dict.
+            A result with a "response" and no "error" sets the node's output variable.
+        on_node_done (callable): Optional on_node_done(node, result), called on the event loop.
+
+    Returns:
+        list: The result of each node, in the order of `nodes`.
+    """
+    tasks = []
+
+    async def run(node):
+        if node.dependencies:
+            await asyncio.gather(*(tasks[i] for i in node.dependencies))
+
+        variables = dict(base_variables)
+        for i in node.dependencies:
+            dependency = nodes[i]
+            ok, value = node_output(tasks[i].result())
+            if ok and dependency.output_variable:
+                variables[dependency.output_variable] = value
+
+        result = await run_node(node, variables)
+        if on_node_done is not None:
+            on_node_done(node, result)
+        return result
+
+    # Dependencies always point to earlier nodes, so their tasks exist by the time they are awaited
+    for node in nodes:
+        tasks.append(asyncio.ensure_future(run(node)))
+    return await asyncio.gather(*tasks)
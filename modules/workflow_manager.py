@@ -5,7 +5,8 @@ import uuid
 class StepCall:
     def __init__(self, call_id=None, title="Untitled Call", system_prompt="", conversation=None,
                  variable_name="", variables=None, model_name="gpt-4", temperature=1.0,
-                 max_tokens=1024, top_p=1.0, output_type="text", pydantic_definition=None, max_retries=0):
+                 max_tokens=1024, top_p=1.0, output_type="text", pydantic_definition=None, max_retries=0,
+                 use_cache=True):
         self.call_id = call_id or str(uuid.uuid4())
         self.title = title
         self.system_prompt = system_prompt
@@ -19,6 +20,7 @@ class StepCall:
         self.output_type = output_type
         self.pydantic_definition = pydantic_definition
         self.max_retries = max_retries
+        self.use_cache = use_cache  # Deterministic calls may be answered from the response cache
 
     @classmethod
     def from_dict(cls, data):
@@ -35,7 +37,8 @@ class StepCall:
             top_p=data.get("top_p", 1.0),
             output_type=data.get("output_type", "text"),
             pydantic_definition=data.get("pydantic_definition", None),
-            max_retries=data.get("max_retries", 0)
+            max_retries=data.get("max_retries", 0),
+            use_cache=data.get("use_cache", True)
         )
 
     def to_dict(self):
@@ -52,7 +55,8 @@ class StepCall:
             "top_p": self.top_p,
             "output_type": self.output_type,
             "pydantic_definition": self.pydantic_definition,
-            "max_retries": self.max_retries
+            "max_retries": self.max_retries,
+            "use_cache": self.use_cache
         }
 
 class FunctionCall:
@@ -42,13 +42,32 @@ function generateUUID() {
     });
 }
 
+/*
+    Remembers the project version returned by a mutating request, so the next
+    request can ask the server to reject it if someone else changed the project.
+*/
+function rememberProjectVersion(response) {
+    const version = response.headers.get("X-Project-Version");
+    if (version !== null) {
+        window.projectVersion = parseInt(version, 10);
+    }
+}
+
 async function postData(url, data) {
     try {
+        const headers = { "Content-Type": "application/json" };
+        if (typeof window.projectVersion === "number") {
+            headers["If-Match"] = String(window.projectVersion);
+        }
         const response = await fetch(url, {
             method: "POST",
-            headers: { "Content-Type": "application/json" },
+            headers: headers,
             body: JSON.stringify(data)
         });
+        if (response.status === 409) {
+            showAlert("warning", "This project was changed in another window or by another user. Reload the page to see the latest version.");
+        }
+        rememberProjectVersion(response);
         return await response.json();
     } catch (error) {
         console.error(`Error posting data to ${url}:`, error);
@@ -67,6 +86,31 @@ async function fetchData(url) {
     }
 }
 
+/*
+    Polls a background job until it completes or fails.
+    onProgress receives the job status object after every poll.
+*/
+async function waitForJob(jobId, onProgress, intervalMs = 1000) {
+    while (true) {
+        const job = await fetchData(`/jobs/${jobId}`);
+        if (!job || job.error && !job.status) {
+            return null;
+        }
+        if (onProgress) onProgress(job);
+        if (job.status === "completed" || job.status === "failed") {
+            return job;
+        }
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+}
+
+function formatJobProgress(job) {
+    let text = `${job.completed || 0}/${job.total || "?"}`;
+    if (job.throughput) text += ` &middot; ${job.throughput.toFixed(2)}/s`;
+    if (job.eta_seconds !== null && job.eta_seconds !== undefined) text += ` &middot; ETA ${Math.round(job.eta_seconds)}s`;
+    return text;
+}
+
 let functionCodeEditor = null;
 
 /* ============================
@@ -380,6 +424,7 @@ async function handleEntity(options) {
             const temperature = parseFloat(document.getElementById("llmTemperature").value);
             const maxTokens = parseInt(document.getElementById("llmMaxTokens").value);
             const topP = parseFloat(document.getElementById("llmTopP").value);
+            const useCache = document.getElementById("llmUseCache").checked;
 
             // NEW: Pydantic & Retries
             let pydanticDefinition = "";
@@ -426,7 +471,8 @@ async function handleEntity(options) {
                     conversation: conversation,
                     // NEW fields
                     pydantic_definition: pydanticDefinition || null,
-                    max_retries: maxRetries || 0
+                    max_retries: maxRetries || 0,
+                    use_cache: useCache
                 };
                 stepObj.calls.push(newCall);
             } else if (type === 'edit_llm_call') {
@@ -448,6 +494,7 @@ async function handleEntity(options) {
                 // NEW fields
                 existingCall.pydantic_definition = pydanticDefinition || null;
                 existingCall.max_retries = maxRetries || 0;
+                existingCall.use_cache = useCache;
             }
 
             const postDataPayload = {
@@ -543,6 +590,7 @@ function openCallSidePanel(stepId, callId = null) {
         document.getElementById("llmOutputFormat").value = "text";
         document.getElementById("llmMaxRetries").value = "0";
         document.getElementById("llmPydanticDefinition").value = "";
+        document.getElementById("llmUseCache").checked = true;
         toggleJsonFields();
     }
 }
@@ -591,9 +639,10 @@ async function loadExistingCallData(stepId, callId) {
     document.getElementById("llmVariables").value = JSON.stringify(variablesJSON, null, 2);
 
     document.getElementById("llmModelName").value = callData.model_name || "gpt-4";
-    document.getElementById("llmTemperature").value = callData.temperature || 1.0;
+    document.getElementById("llmTemperature").value = callData.temperature ?? 1.0;
     document.getElementById("llmMaxTokens").value = callData.max_tokens || 1024;
-    document.getElementById("llmTopP").value = callData.top_p || 1.0;
+    document.getElementById("llmTopP").value = callData.top_p ?? 1.0;
+    document.getElementById("llmUseCache").checked = callData.use_cache !== false;
     document.getElementById("llmOutputFormat").value = callData.output_type || "text";
 
     // NEW: Populate pydantic_definition & max_retries if any
@@ -761,7 +810,10 @@ document.addEventListener("DOMContentLoaded", function() {
 });
 
 async function runWorkflow() {
-    const runButton = document.querySelector('button[onclick="runWorkflow()"]');
+    // The button may have more than one click listener; run only once
+    if (isWorkflowRunning) return;
+    isWorkflowRunning = true;
+    const runButton = document.getElementById("runWorkflowBtn");
     if (runButton) runButton.disabled = true;
 
     const outputDiv = document.getElementById("workflowRunOutput");
@@ -769,13 +821,163 @@ async function runWorkflow() {
     outputDiv.innerHTML = `
         <div class="d-flex align-items-center">
             <strong>Running workflow...</strong>
+            <span id="workflowRunProgress" class="ms-3 text-muted"></span>
             <div class="spinner-border ms-auto" role="status" aria-hidden="true"></div>
         </div>
+        <div id="workflowRunLive" class="mt-3"></div>
     `;
 
-    const data = await postData(`/projects/${projectId}/workflow/${workflowId}/run`, { workflow_id: workflowId });
+    let data;
+    try {
+        data = await streamWorkflowRun(document.getElementById("workflowRunLive"));
+    } catch (error) {
+        console.warn("Streaming the workflow run failed, running it as a background job instead:", error);
+        data = await runWorkflowAsJob();
+    }
+    isWorkflowRunning = false;
     if (runButton) runButton.disabled = false;
 
+    renderWorkflowResults(outputDiv, data);
+}
+
+async function runWorkflowAsJob() {
+    let data = await postData(`/projects/${projectId}/workflow/${workflowId}/run`, { workflow_id: workflowId });
+    if (data && data.job_id) {
+        const job = await waitForJob(data.job_id, (progressJob) => {
+            const progressEl = document.getElementById("workflowRunProgress");
+            if (progressEl) progressEl.innerHTML = formatJobProgress(progressJob);
+        });
+        data = job && job.status === "completed" && job.result
+            ? { status: "success", outputs: job.result.outputs }
+            : { error: (job && job.error) || "Failed to execute workflow." };
+    }
+    return data;
+}
+
+/*
+    Runs the workflow through the streaming endpoint, rendering steps, calls and
+    LLM tokens into liveDiv as they arrive. Resolves to the same shape as
+    runWorkflowAsJob(); throws only if the stream cannot be opened.
+*/
+async function streamWorkflowRun(liveDiv) {
+    const response = await fetch(`/projects/${projectId}/workflow/${workflowId}/run_stream`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ workflow_id: workflowId })
+    });
+    if (!response.ok || !response.body) {
+        throw new Error(`HTTP ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let result = { error: "The workflow run stream ended unexpectedly." };
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+            const message = parseServerSentEvent(buffer.slice(0, boundary));
+            buffer = buffer.slice(boundary + 2);
+            if (!message) continue;
+            if (message.event === "run_done") {
+                result = { status: "success", outputs: message.data.outputs };
+            } else if (message.event === "error") {
+                result = { error: message.data.error };
+            } else {
+                renderWorkflowStreamEvent(liveDiv, message.event, message.data);
+            }
+        }
+    }
+    return result;
+}
+
+function parseServerSentEvent(block) {
+    let event = "message";
+    const dataLines = [];
+    block.split("\n").forEach(line => {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) dataLines.push(line.slice(5).trimStart());
+    });
+    // Comment-only blocks are keep-alives
+    if (dataLines.length === 0) return null;
+    return { event: event, data: JSON.parse(dataLines.join("\n")) };
+}
+
+function setLiveStatus(statusEl, text, badgeClass) {
+    if (!statusEl) return;
+    statusEl.textContent = text;
+    statusEl.className = `badge ${badgeClass} ms-auto live-status`;
+}
+
+function renderWorkflowStreamEvent(liveDiv, event, data) {
+    if (event === "run_start") {
+        liveDiv.innerHTML = data.steps.map((step, stepIndex) => `
+            <div class="card mb-2" id="liveStep-${stepIndex}">
+                <div class="card-header d-flex align-items-center">
+                    <span>${escapeHTML(step.step_title)}</span>
+                    <span class="badge bg-secondary ms-auto live-status">waiting</span>
+                </div>
+                <div class="card-body">
+                    ${step.calls.concat(step.functions).map(node => `
+                        <div class="mb-2" id="liveCall-${node.call_id}">
+                            <div class="d-flex align-items-center">
+                                <strong>${escapeHTML(node.title)}</strong>
+                                ${node.model_name ? `<span class="text-muted ms-2">(${escapeHTML(node.model_name)})</span>` : ""}
+                                <span class="badge bg-secondary ms-auto live-status">waiting</span>
+                            </div>
+                            <pre class="bg-light p-2 border rounded mb-0 live-output" style="white-space: pre-wrap; max-height: 300px; overflow-y: auto;"></pre>
+                        </div>
+                    `).join("")}
+                </div>
+            </div>
+        `).join("");
+        return;
+    }
+
+    if (event === "step_start" || event === "step_done") {
+        const statusEl = liveDiv.querySelector(`#liveStep-${data.step_index} .card-header .live-status`);
+        if (event === "step_start") setLiveStatus(statusEl, "running", "bg-primary");
+        else setLiveStatus(statusEl, "done", "bg-success");
+        return;
+    }
+
+    const callEl = document.getElementById(`liveCall-${data.call_id}`);
+    if (!callEl) return;
+    const statusEl = callEl.querySelector(".live-status");
+    const outputEl = callEl.querySelector(".live-output");
+
+    if (event === "call_start") {
+        setLiveStatus(statusEl, "running", "bg-primary");
+    } else if (event === "token") {
+        if (outputEl.dataset.attempt !== String(data.attempt)) {
+            // A retried call streams its new response from the start
+            outputEl.textContent = "";
+            outputEl.dataset.attempt = data.attempt;
+            if (data.attempt > 1) setLiveStatus(statusEl, `retry ${data.attempt}`, "bg-warning text-dark");
+        }
+        outputEl.appendChild(document.createTextNode(data.text));
+        outputEl.scrollTop = outputEl.scrollHeight;
+    } else if (event === "call_done") {
+        const result = data.result;
+        if (result.error) {
+            setLiveStatus(statusEl, "error", "bg-danger");
+            outputEl.textContent = result.error;
+        } else {
+            setLiveStatus(statusEl, "done", "bg-success");
+            // Cached responses and functions arrive without tokens
+            if (!outputEl.textContent) {
+                outputEl.textContent = typeof result.response === "object"
+                    ? JSON.stringify(result.response, null, 2)
+                    : String(result.response ?? "");
+            }
+        }
+    }
+}
+
+function renderWorkflowResults(outputDiv, data) {
     if (data && data.status === "success") {
         // Clear the output div before appending new results
         outputDiv.innerHTML = ""; 
@@ -927,7 +1129,7 @@ async function runWorkflow() {
         showAlert("success", "Workflow executed successfully.");
     } else {
         outputDiv.innerHTML = "";
-        showAlert("danger", data.error || "Failed to execute workflow.");
+        showAlert("danger", (data && data.error) || "Failed to execute workflow.");
     }
 }
 
@@ -955,7 +1157,8 @@ async function loadEvaluations() {
                     <div class="d-flex justify-content-between align-items-center">
                         <div>
                             <strong>${escapeHTML(ev.name)}</strong><br/>
-                            <small>${escapeHTML(ev.description)}</small>
+                            <small>${escapeHTML(ev.description)}</small><br/>
+                            <small class="text-muted" id="evaluationProgress-${ev.evaluation_id}"></small>
                         </div>
                         <div>
                             <button class='btn btn-sm btn-primary me-1' onclick='runEvaluation("${ev.evaluation_id}")'>Run</button>
@@ -1157,6 +1360,7 @@ async function createEvaluation() {
             },
             body: JSON.stringify(payload)
         });
+        rememberProjectVersion(response);
 
         const data = await response.json();
 
@@ -1250,6 +1454,7 @@ async function createEvaluation() {
             },
             body: JSON.stringify(payload)
         });
+        rememberProjectVersion(response);
 
         const data = await response.json();
 
@@ -1292,13 +1497,21 @@ async function deleteEvaluation(evaluationId) {
 ----------------------------- */
 async function runEvaluation(evaluationId) {
     if (!confirm("Running an evaluation may take some time. Continue?")) return;
-    showAlert('info', 'Running evaluation, please wait...');
     const data = await postData(`/projects/${projectId}/evaluations/${evaluationId}/run`, {});
-    if (data && data.status === "evaluation_run_complete") {
+    if (!data || !data.job_id) {
+        showAlert('danger', (data && data.error) || 'Failed to run evaluation.');
+        return;
+    }
+    showAlert('info', 'Evaluation queued. Progress is shown on the evaluation.');
+    const job = await waitForJob(data.job_id, (progressJob) => {
+        const progressEl = document.getElementById(`evaluationProgress-${evaluationId}`);
+        if (progressEl) progressEl.innerHTML = formatJobProgress(progressJob);
+    }, 2000);
+    if (job && job.status === "completed") {
         showAlert('success', 'Evaluation run completed.');
         loadEvaluations();
     } else {
-        showAlert('danger', data.error || 'Failed to run evaluation.');
+        showAlert('danger', (job && job.error) || 'Failed to run evaluation.');
     }
 }
 